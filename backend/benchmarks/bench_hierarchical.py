@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Benchmark two-stage (document centroid) search against exact search.
+
+Builds a synthetic corpus of documents whose chunks are scattered around a few
+topics each, searches it exactly and with mode='hierarchical' for several numbers
+of top documents, and reports recall@k relative to the exact results together
+with the median query latency.
+
+Usage:
+    python benchmarks/bench_hierarchical.py [--documents 2000] [--chunks 50] [--queries 100]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The knowledge base module creates an OpenAI client on import; no calls are made here
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+from services.knowledge_base import SimpleVectorStore, SEARCH_MODE_HIERARCHICAL
+
+DIM = 128
+
+
+def document_corpus(num_documents, chunks_per_document, rng):
+    """
+    Chunks of documents that each cover a few topics, in chunk order. Topics are
+    drawn from a pool shared by all documents, so a query's nearest chunks are
+    usually spread over several documents.
+    """
+    topics_per_document = 3
+    pool = rng.standard_normal((max(1, num_documents // 4), DIM)).astype(np.float32)
+    topics = pool[rng.integers(0, len(pool), (num_documents, topics_per_document))]
+    # Consecutive chunks of a document stay on the same topic
+    chunk_topics = np.arange(chunks_per_document) * topics_per_document // chunks_per_document
+    vectors = topics[:, chunk_topics] + 0.5 * rng.standard_normal(
+        (num_documents, chunks_per_document, DIM)).astype(np.float32)
+    vectors = vectors.reshape(-1, DIM)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build_store(corpus, chunks_per_document):
+    store = SimpleVectorStore()
+    documents = [{'id': f'doc{i // chunks_per_document}-{i % chunks_per_document}', 'content': ''}
+                 for i in range(len(corpus))]
+    store.add_batch(documents, corpus)
+    return store
+
+
+def run_queries(store, queries, top_k, **kwargs):
+    """Return the result IDs and median latency (ms) of searching every query."""
+    timings = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        hits = store.search(query, top_k=top_k, **kwargs)
+        timings.append((time.perf_counter() - start) * 1000)
+        results.append([hit['id'] for hit in hits])
+    return results, float(np.median(timings))
+
+
+def recall(results, truth):
+    return float(np.mean([len(set(r) & set(t)) / len(t) for r, t in zip(results, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=2000)
+    parser.add_argument('--chunks', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--top-documents', type=int, nargs='+', default=[1, 5, 10, 20, 40])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    corpus = document_corpus(args.documents, args.chunks, rng)
+    # Queries are perturbed corpus vectors so they have genuine near neighbours
+    queries = corpus[rng.choice(len(corpus), args.queries, replace=False)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    start = time.perf_counter()
+    store = build_store(corpus, args.chunks)
+    build_time = time.perf_counter() - start
+    truth, exact_latency = run_queries(store, queries, args.top_k)
+
+    print(f"corpus: {args.documents} documents x {args.chunks} chunks, top_k={args.top_k}, "
+          f"{store.snapshot().centroids.num_sections} centroids, built in {build_time:.1f}s")
+    print(f"{'search':>20} {'recall@k':>9} {'latency (ms)':>13}")
+    print(f"{'exact':>20} {1.0:>9.3f} {exact_latency:>13.2f}")
+    for top_documents in args.top_documents:
+        results, latency = run_queries(store, queries, args.top_k, mode=SEARCH_MODE_HIERARCHICAL,
+                                       top_documents=top_documents)
+        print(f"{f'top_documents={top_documents}':>20} {recall(results, truth):>9.3f} {latency:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
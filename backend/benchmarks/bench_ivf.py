@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Benchmark recall@k and latency of the IVF index against exact search.
+
+Builds a clustered synthetic corpus, searches it with a flat (brute force) store
+and with an IVF store at several nprobe settings, and reports recall@k relative
+to the exact results together with the median query latency.
+
+Usage:
+    python benchmarks/bench_ivf.py [--size 200000] [--queries 100] [--top-k 10]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The knowledge base module creates an OpenAI client on import; no calls are made here
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+from services.knowledge_base import SimpleVectorStore, INDEX_TYPE_FLAT, INDEX_TYPE_IVF
+
+DIM = 128
+
+
+def clustered_corpus(size, num_topics, rng):
+    """Vectors scattered around random topic centres, like chunks of many documents."""
+    centres = rng.standard_normal((num_topics, DIM)).astype(np.float32)
+    topics = rng.integers(0, num_topics, size)
+    vectors = centres[topics] + 0.25 * rng.standard_normal((size, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build_store(corpus, index_type):
+    store = SimpleVectorStore(index_type=index_type)
+    documents = [{'id': f'bench-{i}', 'content': ''} for i in range(len(corpus))]
+    store.add_batch(documents, corpus)
+    return store
+
+
+def run_queries(store, queries, top_k, **kwargs):
+    """Return the result IDs and median latency (ms) of searching every query."""
+    timings = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        hits = store.search(query, top_k=top_k, **kwargs)
+        timings.append((time.perf_counter() - start) * 1000)
+        results.append([hit['id'] for hit in hits])
+    return results, float(np.median(timings))
+
+
+def recall(results, truth):
+    return float(np.mean([len(set(r) & set(t)) / len(t) for r, t in zip(results, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=200000)
+    parser.add_argument('--topics', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    corpus = clustered_corpus(args.size, args.topics, rng)
+    # Queries are perturbed corpus vectors so they have genuine near neighbours
+    queries = corpus[rng.choice(args.size, args.queries, replace=False)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    flat_store = build_store(corpus, INDEX_TYPE_FLAT)
+    truth, exact_latency = run_queries(flat_store, queries, args.top_k)
+
+    ivf_store = build_store(corpus, INDEX_TYPE_IVF)
+    start = time.perf_counter()
+    ivf_store.train_ivf()
+    training_time = time.perf_counter() - start
+
+    print(f"corpus: {args.size} chunks, top_k={args.top_k}, IVF training {training_time:.1f}s")
+    print(f"{'search':>14} {'recall@k':>9} {'latency (ms)':>13}")
+    print(f"{'exact':>14} {1.0:>9.3f} {exact_latency:>13.2f}")
+    for nprobe in args.nprobe:
+        results, latency = run_queries(ivf_store, queries, args.top_k, nprobe=nprobe)
+        print(f"{f'ivf nprobe={nprobe}':>14} {recall(results, truth):>9.3f} {latency:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
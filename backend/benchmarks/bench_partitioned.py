@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Benchmark partitioned (multi-threaded) brute-force search against the number of workers.
+
+Builds a large random corpus and, for each worker count, searches it through the
+normal `search` API with `search_workers` shards scored in parallel. Reports the
+median single-query latency and the throughput of several client threads
+searching at once (like concurrent Flask requests).
+
+Pin BLAS to one thread so the measurement is of the shard workers alone:
+    OPENBLAS_NUM_THREADS=1 python benchmarks/bench_partitioned.py [--size 1000000] [--workers 1 2 4 8]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The knowledge base module creates an OpenAI client on import; no calls are made here
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+from services.knowledge_base import SimpleVectorStore
+
+DIM = 128
+
+
+def median_latency(store, queries, top_k):
+    """Median latency (ms) of searching the queries one at a time."""
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        store.search(query, top_k=top_k)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def throughput(store, queries, top_k, clients):
+    """Queries per second when `clients` threads search the queries concurrently."""
+    def client(offset):
+        for query in queries[offset::clients]:
+            store.search(query, top_k=top_k)
+
+    threads = [threading.Thread(target=client, args=(offset,)) for offset in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(queries) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    corpus = rng.standard_normal((args.size, DIM)).astype(np.float32)
+    queries = rng.standard_normal((args.queries, DIM)).astype(np.float32)
+    documents = [{'id': f'bench-{i}', 'content': ''} for i in range(args.size)]
+
+    print(f"corpus: {args.size} chunks, dim={DIM}, top_k={args.top_k}, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'latency (ms)':>13} {'speedup':>8} {f'qps ({args.clients} clients)':>18}")
+    baseline = None
+    for workers in args.workers:
+        store = SimpleVectorStore(search_workers=workers)
+        store.add_batch(documents, corpus)
+        latency = median_latency(store, queries, args.top_k)
+        baseline = baseline or latency
+        qps = throughput(store, queries, args.top_k, args.clients)
+        print(f"{workers:>8} {latency:>13.2f} {baseline / latency:>7.2f}x {qps:>18.1f}")
+        del store
+
+
+if __name__ == "__main__":
+    main()
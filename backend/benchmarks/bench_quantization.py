@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Benchmark memory per chunk and recall of quantized vector storage.
+
+Compares a float32 store with int8 and float16 quantized stores (quantized first
+pass + exact re-rank of the best candidates) on a clustered synthetic corpus, and
+reports resident vector bytes per chunk, recall@k against exact search and the
+median query latency. The first row shows what the old list-of-floats storage
+cost per chunk.
+
+Usage:
+    python benchmarks/bench_quantization.py [--size 100000] [--queries 100] [--top-k 10]
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The knowledge base module creates an OpenAI client on import; no calls are made here
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+from services.knowledge_base import SimpleVectorStore
+
+DIM = 128
+
+
+def clustered_corpus(size, num_topics, rng):
+    """Vectors scattered around random topic centres, like chunks of many documents."""
+    centres = rng.standard_normal((num_topics, DIM)).astype(np.float32)
+    topics = rng.integers(0, num_topics, size)
+    vectors = centres[topics] + 0.25 * rng.standard_normal((size, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def list_bytes_per_chunk(corpus, sample=2000):
+    """Measure the memory of embeddings stored as Python lists of floats."""
+    tracemalloc.start()
+    lists = [row.astype(np.float64).tolist() for row in corpus[:sample]]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del lists
+    return current / sample
+
+
+def run_queries(store, queries, top_k):
+    """Return the result IDs and median latency (ms) of searching every query."""
+    timings = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        hits = store.search(query, top_k=top_k)
+        timings.append((time.perf_counter() - start) * 1000)
+        results.append([hit['id'] for hit in hits])
+    return results, float(np.median(timings))
+
+
+def recall(results, truth):
+    return float(np.mean([len(set(r) & set(t)) / len(t) for r, t in zip(results, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--topics', type=int, default=1000)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--top-k', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    corpus = clustered_corpus(args.size, args.topics, rng)
+    queries = corpus[rng.choice(args.size, args.queries, replace=False)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+    documents = [{'id': f'bench-{i}', 'content': ''} for i in range(args.size)]
+
+    print(f"corpus: {args.size} chunks, top_k={args.top_k}")
+    print(f"{'storage':>10} {'bytes/chunk':>12} {'recall@k':>9} {'latency (ms)':>13}")
+    print(f"{'list':>10} {list_bytes_per_chunk(corpus):>12.0f} {'-':>9} {'-':>13}")
+
+    truth = None
+    for quantization in (None, 'float16', 'int8'):
+        store = SimpleVectorStore(quantization=quantization)
+        store.add_batch(documents, corpus)
+        results, latency = run_queries(store, queries, args.top_k)
+        if truth is None:
+            truth = results
+        usage = store.memory_usage()
+        print(f"{quantization or 'float32':>10} {usage['bytes_per_chunk']:>12.0f} {recall(results, truth):>9.3f} {latency:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Benchmark the batch simple embedding path against embedding one chunk at a time.
+
+Builds synthetic chunks of a Zipf-distributed vocabulary (like the chunks of a
+large PDF) and embeds them with `simple_embedding` per chunk and with
+`simple_embeddings` per batch, reporting chunks per second. The first pass of
+each run starts with an empty word cache, so it includes hashing every distinct
+word once; the second pass measures the warm cache.
+
+Usage:
+    python benchmarks/bench_simple_embedding.py [--chunks 20000] [--words 150] [--vocabulary 50000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.embedding_backends import simple_embedding, simple_embeddings, get_word_buckets
+
+
+def synthetic_chunks(count, words, vocabulary, rng):
+    """Chunks of `words` words drawn from a Zipf distribution over `vocabulary` made-up words."""
+    vocab = np.array([f"w{i:x}" for i in range(vocabulary)])
+    ranks = np.minimum(rng.zipf(1.2, (count, words)), vocabulary) - 1
+    return [' '.join(vocab[row]) + '.' for row in ranks]
+
+
+def chunks_per_second(embed, chunks):
+    """Chunks per second of one cold (empty word cache) and one warm pass of `embed` over the chunks."""
+    rates = []
+    get_word_buckets.cache_clear()
+    for _ in range(2):
+        start = time.perf_counter()
+        embed(chunks)
+        rates.append(len(chunks) / (time.perf_counter() - start))
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=20000)
+    parser.add_argument('--words', type=int, default=150)
+    parser.add_argument('--vocabulary', type=int, default=50000)
+    parser.add_argument('--batch-size', type=int, default=256)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    chunks = synthetic_chunks(args.chunks, args.words, args.vocabulary, rng)
+
+    def one_at_a_time(texts):
+        return [simple_embedding(text) for text in texts]
+
+    def batched(texts):
+        return [simple_embeddings(texts[i:i + args.batch_size]) for i in range(0, len(texts), args.batch_size)]
+
+    print(f"{args.chunks} chunks of {args.words} words, vocabulary of {args.vocabulary}")
+    print(f"{'embedding':>22} {'cold (chunks/s)':>16} {'warm (chunks/s)':>16}")
+    for name, embed in (('simple_embedding', one_at_a_time), (f'batches of {args.batch_size}', batched)):
+        cold, warm = chunks_per_second(embed, chunks)
+        print(f"{name:>22} {cold:>16.0f} {warm:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Benchmark the sign-bit sketch prefilter against brute force search.
+
+Builds a clustered synthetic corpus, searches it exactly and with
+index_type='sketch' (a Hamming distance scan over 1-bit-per-dimension sketches,
+then an exact re-score of the nearest candidates) for several candidate counts,
+and reports recall@k relative to the exact results together with the median
+query latency.
+
+Usage:
+    python benchmarks/bench_sketch.py [--size 200000] [--queries 100] [--candidates 256 1024 4096]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The knowledge base module creates an OpenAI client on import; no calls are made here
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+from services.knowledge_base import SimpleVectorStore, INDEX_TYPE_SKETCH
+
+DIM = 128
+
+
+def clustered_corpus(size, num_topics, rng):
+    """Vectors scattered around random topic centres, like chunks of many documents."""
+    centres = rng.standard_normal((num_topics, DIM)).astype(np.float32)
+    topics = rng.integers(0, num_topics, size)
+    vectors = centres[topics] + 0.25 * rng.standard_normal((size, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def run_queries(store, queries, top_k):
+    """Return the result IDs and median latency (ms) of searching every query."""
+    timings = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        hits = store.search(query, top_k=top_k)
+        timings.append((time.perf_counter() - start) * 1000)
+        results.append([hit['id'] for hit in hits])
+    return results, float(np.median(timings))
+
+
+def recall(results, truth):
+    return float(np.mean([len(set(r) & set(t)) / len(t) for r, t in zip(results, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=200000)
+    parser.add_argument('--topics', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--candidates', type=int, nargs='+', default=[256, 512, 1024, 2048, 4096])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    corpus = clustered_corpus(args.size, args.topics, rng)
+    queries = corpus[rng.choice(args.size, args.queries, replace=False)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+    documents = [{'id': f'bench-{i}', 'content': ''} for i in range(args.size)]
+
+    store = SimpleVectorStore()
+    store.add_batch(documents, corpus)
+    truth, exact_latency = run_queries(store, queries, args.top_k)
+
+    sketched = SimpleVectorStore(index_type=INDEX_TYPE_SKETCH)
+    sketched.add_batch(documents, corpus)
+    sketch_bytes = sketched.snapshot().sketch.nbytes / args.size
+
+    print(f"corpus: {args.size} chunks, dim={DIM}, top_k={args.top_k}, {sketch_bytes:.0f} sketch bytes/chunk")
+    print(f"{'search':>18} {'recall@k':>9} {'latency (ms)':>13}")
+    print(f"{'exact':>18} {1.0:>9.3f} {exact_latency:>13.2f}")
+    for candidates in args.candidates:
+        sketched.sketch_candidates = candidates
+        results, latency = run_queries(sketched, queries, args.top_k)
+        print(f"{f'candidates={candidates}':>18} {recall(results, truth):>9.3f} {latency:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
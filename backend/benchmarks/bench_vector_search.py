@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Benchmark query latency of the vector store against corpus size.
+
+Compares the previous search path (list-of-lists embeddings converted to a float64
+array and re-normalized on every query) with the current SimpleVectorStore, which
+keeps a pre-normalized float32 matrix. The last column is the per-query latency
+when all queries are sent through a single search_batch call.
+
+Usage:
+    python benchmarks/bench_vector_search.py [--sizes 1000 10000 50000] [--queries 20]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The knowledge base module creates an OpenAI client on import; no calls are made here
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+from services.knowledge_base import SimpleVectorStore
+
+DIM = 128
+
+
+def legacy_search(embeddings, query_embedding, top_k=3):
+    """The search implementation SimpleVectorStore used before the float32 matrix."""
+    embeddings_array = np.array(embeddings)
+    query_array = np.array(query_embedding)
+    dot_product = np.dot(embeddings_array, query_array)
+    norm_embeddings = np.linalg.norm(embeddings_array, axis=1)
+    norm_query = np.linalg.norm(query_array)
+    similarities = dot_product / (norm_embeddings * norm_query + 1e-10)
+    indices = np.where(similarities > 0.3)[0]
+    if len(indices) == 0:
+        indices = np.argsort(-similarities)[:top_k]
+    else:
+        indices = indices[np.argsort(-similarities[indices])][:top_k]
+    return indices
+
+
+def random_corpus(size, rng):
+    """Non-negative random vectors, similar in shape to the hashing embeddings."""
+    return rng.random((size, DIM), dtype=np.float32) ** 4
+
+
+def time_queries(search, queries):
+    """Return the median latency of running `search` over the queries, in milliseconds."""
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000, 100000])
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--top-k', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    print(f"{'chunks':>10} {'before (ms)':>12} {'after (ms)':>12} {'speedup':>8} {'batched (ms)':>13}")
+
+    for size in args.sizes:
+        corpus = random_corpus(size, rng)
+        queries = random_corpus(args.queries, rng)
+
+        legacy_embeddings = corpus.astype(np.float64).tolist()
+        store = SimpleVectorStore()
+        for i, embedding in enumerate(corpus):
+            store.add({'id': f'bench-{i}', 'content': ''}, embedding)
+
+        before = time_queries(lambda q: legacy_search(legacy_embeddings, q.tolist(), args.top_k), queries)
+        after = time_queries(lambda q: store.search(q.tolist(), top_k=args.top_k), queries)
+
+        start = time.perf_counter()
+        store.search_batch(queries, top_k=args.top_k)
+        batched = (time.perf_counter() - start) * 1000 / len(queries)
+        print(f"{size:>10} {before:>12.2f} {after:>12.2f} {before / after:>7.1f}x {batched:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+A local stand-in for an embedding API, so remote embedding backends can be run offline.
+
+Answers OpenAI-style embedding requests (POST {"input": [...]} to any path,
+e.g. /v1/embeddings) with the local hash embeddings, so results match the
+'hash' backend. It can add latency and fail a fraction of requests with
+HTTP 503 to exercise the client's batching and retries; tests can also queue
+the exact statuses (e.g. 429) the next requests fail with.
+
+Point a collection at it with EMBEDDING_BACKEND=http://127.0.0.1:8089/v1/embeddings,
+or the OpenAI backend with OPENAI_BASE_URL=http://127.0.0.1:8089/v1.
+
+Usage:
+    python embedding_stub_server.py [--port 8089] [--latency-ms 20] [--fail-rate 0.1]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.embedding_backends import simple_embeddings
+
+
+class EmbeddingStubHandler(BaseHTTPRequestHandler):
+    """Embeds the texts of every POST; the server carries the latency, failures and request log."""
+
+    def do_POST(self):
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            texts = payload['input']
+            if isinstance(texts, str):
+                texts = [texts]
+        except (ValueError, KeyError, TypeError):
+            self._reply(400, {'error': {'message': 'Expected a JSON body with an "input" list'}})
+            return
+
+        self.server.batch_sizes.append(len(texts))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        status = None
+        with self.server.lock:
+            if self.server.failures:
+                status = self.server.failures.popleft()
+        if status is None and random.random() < self.server.fail_rate:
+            status = 503
+        if status is not None:
+            self._reply(status, {'error': {'message': 'Simulated failure'}}, {'Retry-After': self.server.retry_after})
+            return
+        vectors = simple_embeddings(texts)
+        self._reply(200, {
+            'object': 'list',
+            'model': payload.get('model') or 'stub-hash',
+            'data': [{'object': 'embedding', 'index': i, 'embedding': vector.tolist()} for i, vector in enumerate(vectors)],
+            'usage': {'prompt_tokens': 0, 'total_tokens': 0}
+        })
+
+    def _reply(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Requests are counted in batch_sizes instead of logged one by one
+        pass
+
+
+def start_stub_server(host='127.0.0.1', port=0, latency_ms=0.0, fail_rate=0.0):
+    """
+    Start the stub server on a background thread.
+
+    Args:
+        host: The address to listen on
+        port: The port to listen on (0 for any free port)
+        latency_ms: Milliseconds to wait before answering each request
+        fail_rate: Fraction of requests answered with HTTP 503
+
+    Returns:
+        Tuple[ThreadingHTTPServer, str]: The server (call shutdown() to stop it) and
+        its embeddings URL. The server's batch_sizes lists the size of every request;
+        HTTP statuses appended to its `failures` deque answer the next requests, in
+        order, and every failure carries its `retry_after` (seconds) as Retry-After
+    """
+    server = ThreadingHTTPServer((host, port), EmbeddingStubHandler)
+    server.daemon_threads = True
+    server.latency = latency_ms / 1000
+    server.fail_rate = fail_rate
+    server.failures = deque()
+    server.retry_after = '0'
+    server.lock = threading.Lock()
+    server.batch_sizes = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1/embeddings"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, url = start_stub_server(args.host, args.port, args.latency_ms, args.fail_rate)
+    print(f"Embedding stub server listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+"""
+One-shot migration of the knowledge base to the binary index format.
+
+Parses every legacy per-chunk JSON file under the knowledge base directory and
+writes a single index segment (a memory-mappable float32 vectors file plus a
+chunk log) and its manifest to data/knowledge_base/_index/. The document
+directories are left in place. A knowledge base that already has a segment index
+is not migrated again.
+"""
+
+import os
+import sys
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.index_storage import migrate_directory_layout, get_index_dir
+
+if __name__ == "__main__":
+    kb_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'knowledge_base')
+    if len(sys.argv) > 1:
+        kb_dir = sys.argv[1]
+
+    print(f"Migrating knowledge base at {kb_dir}")
+    try:
+        index = migrate_directory_layout(kb_dir)
+    except RuntimeError as e:
+        print(str(e))
+        sys.exit(1)
+    if index is None:
+        print("Migration failed")
+        sys.exit(1)
+    print(f"Index written to {get_index_dir(kb_dir)} (version {index.version}, {len(index)} chunks)")
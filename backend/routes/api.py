@@ -14,8 +14,10 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from services.moderation import is_prompt_safe
 from services.ai_service import generate_ai_response, generate_ai_response_with_function_calling, generate_ai_response_direct
 from services.function_calling import get_all_reminders, search_nutrition, set_reminder
-from services.knowledge_base import search_knowledge_base, KNOWLEDGE_BASE_DIR, vector_store, get_embedding
+from services.knowledge_base import search_knowledge_base, get_query_embedding, get_query_embeddings, embedding_cache, query_embedding_cache, refresh_index, get_collection, list_collections, is_collection_dir, SEARCH_MODE_VECTOR, SEARCH_MODE_HYBRID, SEARCH_MODE_HIERARCHICAL, TOP_DOCUMENTS
 from services.document_loader import load_document_from_url, load_document_from_file, list_documents
+from services.mmr import DEFAULT_MMR_LAMBDA
+from services.index_storage import INDEX_DIR_NAME
 
 # Create a Blueprint for API routes
 api_bp = Blueprint('api', __name__)
@@ -67,6 +69,38 @@ def rate_limit(limit=20, window=60):
         return wrapped
     return decorator
 
+@api_bp.before_request
+def sync_knowledge_base():
+    """Pick up knowledge base changes published by other worker processes."""
+    refresh_index()
+
+def get_request_collection(data=None, create=False):
+    """
+    Get the knowledge base collection named by a request's optional `collection`
+    parameter (in the JSON body, a form field or the query string).
+    
+    Args:
+        data: The parsed JSON body, if any
+        create: Create the collection if it does not exist (for requests that add documents)
+        
+    Returns:
+        KnowledgeBaseCollection: The collection (the default collection if none is named)
+        
+    Raises:
+        ValueError: If the collection name is invalid
+        LookupError: If the collection does not exist and create is False
+    """
+    name = None
+    if isinstance(data, dict):
+        name = data.get('collection')
+    name = name or request.form.get('collection') or request.args.get('collection')
+    return get_collection(name, create=create)
+
+def collection_error(error):
+    """The response for a request naming an invalid (400) or unknown (404) collection."""
+    status = 404 if isinstance(error, LookupError) else 400
+    return jsonify({'error': str(error)}), status
+
 def add_processing_log(message):
     """Add a message to the processing logs."""
     global document_processing_logs
@@ -77,7 +111,30 @@ def add_processing_log(message):
         document_processing_logs = document_processing_logs[-100:]
     print(message)  # Also print to console
 
+# Neighbouring chunks added on each side of a document chunk found for a chat question
+CHAT_CONTEXT_EXPAND = 1
+# Relevance/diversity trade-off used to keep near-duplicate chunks out of the chat context
+CHAT_MMR_LAMBDA = DEFAULT_MMR_LAMBDA
+# Documents (ranked by their chunk centroids) searched for a question that names no document
+CHAT_TOP_DOCUMENTS = 3
+
 # Chat endpoint
+def get_title_filter(document_names, store, snapshot=None):
+    """
+    Build a search filter restricting results to documents with the given titles.
+    
+    Args:
+        document_names: Document file names mentioned in a query
+        store: The vector store of the collection being searched
+        snapshot: The vector store snapshot to check the names against (defaults to the current one)
+        
+    Returns:
+        dict: The filter, or None if none of the names match a document in the store
+    """
+    search_filter = {'title': document_names}
+    rows = store.filter_rows(search_filter, snapshot)
+    return search_filter if rows is not None and len(rows) > 0 else None
+
 @api_bp.route('/chat', methods=['OPTIONS', 'POST'])
 def chat():
     """
@@ -112,6 +169,13 @@ def chat():
         is_safe, reason = is_prompt_safe(user_message)
         if not is_safe:
             return jsonify({'error': reason}), 403
+        
+        # Only the documents of the requested collection are searched
+        try:
+            collection = get_request_collection(data)
+        except (ValueError, LookupError) as e:
+            return collection_error(e)
+        store = collection.vector_store
             
         # Check if the query is about a specific document
         document_specific = False
@@ -129,10 +193,14 @@ def chat():
             if potential_docs:
                 print(f"Document names found in query: {potential_docs}")
                 
-                # Create a more specific query that includes the document name
+                # Restrict the search to the named documents; if none of them are in the
+                # knowledge base, fall back to adding the names to the query
+                snapshot = store.snapshot()
+                title_filter = get_title_filter(potential_docs, store, snapshot)
                 enhanced_query = user_message
-                for doc_name in potential_docs:
-                    enhanced_query += f" {doc_name}"
+                if title_filter is None:
+                    for doc_name in potential_docs:
+                        enhanced_query += f" {doc_name}"
                 
                 # Check if the query is asking about a specific section
                 section_query = False
@@ -143,13 +211,21 @@ def chat():
                         section_query = True
                 
                 # Get document context
-                query_embedding = get_embedding(enhanced_query)
+                query_embedding = get_query_embedding(enhanced_query, collection.embedding_backend)
                 
-                # Increase top_k for document-specific queries to get more context
-                top_k_value = 20 if section_query else 15
+                # Every hit comes back with its neighbouring chunks as one contiguous window,
+                # so a few hits give coherent sections of the document; with a title filter
+                # every result already comes from the named documents, and hybrid search
+                # ranks chunks containing the exact query terms first
+                if title_filter is not None:
+                    top_k_value = 4 if section_query else 3
+                else:
+                    top_k_value = 6 if section_query else 5
                 
-                print(f"Using enhanced query: {enhanced_query} with top_k={top_k_value}")
-                results = vector_store.search(query_embedding, top_k=top_k_value)
+                print(f"Using enhanced query: {enhanced_query} with top_k={top_k_value} and filter={title_filter}")
+                results = store.search(query_embedding, top_k=top_k_value, filter=title_filter,
+                                       query_text=enhanced_query, mode=SEARCH_MODE_HYBRID, snapshot=snapshot,
+                                       expand=CHAT_CONTEXT_EXPAND, mmr_lambda=CHAT_MMR_LAMBDA)
                 
                 if results:
                     document_context = "Here is information from the documents you asked about:\n\n"
@@ -166,13 +242,10 @@ def chat():
                     for title, docs in docs_by_title.items():
                         document_context += f"--- From document: {title} ---\n\n"
                         
-                        # Sort chunks by their position in the document if possible
-                        try:
-                            docs = sorted(docs, key=lambda x: int(x.get('id', '0').split('-')[-1]) if x.get('id', '0').split('-')[-1].isdigit() else 0)
-                        except:
-                            pass  # If sorting fails, use the original order
+                        # Put the windows in document order
+                        docs = sorted(docs, key=lambda doc: doc.get('window_start', 0))
                         
-                        # Combine content from all chunks
+                        # Combine content from all windows
                         combined_content = ""
                         for doc in docs:
                             content = doc.get('content', 'No content available')
@@ -200,12 +273,19 @@ def chat():
                 # Enhance system prompt for document queries with more specific instructions
                 system_prompt += "\nWhen answering about documents, focus on the specific information provided in the context below and include ALL relevant details from the documents. If asked about specific sections or content from a document, provide a comprehensive and detailed response that includes ALL key points, tools, methods, and examples mentioned in that section. Do not omit important details or examples. Pay special attention to sections marked as 'RELEVANT SECTION' as they directly relate to the user's query. Be sure to include ALL specific tools, measurements, and frameworks mentioned in these sections."
             else:
-                # If no specific document name found, do a general search
-                query_embedding = get_embedding(user_message)
-                results = vector_store.search(query_embedding, top_k=8)
+                # If no specific document name found, work out which documents the question is
+                # about from their chunk centroids and only search their chunks
+                query_embedding = get_query_embedding(user_message, collection.embedding_backend)
+                results = store.search(query_embedding, top_k=8, mode=SEARCH_MODE_HIERARCHICAL,
+                                       mmr_lambda=CHAT_MMR_LAMBDA, top_documents=CHAT_TOP_DOCUMENTS)
                 
                 if results:
                     document_context = "Here is some relevant information from our document collection:\n\n"
+                    
+                    # Present the closest document first
+                    results = sorted(results, key=lambda doc: doc.get('document_score', 0.0), reverse=True)
+                    best_title = results[0].get('title', 'Unknown')
+                    print(f"Query appears to be about: {best_title} (document score {results[0].get('document_score', 0.0):.4f})")
                     for i, doc in enumerate(results):
                         doc_title = doc.get('title', 'Unknown')
                         doc_content = doc.get('content', 'No content available')
@@ -337,11 +417,22 @@ def knowledge():
     Returns:
         JSON: Relevant knowledge base entries
     """
+    search_filter = None
+    data = None
     if request.method == 'GET':
         query = request.args.get('query')
+        mode = request.args.get('mode', SEARCH_MODE_VECTOR)
+        expand = request.args.get('expand', 0, type=int)
+        mmr_lambda = request.args.get('mmr_lambda', type=float)
+        top_documents = request.args.get('top_documents', TOP_DOCUMENTS, type=int)
     else:  # POST
         data = request.json
         query = data.get('query')
+        search_filter = data.get('filter')
+        mode = data.get('mode', SEARCH_MODE_VECTOR)
+        expand = data.get('expand', 0)
+        mmr_lambda = data.get('mmr_lambda')
+        top_documents = data.get('top_documents', TOP_DOCUMENTS)
     
     if not query:
         return jsonify({'error': 'Query parameter is required'}), 400
@@ -351,24 +442,41 @@ def knowledge():
     if not is_safe:
         return jsonify({'error': reason}), 403
     
-    # Search the knowledge base
-    results = search_knowledge_base(query)
+    try:
+        collection = get_request_collection(data)
+    except (ValueError, LookupError) as e:
+        return collection_error(e)
+    
+    # Search the knowledge base, optionally restricted by document metadata
+    snapshot = collection.vector_store.snapshot()
+    try:
+        results = search_knowledge_base(query, filter=search_filter, mode=mode, snapshot=snapshot, expand=expand,
+                                        mmr_lambda=mmr_lambda, top_documents=top_documents,
+                                        collection=collection.name)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid search: {str(e)}'}), 400
     
     return jsonify({
         'query': query,
-        'results': results
+        'collection': collection.name,
+        'results': results,
+        'snapshot_version': snapshot.version
     })
 
 # Document management endpoints
 @api_bp.route('/documents', methods=['GET'])
 def list_documents():
-    """List all documents in the knowledge base."""
+    """List all documents in a collection of the knowledge base (the `collection` query parameter)."""
+    try:
+        collection = get_request_collection()
+    except (ValueError, LookupError) as e:
+        return collection_error(e)
     try:
-        # Get the knowledge base directory
-        kb_dir = KNOWLEDGE_BASE_DIR
+        # Get the collection's directory
+        kb_dir = collection.directory
         
         if not os.path.exists(kb_dir):
-            return jsonify({"documents": [], "count": 0})
+            return jsonify({"documents": [], "count": 0, "collection": collection.name})
         
         documents = []
         
@@ -376,8 +484,8 @@ def list_documents():
         for doc_dir in os.listdir(kb_dir):
             doc_path = os.path.join(kb_dir, doc_dir)
             
-            # Skip if not a directory
-            if not os.path.isdir(doc_path):
+            # Skip if not a directory, or if it is the binary index or another collection
+            if not os.path.isdir(doc_path) or doc_dir == INDEX_DIR_NAME or is_collection_dir(doc_path):
                 continue
                 
             # Try to read metadata
@@ -403,11 +511,60 @@ def list_documents():
                     "date_added": "Unknown"
                 })
         
-        return jsonify({"documents": documents, "count": len(documents)})
+        return jsonify({"documents": documents, "count": len(documents), "collection": collection.name})
     except Exception as e:
         print(f"Error listing documents: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@api_bp.route('/collections', methods=['GET'])
+def get_collections():
+    """
+    List the collections of the knowledge base.
+    
+    Documents are added to a collection by passing its name as `collection` to
+    /documents/url or /documents/file (which creates it, unless it was created
+    with POST /collections to choose its embedding backend); every other endpoint
+    searches the default collection unless given a `collection`.
+    
+    Returns:
+        JSON: The collection names, the default collection first
+    """
+    collections = list_collections()
+    return jsonify({"collections": collections, "count": len(collections)})
+
+@api_bp.route('/collections', methods=['POST'])
+def create_collection():
+    """
+    Create an empty collection with its own embedding backend.
+    
+    The JSON body gives the collection `name` and an optional `embedding_backend`:
+    'hash' (the local hash embeddings), 'openai' or 'openai:<model>', or the URL of
+    an OpenAI-compatible embedding server. Without one, the collection uses the
+    EMBEDDING_BACKEND setting. Every document added to the collection, and every
+    query searching it, is embedded with this backend.
+    
+    Returns:
+        JSON: The collection name and its embedding backend
+    """
+    data = request.json
+    if not isinstance(data, dict) or not data.get('name'):
+        return jsonify({'error': 'Collection name is required'}), 400
+    name = data['name']
+    embedding_backend = data.get('embedding_backend')
+    if embedding_backend is not None and not isinstance(embedding_backend, str):
+        return jsonify({'error': 'embedding_backend must be a string'}), 400
+    if name in list_collections():
+        return jsonify({'error': f'Collection already exists: {name}'}), 409
+    try:
+        collection = get_collection(name, create=True, embedding_backend=embedding_backend)
+    except (ValueError, LookupError) as e:
+        return collection_error(e)
+    return jsonify({
+        "collection": collection.name,
+        "embedding_backend": collection.embedding_backend.id,
+        "dim": collection.embedding_backend.dim
+    }), 201
+
 @api_bp.route('/documents/logs', methods=['GET'])
 @rate_limit(limit=10, window=10)  # Increased to 10 requests per 10 seconds
 def get_processing_logs():
@@ -436,6 +593,12 @@ def add_document_from_url():
             add_processing_log("Error: URL is required")
             return jsonify({'error': 'URL is required', 'logs': document_processing_logs}), 400
         
+        # The document is added to the requested collection, which is created if it is new
+        try:
+            collection = get_request_collection(data, create=True)
+        except (ValueError, LookupError) as e:
+            return collection_error(e)
+        
         add_processing_log(f"Processing document from URL: {url}")
         
         # Check if URL is safe
@@ -450,7 +613,7 @@ def add_document_from_url():
         # Set a longer timeout for the request to prevent server crashes
         # This is a potentially long-running operation
         try:
-            documents = load_document_from_url(url)
+            documents = load_document_from_url(url, collection=collection.name)
         except Exception as e:
             add_processing_log(f"Error during document processing: {str(e)}")
             import traceback
@@ -473,6 +636,7 @@ def add_document_from_url():
             'message': f'Added {len(documents)} document chunks from URL',
             'document_count': len(documents),
             'url': url,
+            'collection': collection.name,
             'logs': document_processing_logs
         }), 201
     except Exception as e:
@@ -518,6 +682,12 @@ def add_document_from_file():
             add_processing_log(f"Error: Unsupported file extension: {file_extension}")
             return jsonify({'error': f'Unsupported file extension: {file_extension}', 'logs': document_processing_logs}), 400
         
+        # The document is added to the requested collection, which is created if it is new
+        try:
+            collection = get_request_collection(create=True)
+        except (ValueError, LookupError) as e:
+            return collection_error(e)
+        
         add_processing_log(f"Processing file: {file.filename}, type: {file.content_type}")
         
         # Save file content
@@ -533,7 +703,8 @@ def add_document_from_file():
         # Process file with progress updates
         try:
             add_processing_log(f"Starting document processing for {file.filename}")
-            documents = load_document_from_file(file.filename, file_content, file_extension)
+            documents = load_document_from_file(file.filename, file_content, file_extension,
+                                                collection=collection.name)
         except Exception as e:
             add_processing_log(f"Error during document processing: {str(e)}")
             import traceback
@@ -556,6 +727,7 @@ def add_document_from_file():
             'message': f'Added {len(documents)} document chunks from file',
             'document_count': len(documents),
             'filename': file.filename,
+            'collection': collection.name,
             'logs': document_processing_logs
         }), 201
     except Exception as e:
@@ -572,13 +744,18 @@ def add_document_from_file():
 @api_bp.route('/documents/debug', methods=['GET'])
 def debug_documents():
     """
-    Get all documents in the vector store for debugging.
+    Get all documents in a collection's vector store for debugging.
     
     Returns:
         JSON: List of all documents in the vector store
     """
+    try:
+        collection = get_request_collection()
+    except (ValueError, LookupError) as e:
+        return collection_error(e)
     documents = []
-    for doc in vector_store.documents:
+    # Only the start of each chunk's content is read, enough to tell whether it needs an ellipsis
+    for doc in collection.vector_store.iter_documents(max_chars=101):
         # Include only essential information to avoid large responses
         documents.append({
             "title": doc.get("title", "Unknown"),
@@ -592,10 +769,40 @@ def debug_documents():
         "documents": documents
     }) 
 
+@api_bp.route('/documents/stats', methods=['GET'])
+def document_stats():
+    """
+    Report the size of a collection's vector store and where its vectors are held.
+    
+    For a tiered store (VECTOR_RAM_BUDGET set), "tiers" gives the RAM budget, the
+    bytes and segments in the hot tier, and the fraction of row reads served from it.
+    "embedding_cache" gives the size of the persistent embedding cache (shared by
+    every collection) and this worker's hit rate, "query_embedding_cache" the
+    size and hit rate of this worker's cache of query embeddings, and
+    "embedding_backend" the collection's backend with this worker's request,
+    batch, retry and latency counters for remote backends.
+    
+    Returns:
+        JSON: Vector store statistics
+    """
+    try:
+        collection = get_request_collection()
+    except (ValueError, LookupError) as e:
+        return collection_error(e)
+    snapshot = collection.vector_store.snapshot()
+    stats = collection.vector_store.memory_usage()
+    stats['collection'] = collection.name
+    stats['live_chunks'] = len(snapshot)
+    stats['snapshot_version'] = snapshot.version
+    stats['embedding_cache'] = embedding_cache.stats() if embedding_cache is not None else None
+    stats['query_embedding_cache'] = query_embedding_cache.stats() if query_embedding_cache is not None else None
+    stats['embedding_backend'] = collection.embedding_backend.stats()
+    return jsonify(stats)
+
 @api_bp.route('/documents/<doc_id>', methods=['DELETE'])
 def delete_document(doc_id):
     """
-    Delete a document from the knowledge base.
+    Delete a document from a collection of the knowledge base (the `collection` query parameter).
     
     Args:
         doc_id: The document ID to delete
@@ -603,11 +810,15 @@ def delete_document(doc_id):
     Returns:
         JSON: Success message
     """
+    try:
+        collection = get_request_collection()
+    except (ValueError, LookupError) as e:
+        return collection_error(e)
     try:
         # Path to the document directory
-        doc_dir = os.path.join(KNOWLEDGE_BASE_DIR, doc_id)
+        doc_dir = os.path.join(collection.directory, doc_id)
         
-        if not os.path.exists(doc_dir):
+        if not os.path.exists(doc_dir) or doc_id == INDEX_DIR_NAME or is_collection_dir(doc_dir):
             return jsonify({'error': f'Document with ID {doc_id} not found'}), 404
         
         # Get document metadata
@@ -619,17 +830,9 @@ def delete_document(doc_id):
         else:
             title = "Unknown document"
         
-        # Remove document chunks from vector store
-        # We need to find the indices of documents with this ID prefix
-        indices_to_remove = []
-        for i, doc in enumerate(vector_store.documents):
-            if "id" in doc and doc["id"].startswith(doc_id):
-                indices_to_remove.append(i)
-        
-        # Remove from vector store (in reverse order to avoid index shifting)
-        for index in sorted(indices_to_remove, reverse=True):
-            vector_store.documents.pop(index)
-            vector_store.embeddings.pop(index)
+        # Record the deletion in the index and drop the document's chunks from the
+        # vector store; other worker processes drop them on their next refresh
+        deleted_chunks = collection.delete_document(doc_id)
         
         # Delete the document directory
         import shutil
@@ -638,63 +841,115 @@ def delete_document(doc_id):
         return jsonify({
             'success': True,
             'message': f'Document "{title}" deleted successfully',
-            'deleted_chunks': len(indices_to_remove)
+            'deleted_chunks': deleted_chunks
         })
     except Exception as e:
         print(f"Error deleting document: {str(e)}")
         return jsonify({'error': f'Error deleting document: {str(e)}'}), 500
 
+def format_search_result(doc):
+    """
+    Format a vector store search result for the frontend.
+    
+    Args:
+        doc: The search result
+        
+    Returns:
+        dict: The fields shown by the frontend, plus the chunk IDs of the window for expanded
+        searches and the document score for hierarchical ones
+    """
+    formatted_result = {
+        "title": doc.get("title", "Unknown"),
+        "content": doc.get("content", "No content available"),
+        "source": doc.get("source", "Unknown"),
+        "page": doc.get("page", ""),
+        "score": doc.get("similarity", 0)
+    }
+    if "window" in doc:
+        formatted_result["window"] = doc["window"]
+    if "document_score" in doc:
+        formatted_result["document_score"] = doc["document_score"]
+    return formatted_result
+
 @api_bp.route('/documents/search', methods=['POST'])
 def search_documents():
     """
     Search for documents in the knowledge base.
     
+    The JSON body may include a metadata `filter`, e.g.
+    {"query": "...", "filter": {"title": "report.pdf", "date_added": {"from": "2024-01-01"}}},
+    and a search `mode`: "vector", "lexical" (BM25), "hybrid" or "hierarchical"
+    (only the chunks of the `top_documents` documents whose centroids are closest
+    to the query are scored). Queries about a
+    specific document default to hybrid search. With `expand` set to N, every
+    result is a window of the hit and the N chunks around it in its document.
+    Setting `mmr_lambda` (0 to 1) re-ranks the results for diversity, so
+    near-duplicate chunks do not fill the results.
+    
     Returns:
         JSON: Search results
     """
     try:
         data = request.json
         query = data.get('query', '')
+        search_filter = data.get('filter')
+        mode = data.get('mode')
+        expand = data.get('expand', 0)
+        mmr_lambda = data.get('mmr_lambda')
+        top_documents = data.get('top_documents', TOP_DOCUMENTS)
         
         if not query:
             return jsonify({'error': 'Query is required'}), 400
         
+        try:
+            collection = get_request_collection(data)
+        except (ValueError, LookupError) as e:
+            return collection_error(e)
+        store = collection.vector_store
+        
         print(f"Document search request received: {query}")
         
+        # Resolve the document filter and run the search against the same snapshot
+        snapshot = store.snapshot()
+        
         # Check if the query is about a specific document
         document_specific = False
-        if '.pdf' in query.lower() or 'document' in query.lower():
+        if search_filter is None and ('.pdf' in query.lower() or 'document' in query.lower()):
             document_specific = True
             # Extract potential document name from query
             potential_docs = re.findall(r'([a-zA-Z0-9_-]+\.pdf)', query)
             if potential_docs:
-                # Boost the query with the document name to improve retrieval
-                query = f"{query} {' '.join(potential_docs)}"
-                print(f"Document-specific query detected: {query}")
+                # Restrict the search to the named documents, or boost the query with
+                # their names if they are not in the knowledge base
+                search_filter = get_title_filter(potential_docs, store, snapshot)
+                if search_filter is None:
+                    query = f"{query} {' '.join(potential_docs)}"
+                print(f"Document-specific query detected: {query} (filter={search_filter})")
         
         # Get embedding for the query
-        query_embedding = get_embedding(query)
+        query_embedding = get_query_embedding(query, collection.embedding_backend)
         
-        # Search for similar documents - use a higher top_k for document-specific queries
-        top_k = 15 if document_specific else 5
-        results = vector_store.search(query_embedding, top_k=top_k)
+        # Search for similar documents - use a higher top_k for document-specific queries,
+        # which use hybrid search so chunks with the exact terms rank first
+        top_k = 8 if document_specific else 5
+        if mode is None:
+            mode = SEARCH_MODE_HYBRID if document_specific else SEARCH_MODE_VECTOR
+        try:
+            results = store.search(query_embedding, top_k=top_k, filter=search_filter,
+                                   query_text=query, mode=mode, snapshot=snapshot, expand=expand,
+                                   mmr_lambda=mmr_lambda, top_documents=top_documents)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid search: {str(e)}'}), 400
         
         # Format results for the frontend
-        formatted_results = []
-        for doc in results:
-            formatted_results.append({
-                "title": doc.get("title", "Unknown"),
-                "content": doc.get("content", "No content available"),
-                "source": doc.get("source", "Unknown"),
-                "page": doc.get("page", ""),
-                "score": doc.get("similarity", 0)
-            })
+        formatted_results = [format_search_result(doc) for doc in results]
         
         print(f"Found {len(formatted_results)} results for query: {query}")
         
         return jsonify({
             "query": query,
-            "results": formatted_results
+            "results": formatted_results,
+            "snapshot_version": snapshot.version
         })
     except Exception as e:
         import traceback
@@ -704,4 +959,89 @@ def search_documents():
             "query": query,
             "results": [],
             "error": str(e)
+        }), 500
+
+# Maximum number of queries accepted by the batch search endpoint
+MAX_BATCH_QUERIES = 100
+
+# Maximum number of results per query of the batch search endpoint (MMR and
+# expansion work grows with it, so an unbounded value could score the whole corpus)
+MAX_TOP_K = 100
+
+@api_bp.route('/documents/search/batch', methods=['POST'])
+def search_documents_batch():
+    """
+    Search for documents for several queries in one request.
+
+    Expects a JSON body of the form {"queries": ["...", ...], "top_k": 5}, with an
+    optional metadata "filter" applied to every query, and an optional search
+    "mode", "expand", "mmr_lambda" and "top_documents" (see /documents/search).
+    All queries are scored against the vector store with a single matrix product.
+
+    Returns:
+        JSON: Search results for each query, in the order they were given
+    """
+    try:
+        data = request.json or {}
+        queries = data.get('queries', [])
+        top_k = data.get('top_k', 5)
+        search_filter = data.get('filter')
+        mode = data.get('mode', SEARCH_MODE_VECTOR)
+        expand = data.get('expand', 0)
+        mmr_lambda = data.get('mmr_lambda')
+        top_documents = data.get('top_documents', TOP_DOCUMENTS)
+
+        if not isinstance(queries, list) or not queries:
+            return jsonify({'error': 'A non-empty list of queries is required'}), 400
+        if len(queries) > MAX_BATCH_QUERIES:
+            return jsonify({'error': f'At most {MAX_BATCH_QUERIES} queries are allowed per request'}), 400
+        if not all(isinstance(query, str) and query for query in queries):
+            return jsonify({'error': 'Every query must be a non-empty string'}), 400
+        try:
+            top_k = int(top_k)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'top_k must be an integer'}), 400
+        if top_k < 1:
+            return jsonify({'error': 'top_k must be at least 1'}), 400
+        if top_k > MAX_TOP_K:
+            return jsonify({'error': f'top_k must be at most {MAX_TOP_K}'}), 400
+        try:
+            collection = get_request_collection(data)
+        except (ValueError, LookupError) as e:
+            return collection_error(e)
+        store = collection.vector_store
+
+        print(f"Batch document search request received: {len(queries)} queries, top_k={top_k}")
+
+        # Embed every query with one call, then score them all at once
+        query_embeddings = get_query_embeddings(queries, collection.embedding_backend)
+        snapshot = store.snapshot()
+        try:
+            batch_results = store.search_batch(query_embeddings, top_k=top_k, filter=search_filter,
+                                               query_texts=queries, mode=mode, snapshot=snapshot,
+                                               expand=expand, mmr_lambda=mmr_lambda,
+                                               top_documents=top_documents)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid search: {str(e)}'}), 400
+
+        # Format results for the frontend
+        formatted_batches = []
+        for query, results in zip(queries, batch_results):
+            formatted_batches.append({
+                "query": query,
+                "results": [format_search_result(doc) for doc in results]
+            })
+
+        return jsonify({
+            "count": len(formatted_batches),
+            "results": formatted_batches,
+            "snapshot_version": snapshot.version
+        })
+    except Exception as e:
+        import traceback
+        print(f"Error in batch document search endpoint: {e}")
+        print(traceback.format_exc())
+        return jsonify({
+            "results": [],
+            "error": str(e)
         }), 500
\ No newline at end of file
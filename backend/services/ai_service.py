@@ -94,7 +94,7 @@ def generate_ai_response(user_message, system_prompt=None, model="gpt-4", temper
         return f"I'm sorry, I encountered an error: {str(e)}", 0, 0, 0.0
 
 def generate_ai_response_with_function_calling(user_message, system_prompt, model="gpt-4", temperature=0.7, 
-                         top_p=1.0, frequency_penalty=0.0, presence_penalty=0.0, tools=None):
+                         top_p=1.0, frequency_penalty=0.0, presence_penalty=0.0, tools=None, collection=None):
     """
     Generate a response from the AI model with function calling support and RAG.
     
@@ -107,6 +107,7 @@ def generate_ai_response_with_function_calling(user_message, system_prompt, mode
         frequency_penalty (float): Penalizes repeated tokens (default: 0.0)
         presence_penalty (float): Encourages new topics (default: 0.0)
         tools (list): List of tool definitions for function calling
+        collection (str): The knowledge base collection to search (default: the default collection)
         
     Returns:
         tuple: (response_text, input_tokens, output_tokens, estimated_cost)
@@ -118,7 +119,7 @@ def generate_ai_response_with_function_calling(user_message, system_prompt, mode
     print(f"RAG function received system prompt: {system_prompt}")
     
     # Get RAG context if available
-    rag_context, has_context, source_documents = get_rag_context(user_message)
+    rag_context, has_context, source_documents = get_rag_context(user_message, collection=collection)
     
     # Prepare system prompt with RAG context if available
     # IMPORTANT: Use the provided system prompt as the base, don't override it
@@ -0,0 +1,167 @@
+import copy
+import numpy as np
+from typing import List, Optional
+
+# Number of set bits of every 16-bit value, for counting the bits of a uint64 16 bits at a time
+POPCOUNT_TABLE = np.array([bin(value).count('1') for value in range(1 << 16)], dtype=np.uint8)
+
+# NumPy 2.0 counts bits natively (a hardware popcount where available)
+HAS_BITWISE_COUNT = hasattr(np, 'bitwise_count')
+
+
+def pack_signs(vectors: np.ndarray, words: int) -> np.ndarray:
+    """
+    Pack the sign bits of vectors into uint64 words.
+
+    Bit d of a sketch is set when dimension d of the vector is positive; unused
+    bits of the last word are zero.
+
+    Args:
+        vectors: A (n, dim) array
+        words: The number of uint64 words per sketch
+
+    Returns:
+        np.ndarray: A (n, words) uint64 array
+    """
+    bits = np.packbits(np.asarray(vectors) > 0, axis=1, bitorder='little')
+    packed = np.zeros((len(bits), words * 8), dtype=np.uint8)
+    packed[:, :bits.shape[1]] = bits
+    return packed.view(np.uint64)
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """The number of set bits of every value of a 1-D uint64 array, as uint8."""
+    if HAS_BITWISE_COUNT:
+        return np.bitwise_count(words)
+    counts = POPCOUNT_TABLE[words.view(np.uint16)].reshape(len(words), 4)
+    return (counts[:, 0] + counts[:, 1]) + (counts[:, 2] + counts[:, 3])
+
+
+class BinarySketch:
+    """
+    Sign-bit sketches of the embeddings, for a cheap first pass over every row.
+
+    Each row keeps one bit per dimension (whether that dimension is positive),
+    packed into uint64 words, so a 1536-dimension embedding takes 192 bytes instead
+    of 6 KB. The Hamming distance between two sketches grows with the angle
+    between the vectors, so the rows nearest a query in Hamming distance are good
+    candidates for an exact cosine re-score.
+
+    Sketches are stored word-major (one contiguous array per 64 dimensions), so a
+    scan is a bitwise_xor and a popcount over contiguous memory per word, summed
+    into the distances. The popcount uses np.bitwise_count on NumPy 2, and a
+    16-bit lookup table before that.
+
+    Rows are append-only and a full buffer is replaced by a grown copy, so a
+    frozen() view stays valid while rows are appended.
+    """
+
+    def __init__(self, dim: Optional[int] = None):
+        self._dim = dim
+        self._words = 0 if dim is None else -(-dim // 64)
+        self._buffer = None  # (words, capacity) uint64 sketches, one row per word
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes used by the stored sketches (excluding spare capacity)."""
+        return self._size * self._words * 8
+
+    def _ensure_capacity(self, required: int) -> None:
+        """Grow the buffer (by doubling) until it can hold `required` rows."""
+        capacity = 0 if self._buffer is None else self._buffer.shape[1]
+        if required <= capacity:
+            return
+        capacity = max(64, capacity)
+        while capacity < required:
+            capacity *= 2
+        new_buffer = np.zeros((self._words, capacity), dtype=np.uint64)
+        if self._buffer is not None:
+            new_buffer[:, :self._size] = self._buffer[:, :self._size]
+        self._buffer = new_buffer
+
+    def extend(self, vectors: np.ndarray) -> None:
+        """
+        Sketch and append rows.
+
+        Args:
+            vectors: A (n, dim) array of embeddings
+        """
+        if len(vectors) == 0:
+            return
+        if self._dim is None:
+            self._dim = vectors.shape[1]
+            self._words = -(-self._dim // 64)
+        self._ensure_capacity(self._size + len(vectors))
+        self._buffer[:, self._size:self._size + len(vectors)] = pack_signs(vectors, self._words).T
+        self._size += len(vectors)
+
+    def frozen(self) -> 'BinarySketch':
+        """A read-only view of the rows stored so far, sharing the buffer with this object."""
+        return copy.copy(self)
+
+    def take(self, rows: np.ndarray) -> 'BinarySketch':
+        """Build a new sketch from a subset of rows (used by compaction)."""
+        sketch = BinarySketch(self._dim)
+        if len(rows) > 0:
+            sketch._ensure_capacity(len(rows))
+            sketch._buffer[:, :len(rows)] = self._buffer[:, rows]
+            sketch._size = len(rows)
+        return sketch
+
+    def distances(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Hamming distances between the sketches of queries and every row.
+
+        Args:
+            queries: A (num_queries, dim) array of queries
+
+        Returns:
+            np.ndarray: A (num_queries, size) uint16 array of distances
+        """
+        buffer, size = self._buffer, self._size
+        query_sketches = pack_signs(queries, self._words)
+        distances = np.zeros((len(queries), size), dtype=np.uint16)
+        if size == 0:
+            return distances
+        differing = np.empty(size, dtype=np.uint64)
+        for query_sketch, query_distances in zip(query_sketches, distances):
+            for word in range(self._words):
+                np.bitwise_xor(buffer[word, :size], query_sketch[word], out=differing)
+                query_distances += popcount(differing)
+        return distances
+
+    def candidates(self, queries: np.ndarray, count: int, deleted: Optional[np.ndarray] = None) -> List[np.ndarray]:
+        """
+        Select the rows whose sketches are nearest each query.
+
+        Args:
+            queries: A (num_queries, dim) array of queries
+            count: The number of candidates per query
+            deleted: Optional (size,) mask of rows to skip
+
+        Returns:
+            List[np.ndarray]: The candidate rows of each query, in row order
+        """
+        distances = self.distances(queries)
+        if deleted is not None:
+            # No sketch can be further away than dim bits
+            distances[:, deleted] = self._words * 64 + 1
+        live = self._size - (int(deleted.sum()) if deleted is not None else 0)
+        count = min(count, live)
+        if count <= 0:
+            return [np.zeros(0, dtype=np.int64) for _ in range(len(queries))]
+        if count < self._size:
+            nearest = np.argpartition(distances, count - 1, axis=1)[:, :count]
+        else:
+            nearest = np.broadcast_to(np.arange(self._size), distances.shape)
+        rows = []
+        for query_rows in nearest:
+            query_rows = np.sort(query_rows)
+            if deleted is not None:
+                query_rows = query_rows[~deleted[query_rows]]
+            rows.append(query_rows)
+        return rows
@@ -0,0 +1,181 @@
+import copy
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+# Chunk dictionary keys stored per chunk; every other key (title, source, date_added,
+# total_chunks, ...) is a document-level field stored once per document. The
+# chunk's 'content' is kept by the vector store's text blob instead.
+CHUNK_FIELDS = ('id', 'content', 'chunk_index')
+
+
+def get_document_id(chunk_id: str) -> str:
+    """Get the document ID from a chunk ID of the form '<doc_id>-<chunk_index>'."""
+    doc_id, _, chunk_index = chunk_id.rpartition('-')
+    return doc_id if doc_id and chunk_index.isdigit() else chunk_id
+
+
+def get_chunk_document_id(document: Dict[str, Any]) -> Optional[str]:
+    """Get the ID of the document a chunk belongs to, or None if the chunk has no ID."""
+    chunk_id = document.get('id')
+    if chunk_id is None:
+        return None
+    return document.get('doc_id') or get_document_id(chunk_id)
+
+
+def get_chunk_index(document: Dict[str, Any]) -> int:
+    """Get the position of a chunk in its document, from 'chunk_index' or the suffix of its ID (0 if unknown)."""
+    chunk_index = document.get('chunk_index')
+    if isinstance(chunk_index, int) and not isinstance(chunk_index, bool):
+        return chunk_index
+    suffix = str(document.get('id', '')).rpartition('-')[2]
+    return int(suffix) if suffix.isdigit() else 0
+
+
+class ChunkTable:
+    """
+    The metadata of every chunk, stored column by column.
+
+    Document-level fields are stored once, as one dictionary per distinct set of
+    fields (in practice one per document), and every chunk refers to its
+    dictionary by number. The chunk-level fields are a list of chunk IDs (the same
+    string objects the store's ID index holds) and NumPy arrays of the position
+    of each chunk in its document. A chunk dictionary is only built by get(),
+    for chunks that are actually returned.
+
+    Chunks are append-only, and arrays that fill up are replaced by grown copies,
+    so a frozen() view keeps reading its rows while chunks are appended.
+    """
+
+    def __init__(self):
+        self.ids: List[Optional[str]] = []  # Chunk ID of every row (None for placeholder rows)
+        self._fields: List[Dict[str, Any]] = []  # Document-level fields, shared by the rows that refer to them
+        self._field_numbers: Dict[tuple, int] = {}  # Interning key of each entry in _fields -> its number
+        self._field_rows = np.zeros(64, dtype=np.int32)  # Entry in _fields of every row
+        self._chunk_indexes = np.zeros(64, dtype=np.int64)  # Position of every row in its document
+        self._has_chunk_index = np.zeros(64, dtype=bool)  # Whether the row's dictionary has a 'chunk_index'
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        return self.get(row)
+
+    def _intern(self, fields: Dict[str, Any]) -> int:
+        """Get the number of a set of document-level fields, adding it if it is new."""
+        try:
+            key = tuple(sorted(fields.items()))
+            number = self._field_numbers.get(key)
+        except TypeError:
+            # Unhashable values (e.g. lists) are stored without interning
+            key, number = None, None
+        if number is None:
+            number = len(self._fields)
+            self._fields.append(fields)
+            if key is not None:
+                self._field_numbers[key] = number
+        return number
+
+    def _grow(self, required: int) -> None:
+        """Grow the per-row arrays (by doubling) to hold `required` rows."""
+        if required <= len(self._field_rows):
+            return
+        capacity = len(self._field_rows)
+        while capacity < required:
+            capacity *= 2
+        for name in ('_field_rows', '_chunk_indexes', '_has_chunk_index'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def extend(self, documents: List[Dict[str, Any]]) -> range:
+        """
+        Append chunks given as dictionaries (their 'content' is ignored).
+
+        Args:
+            documents: The chunk dictionaries
+
+        Returns:
+            range: The row numbers of the new chunks
+        """
+        start = self._size
+        self._grow(start + len(documents))
+        for row, document in enumerate(documents, start):
+            fields = {key: value for key, value in document.items() if key not in CHUNK_FIELDS}
+            chunk_index = document.get('chunk_index')
+            has_chunk_index = isinstance(chunk_index, int) and not isinstance(chunk_index, bool)
+            if 'chunk_index' in document and not has_chunk_index:
+                fields['chunk_index'] = chunk_index  # Unusual values are kept as they are
+            number = self._intern(fields)
+            self.ids.append(document.get('id'))
+            self._field_rows[row] = number
+            self._chunk_indexes[row] = get_chunk_index(document)
+            self._has_chunk_index[row] = has_chunk_index
+        self._size = start + len(documents)
+        return range(start, self._size)
+
+    def extend_document(self, fields: Dict[str, Any], chunk_ids: List[Optional[str]],
+                        chunk_indexes: List[int]) -> range:
+        """
+        Append the chunks of one document, given as columns.
+
+        Args:
+            fields: The document-level fields shared by the chunks
+            chunk_ids: The ID of every chunk
+            chunk_indexes: The position of every chunk in the document
+
+        Returns:
+            range: The row numbers of the new chunks
+        """
+        start = self._size
+        end = start + len(chunk_ids)
+        self._grow(end)
+        self.ids.extend(chunk_ids)
+        self._field_rows[start:end] = self._intern(fields)
+        self._chunk_indexes[start:end] = chunk_indexes
+        self._has_chunk_index[start:end] = True
+        self._size = end
+        return range(start, end)
+
+    def get(self, row: int) -> Dict[str, Any]:
+        """Build the dictionary of a chunk (without its 'content')."""
+        chunk = {'id': self.ids[row]}
+        chunk.update(self._fields[self._field_rows[row]])
+        if self._has_chunk_index[row]:
+            chunk['chunk_index'] = int(self._chunk_indexes[row])
+        return chunk
+
+    def fields(self, row: int) -> Dict[str, Any]:
+        """The document-level fields of a chunk. The dictionary is shared and must not be modified."""
+        return self._fields[self._field_rows[row]]
+
+    def document_id(self, row: int) -> Optional[str]:
+        """The ID of the document a chunk belongs to (see get_chunk_document_id)."""
+        chunk_id = self.ids[row]
+        if chunk_id is None:
+            return None
+        return self._fields[self._field_rows[row]].get('doc_id') or get_document_id(chunk_id)
+
+    def chunk_indexes(self, rows: np.ndarray) -> np.ndarray:
+        """The positions of some chunks in their documents."""
+        return self._chunk_indexes[np.asarray(rows, dtype=np.int64)]
+
+    def frozen(self) -> 'ChunkTable':
+        """A read-only view of the chunks stored so far, sharing storage with this table."""
+        return copy.copy(self)
+
+    def take(self, rows: np.ndarray) -> 'ChunkTable':
+        """Build a new table from a subset of rows (used by compaction); unused field entries are dropped."""
+        rows = np.asarray(rows, dtype=np.int64)
+        table = ChunkTable()
+        table._grow(len(rows))
+        numbers, field_rows = np.unique(self._field_rows[rows], return_inverse=True)
+        for number in numbers.tolist():
+            table._intern(self._fields[number])
+        table.ids = [self.ids[row] for row in rows.tolist()]
+        table._field_rows[:len(rows)] = field_rows
+        table._chunk_indexes[:len(rows)] = self._chunk_indexes[rows]
+        table._has_chunk_index[:len(rows)] = self._has_chunk_index[rows]
+        table._size = len(rows)
+        return table
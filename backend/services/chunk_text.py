@@ -0,0 +1,117 @@
+import copy
+import tempfile
+import numpy as np
+from typing import List, Optional
+
+# Initial size of the text file; it doubles whenever it is full
+INITIAL_TEXT_BYTES = 1 << 16
+
+# UTF-8 needs at most this many bytes per character
+MAX_UTF8_BYTES = 4
+
+
+class ChunkText:
+    """
+    The text of every chunk, stored as one memory-mapped UTF-8 blob.
+
+    Row i's text is blob[offsets[i]:offsets[i + 1]], so the only per-chunk memory
+    is one int64 offset; the text itself stays in an (unlinked) scratch file and is
+    paged in by the OS only when a row is read. Only search hits, lookups and
+    rebuilds ever decode it.
+
+    Text is append-only: new bytes and offsets are written past the current size
+    before it is bumped, and the file only grows (the blob is re-mapped, never
+    moved), so a frozen() view keeps reading its rows while text is appended.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self._directory = directory
+        self._file = None
+        self._blob = None  # uint8 memory map over the text file
+        self._offsets = np.zeros(65, dtype=np.int64)  # Start of every row's text, plus the end of the last row
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of text stored (on disk / in the page cache, not in process memory)."""
+        return int(self._offsets[self._size])
+
+    def _ensure_bytes(self, required: int) -> None:
+        """Grow the text file (by doubling) until it can hold `required` bytes, and re-map it."""
+        capacity = 0 if self._blob is None else len(self._blob)
+        if required <= capacity:
+            return
+        capacity = max(INITIAL_TEXT_BYTES, capacity)
+        while capacity < required:
+            capacity *= 2
+        if self._file is None:
+            # The file is deleted as soon as it is closed; the maps keep it alive until then
+            self._file = tempfile.TemporaryFile(dir=self._directory)
+        self._file.truncate(capacity)
+        self._blob = np.memmap(self._file, dtype=np.uint8, mode='r+', shape=(capacity,))
+
+    def extend(self, texts: List[str]) -> range:
+        """
+        Append the texts of new rows.
+
+        Args:
+            texts: One string per row
+
+        Returns:
+            range: The row numbers of the new texts
+        """
+        encoded = [text.encode('utf-8') for text in texts]
+        lengths = np.fromiter((len(data) for data in encoded), dtype=np.int64, count=len(encoded))
+        start = self._size
+        end = start + len(encoded)
+        first_byte = int(self._offsets[start])
+        last_byte = first_byte + int(lengths.sum())
+
+        if end + 1 > len(self._offsets):
+            capacity = len(self._offsets)
+            while capacity < end + 1:
+                capacity = 2 * capacity
+            offsets = np.zeros(capacity, dtype=np.int64)
+            offsets[:start + 1] = self._offsets[:start + 1]
+            self._offsets = offsets
+        self._ensure_bytes(last_byte)
+        if last_byte > first_byte:
+            self._blob[first_byte:last_byte] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        self._offsets[start + 1:end + 1] = first_byte + np.cumsum(lengths)
+        self._size = end
+        return range(start, end)
+
+    def get(self, row: int, max_chars: Optional[int] = None) -> str:
+        """
+        Decode the text of one row.
+
+        Args:
+            row: The row number
+            max_chars: If given, only the first max_chars characters are decoded
+
+        Returns:
+            str: The text
+        """
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        if start == end:
+            return ''
+        if max_chars is None:
+            return bytes(self._blob[start:end]).decode('utf-8')
+        end = min(end, start + MAX_UTF8_BYTES * max_chars)
+        # A character cut off at the end of the byte range is dropped
+        return bytes(self._blob[start:end]).decode('utf-8', errors='ignore')[:max_chars]
+
+    def frozen(self) -> 'ChunkText':
+        """A read-only view of the rows stored so far, sharing the blob with this object."""
+        return copy.copy(self)
+
+    def take(self, rows: np.ndarray, block_rows: int = 4096) -> 'ChunkText':
+        """Build a new blob from a subset of rows (used by compaction)."""
+        text = ChunkText(self._directory)
+        rows = np.asarray(rows, dtype=np.int64)
+        for start in range(0, len(rows), block_rows):
+            text.extend([self.get(row) for row in rows[start:start + block_rows].tolist()])
+        return text
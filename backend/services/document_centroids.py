@@ -0,0 +1,203 @@
+import copy
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from services.embedding_matrix import top_k_indices_batch
+
+# Consecutive chunks of a document that share one centroid; longer documents get a
+# centroid per section, so a focused passage is not averaged away by the rest
+SECTION_CHUNKS = 32
+
+# Sections whose vector sum has a smaller norm than this have no usable direction
+MIN_CENTROID_NORM = 1e-6
+
+
+class DocumentCentroids:
+    """
+    Running centroids of the chunk embeddings of every document, for two-stage search.
+
+    Each document is split into sections of SECTION_CHUNKS consecutive chunks (by
+    chunk index), and every section keeps the sum and count of its chunk vectors, so
+    adding or removing a chunk updates one centroid in O(dim). A short document has
+    a single section, whose centroid is the document centroid. A document scores
+    the best cosine similarity of its sections' centroids.
+
+    The section arrays grow by doubling, and adding or removing chunks only
+    rewrites the rows of the sections they belong to, in place. Rows of the section
+    and row tables are only ever appended, so a frozen() view keeps its own set of
+    sections; the sums, counts and centroids of those sections are shared, so it
+    sees later updates to them (which only shift how documents rank, never which
+    store rows a search returns).
+    """
+
+    def __init__(self):
+        self._sections: Dict[Tuple[str, int], int] = {}  # (doc_id, section) -> section number
+        self._document_numbers: Dict[str, int] = {}  # Document ID -> document number
+        self.document_ids: List[str] = []  # Document number -> document ID
+        self._section_documents = np.zeros(64, dtype=np.int64)  # Document number of every section
+        self._row_sections = np.full(64, -1, dtype=np.int64)  # Section of every store row (-1 if none)
+        self._sums = None  # (capacity, dim) float64 sums of the chunk vectors of each section
+        self._counts = np.zeros(64, dtype=np.int64)  # Live chunks in each section
+        self.centroids = None  # (capacity, dim) normalized centroids, zero for empty sections
+        self._dim = None
+        self.num_sections = 0
+        self.num_documents = 0
+
+    @classmethod
+    def build(cls, doc_ids: List[Optional[str]], chunk_indexes: List[int], vectors: np.ndarray,
+              block_size: int = 65536) -> 'DocumentCentroids':
+        """
+        Build the centroids of a full set of store rows.
+
+        Args:
+            doc_ids: The document ID of every row (None for rows without one)
+            chunk_indexes: The position of every row in its document
+            vectors: The normalized embedding of every row
+
+        Returns:
+            DocumentCentroids: The centroids
+        """
+        centroids = cls()
+        for start in range(0, len(doc_ids), block_size):
+            end = min(start + block_size, len(doc_ids))
+            centroids.add_rows(start, doc_ids[start:end], chunk_indexes[start:end], vectors[start:end])
+        return centroids
+
+    def _section(self, doc_id: str, chunk_index: int) -> int:
+        """Get the section number of a chunk, creating the section (and document) if needed."""
+        key = (doc_id, chunk_index // SECTION_CHUNKS)
+        section = self._sections.get(key)
+        if section is not None:
+            return section
+        number = self._document_numbers.get(doc_id)
+        if number is None:
+            number = self._document_numbers[doc_id] = len(self.document_ids)
+            self.document_ids.append(doc_id)
+            self.num_documents += 1
+        section = self.num_sections
+        if section == len(self._section_documents):
+            self._grow(2 * section)
+        self._section_documents[section] = number
+        self._sections[key] = section
+        self.num_sections += 1
+        return section
+
+    def _grow(self, capacity: int) -> None:
+        """Grow the per-section arrays to `capacity` sections, copying the existing sections once."""
+        section_documents = np.zeros(capacity, dtype=np.int64)
+        section_documents[:len(self._section_documents)] = self._section_documents
+        counts = np.zeros(capacity, dtype=np.int64)
+        counts[:len(self._counts)] = self._counts
+        if self._sums is not None:
+            sums = np.zeros((capacity, self._dim), dtype=np.float64)
+            sums[:len(self._sums)] = self._sums
+            centroids = np.zeros((capacity, self._dim), dtype=np.float32)
+            centroids[:len(self.centroids)] = self.centroids
+            self._sums, self.centroids = sums, centroids
+        self._section_documents, self._counts = section_documents, counts
+    
+    def add_rows(self, first_row: int, doc_ids: List[Optional[str]], chunk_indexes: List[int],
+                 vectors: np.ndarray) -> None:
+        """
+        Add consecutive new store rows, starting at `first_row`, to their sections.
+
+        Args:
+            first_row: The row number of the first new row
+            doc_ids: The document ID of every new row (None for rows without one)
+            chunk_indexes: The position of every new row in its document
+            vectors: The normalized embeddings of the new rows
+        """
+        sections = np.array([-1 if doc_id is None else self._section(doc_id, chunk_index)
+                             for doc_id, chunk_index in zip(doc_ids, chunk_indexes)], dtype=np.int64)
+        end = first_row + len(sections)
+        if end > len(self._row_sections):
+            capacity = len(self._row_sections)
+            while capacity < end:
+                capacity *= 2
+            row_sections = np.full(capacity, -1, dtype=np.int64)
+            row_sections[:len(self._row_sections)] = self._row_sections
+            self._row_sections = row_sections
+        self._row_sections[first_row:end] = sections
+        self._update(sections, vectors, 1)
+
+    def remove_rows(self, rows: List[int], vectors: np.ndarray) -> None:
+        """
+        Take removed store rows out of their sections.
+
+        Args:
+            rows: The row numbers
+            vectors: The normalized embeddings the rows were added with
+        """
+        if len(rows) > 0:
+            self._update(self._row_sections[np.asarray(rows, dtype=np.int64)], vectors, -1)
+
+    def _update(self, sections: np.ndarray, vectors: np.ndarray, sign: int) -> None:
+        """Add (sign=1) or subtract (sign=-1) vectors from the sums of their sections and renormalize them."""
+        keep = sections >= 0
+        if not keep.any():
+            return
+        sections = sections[keep]
+        vectors = np.asarray(vectors, dtype=np.float64)[keep]
+        if self._sums is None:
+            self._dim = vectors.shape[1]
+            self._sums = np.zeros((len(self._section_documents), self._dim), dtype=np.float64)
+            self.centroids = np.zeros((len(self._section_documents), self._dim), dtype=np.float32)
+        # Sum the vectors per touched section first, so only those rows are written
+        touched, positions = np.unique(sections, return_inverse=True)
+        deltas = np.zeros((len(touched), self._dim), dtype=np.float64)
+        np.add.at(deltas, positions, sign * vectors)
+        sums = self._sums[touched] + deltas
+        counts = self._counts[touched] + sign * np.bincount(positions, minlength=len(touched))
+
+        # An emptied section is reset exactly, so rounding errors do not accumulate
+        sums[counts <= 0] = 0
+        norms = np.linalg.norm(sums, axis=1)
+        centroids = np.zeros((len(touched), self._dim), dtype=np.float32)
+        valid = norms > MIN_CENTROID_NORM
+        centroids[valid] = sums[valid] / norms[valid, None]
+        self._sums[touched] = sums
+        self._counts[touched] = counts
+        self.centroids[touched] = centroids
+
+    def frozen(self) -> 'DocumentCentroids':
+        """A read-only view of the centroids as they are now, sharing storage with this object."""
+        return copy.copy(self)
+
+    def sections_of(self, rows: np.ndarray) -> np.ndarray:
+        """The distinct sections a set of store rows belongs to."""
+        sections = self._row_sections[np.asarray(rows, dtype=np.int64)]
+        return np.unique(sections[sections >= 0])
+
+    def rank(self, queries: np.ndarray, top_documents: int,
+             sections: Optional[np.ndarray] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Rank documents by the best similarity of their section centroids to each query.
+
+        Args:
+            queries: A (num_queries, dim) array of normalized queries
+            top_documents: The number of documents to return per query
+            sections: If given, only these sections are considered (e.g. those matching a filter)
+
+        Returns:
+            List[Tuple[np.ndarray, np.ndarray]]: The best document numbers (see
+            document_ids) and their scores, per query
+        """
+        num_sections, num_documents = self.num_sections, self.num_documents
+        if num_sections == 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in range(len(queries))]
+        section_scores = queries @ self.centroids[:num_sections].T
+        excluded = self._counts[:num_sections] <= 0
+        if sections is not None:
+            outside = np.ones(num_sections, dtype=bool)
+            outside[sections] = False
+            excluded = excluded | outside
+        section_scores[:, excluded] = -np.inf
+
+        document_scores = np.full((len(queries), num_documents), -np.inf, dtype=np.float32)
+        np.maximum.at(document_scores, (np.arange(len(queries))[:, None], self._section_documents[None, :num_sections]),
+                      section_scores)
+        ranked = []
+        for scores, numbers in zip(document_scores, top_k_indices_batch(document_scores, top_documents)):
+            numbers = numbers[np.isfinite(scores[numbers])]
+            ranked.append((numbers, scores[numbers]))
+        return ranked
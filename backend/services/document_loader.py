@@ -13,7 +13,7 @@ from datetime import datetime
 import uuid
 
 # Path to knowledge base files
-from services.knowledge_base import KNOWLEDGE_BASE_DIR, get_embedding, vector_store
+from services.knowledge_base import get_embeddings, get_collection, EMBEDDING_BATCH_SIZE
 
 # Import the logging function from routes.api
 # This is a circular import, but we'll handle it by importing inside functions
@@ -195,7 +195,8 @@ def chunk_text(text: str, max_chunk_size: int = 1000, overlap: int = 200) -> Lis
     log_message(f"Chunking complete. Created {len(chunks)} chunks from {len(text)} characters")
     return chunks
 
-def add_document_from_text(text: str, title: str, source: str, doc_id: str = None) -> List[Dict[str, Any]]:
+def add_document_from_text(text: str, title: str, source: str, doc_id: str = None,
+                           collection: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     Add a document to the knowledge base from text.
     
@@ -204,6 +205,8 @@ def add_document_from_text(text: str, title: str, source: str, doc_id: str = Non
         title: The document title
         source: The document source
         doc_id: Optional document ID (will be generated if not provided)
+        collection: The collection to add the document to (the default collection if None;
+            created if it does not exist)
         
     Returns:
         List[Dict[str, Any]]: The added document chunks
@@ -215,7 +218,8 @@ def add_document_from_text(text: str, title: str, source: str, doc_id: str = Non
         log_message(f"Generated document ID: {doc_id}")
     
     # Create a directory for the document
-    doc_dir = os.path.join(KNOWLEDGE_BASE_DIR, doc_id)
+    knowledge_base = get_collection(collection, create=True)
+    doc_dir = os.path.join(knowledge_base.directory, doc_id)
     os.makedirs(doc_dir, exist_ok=True)
     log_message(f"Created document directory: {doc_dir}")
     
@@ -226,6 +230,7 @@ def add_document_from_text(text: str, title: str, source: str, doc_id: str = Non
     
     # Create document objects
     documents = []
+    embeddings = []
     log_message(f"Processing {len(text_chunks)} chunks")
     
     # Save metadata first with in_progress status
@@ -241,8 +246,8 @@ def add_document_from_text(text: str, title: str, source: str, doc_id: str = Non
     with open(os.path.join(doc_dir, "metadata.json"), "w") as f:
         json.dump(metadata, f, indent=2)
     
-    # Process chunks in batches
-    batch_size = 5
+    # Process chunks in batches, embedding each batch with one call
+    batch_size = EMBEDDING_BATCH_SIZE
     total_batches = (len(text_chunks) + batch_size - 1) // batch_size
     
     for i in range(0, len(text_chunks), batch_size):
@@ -254,29 +259,26 @@ def add_document_from_text(text: str, title: str, source: str, doc_id: str = Non
             chunk_index = i + j
             document = {
                 "id": f"{doc_id}-{chunk_index}",
+                "doc_id": doc_id,
                 "title": title,
                 "content": chunk,
                 "source": source,
+                "date_added": metadata["date_added"],
                 "chunk_index": chunk_index,
                 "total_chunks": len(text_chunks)
             }
             documents.append(document)
-            
-            # Get embedding for the document
-            embedding = get_embedding(title + " " + chunk)
-            
-            # Add document and embedding to the vector store
-            vector_store.add_document(document, embedding)
-            
-            # Save chunk to file
-            chunk_file = os.path.join(doc_dir, f"{chunk_index}.json")
-            doc_with_embedding = document.copy()
-            doc_with_embedding["embedding"] = embedding
-            with open(chunk_file, "w") as f:
-                json.dump(doc_with_embedding, f, indent=2)
+        
+        # Get embeddings for the batch
+        embeddings.extend(get_embeddings([title + " " + chunk for chunk in batch], knowledge_base.embedding_backend))
         
         # Update progress
-        log_message(f"Processed and saved batch {current_batch}/{total_batches}")
+        log_message(f"Processed batch {current_batch}/{total_batches}")
+    
+    # Append all chunks to the index segment log in one write and add them to the
+    # vector store as one snapshot, so searches never see a partially processed
+    # document; other worker processes pick the document up from the index
+    knowledge_base.publish_document(documents, embeddings)
     
     # Update metadata with final information
     metadata["chunks"] = [doc["id"] for doc in documents]
@@ -289,12 +291,13 @@ def add_document_from_text(text: str, title: str, source: str, doc_id: str = Non
     log_message(f"Document processing complete for {title}")
     return documents
 
-def load_document_from_url(url: str) -> List[Dict[str, Any]]:
+def load_document_from_url(url: str, collection: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     Load a document from a URL.
     
     Args:
         url: The URL to load the document from
+        collection: The collection to add the document to (the default collection if None)
         
     Returns:
         List of document chunks
@@ -343,7 +346,8 @@ def load_document_from_url(url: str) -> List[Dict[str, Any]]:
                 text=html_content,
                 title=filename or "Web Page",
                 source=url,
-                doc_id=doc_id
+                doc_id=doc_id,
+                collection=collection
             )
             return documents
         
@@ -362,7 +366,7 @@ def load_document_from_url(url: str) -> List[Dict[str, Any]]:
             try:
                 # Process the PDF
                 log_message(f"Processing PDF from {temp_file_path}")
-                return process_pdf(temp_file_path, filename, url)
+                return process_pdf(temp_file_path, filename, url, collection)
             finally:
                 # Clean up the temporary file
                 if os.path.exists(temp_file_path):
@@ -380,7 +384,8 @@ def load_document_from_url(url: str) -> List[Dict[str, Any]]:
                 text=text_content,
                 title=filename or "Text Document",
                 source=url,
-                doc_id=doc_id
+                doc_id=doc_id,
+                collection=collection
             )
             return documents
         
@@ -397,7 +402,7 @@ def load_document_from_url(url: str) -> List[Dict[str, Any]]:
         log_message(traceback.format_exc())
         return []
 
-def process_pdf(pdf_path, filename, source):
+def process_pdf(pdf_path, filename, source, collection=None):
     """
     Process a PDF file and add its content to the knowledge base.
     
@@ -405,6 +410,7 @@ def process_pdf(pdf_path, filename, source):
         pdf_path: Path to the PDF file
         filename: Original filename
         source: Source of the document
+        collection: The collection to add the document to (the default collection if None)
         
     Returns:
         list: List of document chunks added to the knowledge base
@@ -416,7 +422,8 @@ def process_pdf(pdf_path, filename, source):
         doc_id = str(uuid.uuid4())
         
         # Create a directory for the document
-        doc_dir = os.path.join(KNOWLEDGE_BASE_DIR, doc_id)
+        knowledge_base = get_collection(collection, create=True)
+        doc_dir = os.path.join(knowledge_base.directory, doc_id)
         os.makedirs(doc_dir, exist_ok=True)
         
         # Extract text from PDF
@@ -475,7 +482,8 @@ def process_pdf(pdf_path, filename, source):
         
         # Create document objects and add to vector store in batches
         documents = []
-        batch_size = 5  # Process 5 chunks at a time
+        embeddings = []
+        batch_size = EMBEDDING_BATCH_SIZE  # Embed this many chunks per call
         total_batches = (len(text_chunks) + batch_size - 1) // batch_size
         
         log_message(f"Starting to process {len(text_chunks)} chunks in {total_batches} batches")
@@ -490,35 +498,27 @@ def process_pdf(pdf_path, filename, source):
                 chunk_index = i + j
                 document = {
                     "id": f"{doc_id}-{chunk_index}",
+                    "doc_id": doc_id,
                     "title": filename,
                     "content": chunk,
                     "source": source,
+                    "date_added": metadata["date_added"],
                     "chunk_index": chunk_index,
                     "total_chunks": len(text_chunks)
                 }
                 batch_docs.append(document)
                 documents.append(document)
-                
-                # Get embedding for the document
-                embedding = get_embedding(filename + " " + chunk)
-                
-                # Add document and embedding to the vector store
-                vector_store.add_document(document, embedding)
-                
-                # Save chunk to file
-                chunk_file = os.path.join(doc_dir, f"{chunk_index}.json")
-                doc_with_embedding = document.copy()
-                doc_with_embedding["embedding"] = embedding
-                with open(chunk_file, "w") as f:
-                    json.dump(doc_with_embedding, f, indent=2)
             
-            # Update progress after each batch
-            log_message(f"Processed and saved batch {current_batch}/{total_batches}")
+            # Get embeddings for the batch
+            embeddings.extend(get_embeddings([filename + " " + chunk for chunk in batch], knowledge_base.embedding_backend))
             
-            # Update metadata with progress
-            metadata["processing_progress"] = f"{current_batch}/{total_batches} batches"
-            with open(os.path.join(doc_dir, "metadata.json"), "w") as f:
-                json.dump(metadata, f, indent=2)
+            # Update progress after each batch
+            log_message(f"Processed batch {current_batch}/{total_batches}")
+        
+        # Append all chunks to the index segment log in one write and add them to the
+        # vector store as one snapshot, so searches never see a partially processed
+        # document; other worker processes pick the document up from the index
+        knowledge_base.publish_document(documents, embeddings)
         
         # Update metadata with final chunk count
         metadata["total_chunks"] = len(text_chunks)
@@ -539,7 +539,7 @@ def process_pdf(pdf_path, filename, source):
         log_message("Document processing failed")
         return []
 
-def load_document_from_file(filename, file_content, file_extension):
+def load_document_from_file(filename, file_content, file_extension, collection=None):
     """
     Load a document from a file.
     
@@ -547,6 +547,7 @@ def load_document_from_file(filename, file_content, file_extension):
         filename: The name of the file
         file_content: The content of the file
         file_extension: The extension of the file
+        collection: The collection to add the document to (the default collection if None)
         
     Returns:
         list: List of document chunks added to the knowledge base
@@ -564,7 +565,7 @@ def load_document_from_file(filename, file_content, file_extension):
             
             try:
                 # Process the PDF
-                return process_pdf(temp_file_path, filename, f"Uploaded file: {filename}")
+                return process_pdf(temp_file_path, filename, f"Uploaded file: {filename}", collection)
             finally:
                 # Clean up the temporary file
                 if os.path.exists(temp_file_path):
@@ -579,7 +580,8 @@ def load_document_from_file(filename, file_content, file_extension):
                 text=text_content,
                 title=filename,
                 source=f"Uploaded file: {filename}",
-                doc_id=doc_id
+                doc_id=doc_id,
+                collection=collection
             )
             
             return documents
@@ -594,17 +596,18 @@ def load_document_from_file(filename, file_content, file_extension):
         log_message(traceback.format_exc())
         return []
 
-def get_document_metadata(doc_id: str) -> Optional[Dict[str, Any]]:
+def get_document_metadata(doc_id: str, collection: Optional[str] = None) -> Optional[Dict[str, Any]]:
     """
     Get metadata for a document.
     
     Args:
         doc_id: The document ID
+        collection: The collection of the document (the default collection if None)
         
     Returns:
         Optional[Dict[str, Any]]: The document metadata, or None if not found
     """
-    doc_dir = os.path.join(KNOWLEDGE_BASE_DIR, doc_id)
+    doc_dir = os.path.join(get_collection(collection).directory, doc_id)
     metadata_file = os.path.join(doc_dir, "metadata.json")
     
     if not os.path.exists(metadata_file):
@@ -613,20 +616,24 @@ def get_document_metadata(doc_id: str) -> Optional[Dict[str, Any]]:
     with open(metadata_file, "r") as f:
         return json.load(f)
 
-def list_documents() -> List[Dict[str, Any]]:
+def list_documents(collection: Optional[str] = None) -> List[Dict[str, Any]]:
     """
-    List all documents in the knowledge base.
+    List all documents in a collection of the knowledge base.
+    
+    Args:
+        collection: The collection (the default collection if None)
     
     Returns:
         List[Dict[str, Any]]: List of document metadata
     """
     documents = []
     
-    for item in os.listdir(KNOWLEDGE_BASE_DIR):
+    directory = get_collection(collection).directory
+    for item in os.listdir(directory):
         if item == ".gitkeep":
             continue
             
-        doc_dir = os.path.join(KNOWLEDGE_BASE_DIR, item)
+        doc_dir = os.path.join(directory, item)
         if os.path.isdir(doc_dir):
             metadata_file = os.path.join(doc_dir, "metadata.json")
             if os.path.exists(metadata_file):
@@ -0,0 +1,439 @@
+import os
+import math
+import time
+import random
+import hashlib
+import functools
+import threading
+import numpy as np
+from collections import Counter, deque
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+import openai
+import requests
+
+from services.lexical_index import tokenize
+
+# Dimension of the hashed word embeddings made by simple_embedding; every word adds its
+# weight to the SIMPLE_EMBEDDING_HASHES dimensions given by the 16 bytes of its MD5 digest
+SIMPLE_EMBEDDING_DIM = 128
+SIMPLE_EMBEDDING_HASHES = 16
+# Number of distinct words whose embedding dimensions are cached, so a word is hashed
+# once per process while it stays in the cache
+WORD_BUCKET_CACHE_SIZE = 65536
+
+# Backend specifications (see create_embedding_backend): the local hash embeddings,
+# an OpenAI embedding model ('openai:<model>'), or an HTTP embedding server (its URL)
+HASH_BACKEND_ID = f'simple-hash-{SIMPLE_EMBEDDING_DIM}'
+HASH_BACKEND_ALIASES = ('hash', HASH_BACKEND_ID)
+OPENAI_BACKEND_PREFIX = 'openai'
+DEFAULT_OPENAI_MODEL = 'text-embedding-ada-002'
+# Dimensions of the OpenAI embedding models; other models report theirs with the first response
+OPENAI_MODEL_DIMS = {
+    'text-embedding-ada-002': 1536,
+    'text-embedding-3-small': 1536,
+    'text-embedding-3-large': 3072
+}
+
+# A remote backend waits this long (in seconds) after the first queued text for more
+# concurrent requests, and sends at most MAX_BATCH_SIZE texts per request
+BATCH_WINDOW = 0.005
+MAX_BATCH_SIZE = 256
+# Requests a remote backend has in flight at once
+MAX_CONCURRENCY = 4
+# Failed requests are retried this many times, waiting BACKOFF_BASE * 2^attempt seconds
+# (with jitter, at most BACKOFF_MAX, or as long as the server's Retry-After asks)
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+# Seconds before a request to a remote backend times out
+REQUEST_TIMEOUT = 30.0
+# Number of recent request latencies kept for the latency percentiles
+LATENCY_SAMPLES = 1024
+
+# HTTP statuses worth retrying: rate limited, or a server error that may be transient
+RETRYABLE_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+@functools.lru_cache(maxsize=WORD_BUCKET_CACHE_SIZE)
+def get_word_buckets(word: str) -> bytes:
+    """The embedding dimensions a word adds its weight to (the bytes of its MD5 digest, modulo the dimension)."""
+    return bytes(byte % SIMPLE_EMBEDDING_DIM for byte in hashlib.md5(word.encode('utf-8')).digest())
+
+
+def hashed_word_embeddings(texts: List[str]) -> np.ndarray:
+    """
+    Compute the simple embeddings of several texts as a float64 matrix.
+
+    Every distinct word of a text (see lexical_index.tokenize) adds log(count + 1)
+    to each of its dimensions, and the rows are L2-normalized. The weights are
+    summed with np.bincount, which adds them in input order, and the squared norms
+    with a cumulative sum, so every value is the same float that adding one word
+    and one dimension at a time gives.
+
+    Args:
+        texts: The texts to embed
+
+    Returns:
+        np.ndarray: A (len(texts), SIMPLE_EMBEDDING_DIM) float64 array (zero rows for texts without words)
+    """
+    words = []  # The distinct words of every text, text by text, in order of first occurrence
+    counts = []  # How often each of them occurs in its text
+    text_sizes = []  # How many distinct words each text has
+    for text in texts:
+        word_counts = Counter(tokenize(text))
+        words.extend(word_counts)
+        counts.extend(word_counts.values())
+        text_sizes.append(len(word_counts))
+
+    if not words:
+        return np.zeros((len(texts), SIMPLE_EMBEDDING_DIM), dtype=np.float64)
+    # Offset the dimensions of each word by its text's row, so one bincount fills the whole matrix
+    buckets = np.frombuffer(b''.join(map(get_word_buckets, words)), dtype=np.uint8).reshape(len(words), SIMPLE_EMBEDDING_HASHES)
+    buckets = buckets + np.repeat(np.arange(len(texts)) * SIMPLE_EMBEDDING_DIM, text_sizes)[:, None]
+    # Weights come from math.log, which np.log does not always match to the last bit
+    counts = np.array(counts)
+    log_weights = np.array([math.log(count + 1) for count in range(int(counts.max()) + 1)])
+    weights = np.repeat(log_weights[counts], SIMPLE_EMBEDDING_HASHES)
+    embeddings = np.bincount(buckets.ravel(), weights=weights,
+                             minlength=len(texts) * SIMPLE_EMBEDDING_DIM).reshape(len(texts), SIMPLE_EMBEDDING_DIM)
+    norms = np.sqrt(np.cumsum(embeddings * embeddings, axis=1)[:, -1:])
+    np.divide(embeddings, norms, out=embeddings, where=norms > 0)
+    return embeddings
+
+
+# Simple embedding function (for demonstration)
+def simple_embedding(text: str) -> List[float]:
+    """
+    Convert text to a simple embedding vector.
+
+    This is an improved version that tries to capture more semantic meaning
+    by using word-level hashing and TF-IDF like weighting.
+    """
+    return hashed_word_embeddings([text])[0].tolist()
+
+
+def simple_embeddings(texts: List[str]) -> np.ndarray:
+    """
+    Convert several texts to simple embedding vectors at once.
+
+    Args:
+        texts: The texts to embed
+
+    Returns:
+        np.ndarray: A (len(texts), 128) float32 array; row i is simple_embedding(texts[i]) as float32
+    """
+    return hashed_word_embeddings(texts).astype(np.float32)
+
+
+class EmbeddingRequestError(Exception):
+    """A failed request to a remote embedding backend, and whether (and after how long) to retry it."""
+
+    def __init__(self, message: str, retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given in seconds (HTTP dates are ignored)."""
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class EmbeddingBackend:
+    """
+    A model that turns texts into embeddings.
+
+    `id` names the model in index manifests and embedding cache keys, so it must
+    change whenever the vectors would; `dim` is the embedding dimension, or None
+    for a remote model that has not answered yet.
+    """
+
+    id: str = ''
+    dim: Optional[int] = None
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed several texts.
+
+        Args:
+            texts: The texts to embed
+
+        Returns:
+            np.ndarray: A (len(texts), dim) float32 array of embeddings
+        """
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        """Report the backend and its usage."""
+        return {'id': self.id, 'dim': self.dim}
+
+
+class HashEmbeddingBackend(EmbeddingBackend):
+    """The local hashed word embeddings of simple_embeddings (no model, no network)."""
+
+    id = HASH_BACKEND_ID
+    dim = SIMPLE_EMBEDDING_DIM
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return simple_embeddings(texts)
+
+
+class RemoteEmbeddingBackend(EmbeddingBackend):
+    """
+    A batching, rate-aware client for an embedding model behind an API.
+
+    Concurrent embed() calls (e.g. several Flask requests embedding their queries)
+    are queued and micro-batched: a dispatcher thread waits up to `batch_window`
+    seconds after the first queued text for more, then sends up to
+    `max_batch_size` texts in one request. At most `max_concurrency` requests are
+    in flight; while they all are, new texts keep queueing and go out together
+    in the next request. Calls larger than a batch are split across requests.
+
+    A request that fails with a retryable error (rate limiting, a transient
+    server error, a timeout or a dropped connection) is retried up to
+    `max_retries` times with exponential backoff and jitter, waiting at least as
+    long as the server's Retry-After asks. The latency of every request is
+    recorded for stats().
+
+    Subclasses implement _request().
+    """
+
+    def __init__(self, dim: Optional[int] = None, batch_window: float = BATCH_WINDOW,
+                 max_batch_size: int = MAX_BATCH_SIZE, max_concurrency: int = MAX_CONCURRENCY,
+                 max_retries: int = MAX_RETRIES, backoff_base: float = BACKOFF_BASE, timeout: float = REQUEST_TIMEOUT):
+        if max_batch_size < 1:
+            raise ValueError(f"Invalid embedding batch size: {max_batch_size}")
+        if max_concurrency < 1:
+            raise ValueError(f"Invalid embedding request concurrency: {max_concurrency}")
+        self.dim = dim
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+        self._pid = None
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        # Requests sent (including failed attempts), batches and texts embedded, retried attempts, and failed batches
+        self._counters = {'requests': 0, 'batches': 0, 'texts': 0, 'retries': 0, 'errors': 0}
+
+    def _start(self) -> None:
+        """Start the dispatcher thread (again in a forked process, which does not inherit threads)."""
+        if self._pid == os.getpid():
+            return
+        with self._stats_lock:
+            if self._pid == os.getpid():
+                return
+            self._pending: deque = deque()  # (texts, future) of queued calls, in arrival order
+            self._pending_ready = threading.Condition()
+            self._slots = threading.BoundedSemaphore(self.max_concurrency)
+            threading.Thread(target=self._dispatch, name='embedding-dispatcher', daemon=True).start()
+            self._pid = os.getpid()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        self._start()
+        futures = []
+        with self._pending_ready:
+            for start in range(0, len(texts), self.max_batch_size):
+                future = Future()
+                self._pending.append((texts[start:start + self.max_batch_size], future))
+                futures.append(future)
+            self._pending_ready.notify()
+        return np.concatenate([future.result() for future in futures])
+
+    def _dispatch(self) -> None:
+        """Collect queued calls into batches and send each batch on its own thread, forever."""
+        while True:
+            with self._pending_ready:
+                while not self._pending:
+                    self._pending_ready.wait()
+            # Wait for a free request slot, then give concurrent callers the batch window to join
+            self._slots.acquire()
+            deadline = time.monotonic() + self.batch_window
+            with self._pending_ready:
+                while sum(len(texts) for texts, _ in self._pending) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._pending_ready.wait(remaining)
+                batch = []
+                size = 0
+                while self._pending and size + len(self._pending[0][0]) <= self.max_batch_size:
+                    texts, future = self._pending.popleft()
+                    batch.append((texts, future))
+                    size += len(texts)
+            threading.Thread(target=self._send, args=(batch,), daemon=True).start()
+
+    def _send(self, batch: List[Tuple[List[str], Future]]) -> None:
+        """Embed one batch of queued calls with a single request and hand each call its rows."""
+        try:
+            texts = [text for call_texts, _ in batch for text in call_texts]
+            vectors = self._request_with_retries(texts)
+            start = 0
+            for call_texts, future in batch:
+                future.set_result(vectors[start:start + len(call_texts)])
+                start += len(call_texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
+
+    def _request_with_retries(self, texts: List[str]) -> np.ndarray:
+        """Send one request, retrying retryable failures with exponential backoff."""
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                vectors = np.asarray(self._request(texts), dtype=np.float32)
+                if vectors.ndim != 2 or len(vectors) != len(texts) or (self.dim and vectors.shape[1] != self.dim):
+                    raise EmbeddingRequestError(f"{self.id} returned embeddings of shape {vectors.shape} "
+                                                f"for {len(texts)} texts (expected dimension {self.dim})")
+            except EmbeddingRequestError as e:
+                with self._stats_lock:
+                    self._latencies.append(time.perf_counter() - started)
+                    self._counters['requests'] += 1
+                    if not e.retryable or attempt == self.max_retries:
+                        self._counters['errors'] += 1
+                        raise
+                    self._counters['retries'] += 1
+                delay = min(BACKOFF_MAX, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+                time.sleep(max(delay, e.retry_after or 0.0))
+                continue
+            self.dim = self.dim or int(vectors.shape[1])
+            with self._stats_lock:
+                self._latencies.append(time.perf_counter() - started)
+                self._counters['requests'] += 1
+                self._counters['batches'] += 1
+                self._counters['texts'] += len(texts)
+            return vectors
+
+    def _request(self, texts: List[str]) -> np.ndarray:
+        """
+        Send one embedding request.
+
+        Raises:
+            EmbeddingRequestError: If the request failed (retryable or not)
+        """
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            latencies = np.array(self._latencies) * 1000
+            stats = {'id': self.id, 'dim': self.dim, **self._counters}
+        stats['mean_batch_size'] = stats['texts'] / stats['batches'] if stats['batches'] else None
+        # Latency of recent requests, including failed attempts
+        stats['latency_ms'] = {
+            'mean': float(latencies.mean()),
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'max': float(latencies.max())
+        } if len(latencies) else None
+        return stats
+
+
+class OpenAIEmbeddingBackend(RemoteEmbeddingBackend):
+    """
+    OpenAI's embedding models, through the openai client.
+
+    The client's own retries are turned off, since RemoteEmbeddingBackend retries.
+    OPENAI_BASE_URL points the client at any OpenAI-compatible server.
+    """
+
+    def __init__(self, model: str = DEFAULT_OPENAI_MODEL, dim: Optional[int] = None, **options):
+        super().__init__(dim=dim or OPENAI_MODEL_DIMS.get(model), **options)
+        self.model = model
+        self.id = f"{OPENAI_BACKEND_PREFIX}:{model}"
+        self._client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0, timeout=self.timeout)
+
+    def _request(self, texts: List[str]) -> np.ndarray:
+        try:
+            response = self._client.embeddings.create(input=texts, model=self.model)
+        except (openai.RateLimitError, openai.InternalServerError) as e:
+            raise EmbeddingRequestError(f"OpenAI embeddings: {str(e)}", retryable=True,
+                                        retry_after=parse_retry_after(e.response.headers.get('retry-after')))
+        except openai.APIConnectionError as e:  # Includes timeouts
+            raise EmbeddingRequestError(f"OpenAI embeddings: {str(e)}", retryable=True)
+        except openai.OpenAIError as e:
+            raise EmbeddingRequestError(f"OpenAI embeddings: {str(e)}")
+        items = sorted(response.data, key=lambda item: item.index)
+        return np.array([item.embedding for item in items], dtype=np.float32)
+
+
+class HTTPEmbeddingBackend(RemoteEmbeddingBackend):
+    """
+    An embedding server on the local network, such as embedding_stub_server.py.
+
+    Requests are OpenAI-style: a POST of {"input": [...texts], "model": model} to
+    the URL, answered by {"data": [{"index": i, "embedding": [...]}, ...]}.
+    The URL identifies the model (in the backend ID), so a server must not change
+    models behind a URL that indexes were built with.
+    """
+
+    def __init__(self, url: str, model: Optional[str] = None, dim: Optional[int] = None, **options):
+        super().__init__(dim=dim, **options)
+        self.url = url
+        self.model = model
+        self.id = url
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        """The HTTP session (with its keep-alive connection) of the calling thread."""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _request(self, texts: List[str]) -> np.ndarray:
+        payload = {'input': texts}
+        if self.model:
+            payload['model'] = self.model
+        try:
+            response = self._session().post(self.url, json=payload, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise EmbeddingRequestError(f"Embedding server {self.url}: {str(e)}", retryable=True)
+        if response.status_code != 200:
+            raise EmbeddingRequestError(f"Embedding server {self.url} returned HTTP {response.status_code}",
+                                        retryable=response.status_code in RETRYABLE_STATUSES,
+                                        retry_after=parse_retry_after(response.headers.get('Retry-After')))
+        try:
+            items = sorted(response.json()['data'], key=lambda item: item['index'])
+            return np.array([item['embedding'] for item in items], dtype=np.float32)
+        except (ValueError, KeyError, TypeError) as e:
+            raise EmbeddingRequestError(f"Embedding server {self.url} returned an invalid response: {str(e)}")
+
+
+def create_embedding_backend(spec: str, **options) -> EmbeddingBackend:
+    """
+    Create an embedding backend from its specification.
+
+    Args:
+        spec: 'hash' (or 'simple-hash-128') for the local hash embeddings, 'openai' or
+            'openai:<model>' for an OpenAI embedding model, or the http(s) URL of an
+            embedding server
+        **options: Options of remote backends (dim, batch_window, max_batch_size,
+            max_concurrency, max_retries, backoff_base, timeout, and model for HTTP)
+
+    Returns:
+        EmbeddingBackend: The backend; its `id` is the canonical specification
+
+    Raises:
+        ValueError: If the specification is not recognized
+    """
+    spec = (spec or '').strip()
+    if spec in HASH_BACKEND_ALIASES:
+        return HashEmbeddingBackend()
+    if spec == OPENAI_BACKEND_PREFIX or spec.startswith(f"{OPENAI_BACKEND_PREFIX}:"):
+        options.pop('model', None)
+        return OpenAIEmbeddingBackend(spec.partition(':')[2] or DEFAULT_OPENAI_MODEL, **options)
+    if spec.startswith(('http://', 'https://')):
+        return HTTPEmbeddingBackend(spec, **options)
+    raise ValueError(f"Unknown embedding backend: {spec!r}")
@@ -0,0 +1,280 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# When the cache is over its size limit, the least recently used entries are evicted
+# until it is down to this fraction of the limit, so eviction runs once per many inserts
+EVICTION_TARGET = 0.9
+
+# How long (in seconds) a connection waits for another process to release the database lock
+BUSY_TIMEOUT = 10.0
+
+# Counting the entries scans the whole table, so each process keeps an estimate of the
+# count and only counts exactly when the estimate crosses the size limit, or after this
+# many of its own inserts (to catch up with the inserts of other processes)
+SIZE_CHECK_INTERVAL = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    backend TEXT NOT NULL,
+    key BLOB NOT NULL,
+    vector BLOB NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (backend, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+"""
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text for the cache key: whitespace runs become single spaces, and the ends are stripped."""
+    return ' '.join(text.split())
+
+
+def text_key(text: str) -> bytes:
+    """The cache key of a text: the SHA-256 digest of its normalized form."""
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).digest()
+
+
+class EmbeddingCache:
+    """
+    A persistent, size-bounded cache of embeddings in an SQLite file.
+
+    Entries are keyed by the embedding backend's ID and the SHA-256 digest of the
+    normalized text, so re-ingesting a document (or rebuilding the index) only
+    embeds chunks whose text changed, and switching backends never returns
+    vectors of another model. Vectors are stored as float32 bytes.
+
+    The database uses write-ahead logging, so any number of worker processes can
+    read while one writes, and every thread of every process opens its own
+    connection. Lookups refresh the entries' last use time; once the cache holds
+    more than `max_entries`, the least recently used entries are evicted. The
+    entries are only counted when this process's estimate of the count says the
+    cache may be full (see SIZE_CHECK_INTERVAL), so with several writers the cache
+    can briefly run over its limit by up to their recent inserts.
+
+    Errors from the database (e.g. a lock held for longer than BUSY_TIMEOUT) are
+    logged and treated as misses, so the cache never fails an embedding call.
+    Hit and miss counters are kept per process.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        if max_entries < 1:
+            raise ValueError(f"Invalid embedding cache size: {max_entries}")
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Estimated number of entries (None until first counted), and inserts since the last count
+        self._estimated_size = None
+        self._inserts_since_count = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        """The connection of the calling thread, opened on first use (and again in a forked process)."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.executescript(SCHEMA)
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def _count(self, hits: int, misses: int) -> None:
+        with self._stats_lock:
+            self.hits += hits
+            self.misses += misses
+
+    def get_many(self, backend: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Look up the embeddings of several texts.
+
+        Args:
+            backend: The ID of the embedding backend
+            texts: The texts
+
+        Returns:
+            List[Optional[np.ndarray]]: The cached float32 embedding of each text, or None for a miss
+        """
+        keys = [text_key(text) for text in texts]
+        found: Dict[bytes, np.ndarray] = {}
+        try:
+            connection = self._connection()
+            # Stay well under SQLite's limit on the number of query parameters
+            for start in range(0, len(keys), 500):
+                batch = list(set(keys[start:start + 500]))
+                placeholders = ','.join('?' * len(batch))
+                rows = connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE backend = ? AND key IN ({placeholders})",
+                    [backend] + batch).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+                if rows:
+                    connection.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE backend = ? AND key IN ({placeholders})",
+                        [time.time_ns(), backend] + batch)
+        except sqlite3.Error as e:
+            print(f"Error reading the embedding cache: {str(e)}")
+        vectors = [found.get(key) for key in keys]
+        hits = sum(vector is not None for vector in vectors)
+        self._count(hits, len(vectors) - hits)
+        return vectors
+
+    def _needs_count(self, inserted: int) -> bool:
+        """Record `inserted` new entries and check whether the entries should be counted exactly."""
+        with self._stats_lock:
+            self._inserts_since_count += inserted
+            if self._estimated_size is not None:
+                self._estimated_size += inserted
+            return (self._estimated_size is None or self._estimated_size > self.max_entries
+                    or self._inserts_since_count >= SIZE_CHECK_INTERVAL)
+
+    def put_many(self, backend: str, texts: List[str], vectors: np.ndarray) -> None:
+        """
+        Store the embeddings of several texts, evicting old entries if the cache is full.
+
+        Args:
+            backend: The ID of the embedding backend
+            texts: The texts
+            vectors: One embedding per text
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        now = time.time_ns()
+        rows = [(backend, text_key(text), vector.tobytes(), now) for text, vector in zip(texts, vectors)]
+        if not rows:
+            return
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute('BEGIN IMMEDIATE')
+                connection.executemany(
+                    "INSERT OR REPLACE INTO embeddings (backend, key, vector, last_used) VALUES (?, ?, ?, ?)", rows)
+                # Replaced entries are counted as new, so the estimate never lags this process's inserts
+                if not self._needs_count(len(rows)):
+                    return
+                size = connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                excess = 0
+                if size > self.max_entries:
+                    excess = size - int(self.max_entries * EVICTION_TARGET)
+                    connection.execute(
+                        "DELETE FROM embeddings WHERE (backend, key) IN "
+                        "(SELECT backend, key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,))
+                with self._stats_lock:
+                    self.evictions += excess
+                    self._estimated_size = size - excess
+                    self._inserts_since_count = 0
+        except sqlite3.Error as e:
+            print(f"Error writing the embedding cache: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Report the cache size and this process's hit rate."""
+        try:
+            entries = self._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'evictions': self.evictions
+            }
+
+
+class QueryEmbeddingCache:
+    """
+    A bounded in-process LRU cache of query embeddings, with an optional time to live.
+
+    Entries are keyed by the embedding backend's ID and the normalized query text,
+    so a repeated question skips the embedding model (and the persistent cache's
+    database) entirely. The least recently used entry is evicted once the cache
+    holds `max_entries`, and with a `ttl` an entry older than `ttl` seconds is a
+    miss. All methods are thread-safe.
+    """
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None):
+        if max_entries < 1:
+            raise ValueError(f"Invalid query embedding cache size: {max_entries}")
+        self.max_entries = max_entries
+        self.ttl = ttl or None
+        self._entries: 'OrderedDict[Tuple[str, str], Tuple[float, np.ndarray]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, backend: str, text: str) -> Optional[np.ndarray]:
+        """
+        Look up the embedding of a query.
+
+        Args:
+            backend: The ID of the embedding backend
+            text: The query text
+
+        Returns:
+            Optional[np.ndarray]: The cached (read-only) embedding, or None for a miss
+        """
+        key = (backend, normalize_text(text))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, backend: str, text: str, vector: np.ndarray) -> None:
+        """
+        Store the embedding of a query, evicting the least recently used entry if the cache is full.
+
+        Args:
+            backend: The ID of the embedding backend
+            text: The query text
+            vector: The embedding
+        """
+        vector = np.array(vector, dtype=np.float32)
+        vector.flags.writeable = False
+        key = (backend, normalize_text(text))
+        with self._lock:
+            self._entries[key] = (time.monotonic(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Report the cache size and hit rate."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
@@ -0,0 +1,410 @@
+import os
+import tempfile
+import numpy as np
+from typing import List, Optional, Sequence, Union
+
+# Anything that can be turned into a 1-D vector of floats
+VectorLike = Union[Sequence[float], np.ndarray]
+
+
+def normalize_vector(vector: VectorLike) -> np.ndarray:
+    """
+    Convert a vector to a contiguous float32 array with unit L2 norm.
+
+    Zero vectors are returned unchanged so they simply score 0 against everything.
+
+    Args:
+        vector: The vector to normalize
+
+    Returns:
+        np.ndarray: The normalized float32 vector
+    """
+    array = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = float(np.linalg.norm(array))
+    if norm > 0:
+        array = array / norm
+    return np.ascontiguousarray(array, dtype=np.float32)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Select the indices of the k highest scores, sorted by descending score.
+
+    Uses argpartition so only the k selected scores are fully sorted.
+
+    Args:
+        scores: A 1-D array of scores
+        k: The number of indices to return
+
+    Returns:
+        np.ndarray: Up to k indices into `scores`
+    """
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(n)
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def top_k_indices_batch(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Select the top-k indices for every row of a 2-D score matrix.
+
+    Args:
+        scores: A (num_queries, num_rows) array of scores
+        k: The number of indices to return per query
+
+    Returns:
+        np.ndarray: A (num_queries, min(k, num_rows)) array of indices, each row
+        sorted by descending score
+    """
+    num_queries, n = scores.shape
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros((num_queries, 0), dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(n), (num_queries, 1))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class RowBlocks:
+    """
+    A read-only (size, dim) float32 matrix made of consecutive blocks of rows.
+
+    Holds e.g. the memory-mapped vectors of several index segments followed by the
+    rows appended since, without joining them into one private copy. Indexing with a
+    row, a slice or an array of rows works as on an ndarray: a slice inside one
+    block is a view of it, anything spanning blocks is gathered into a new array.
+    Score it with score_rows(), which multiplies block by block; np.asarray() joins
+    every block into one copy.
+    """
+
+    def __init__(self, blocks: List[np.ndarray]):
+        self.shape = (sum(len(block) for block in blocks), blocks[0].shape[1])
+        self.blocks = [block for block in blocks if len(block) > 0]
+        self.offsets = np.cumsum([0] + [len(block) for block in self.blocks])
+        self.dtype = np.dtype(np.float32)
+        self.ndim = 2
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        array = np.concatenate(self.blocks) if self.blocks else np.zeros(self.shape, dtype=np.float32)
+        return array if dtype is None else array.astype(dtype, copy=False)
+
+    def _block(self, row: int) -> int:
+        """The block holding a row."""
+        return int(np.searchsorted(self.offsets, row, side='right')) - 1
+
+    def _rows(self, start: int, stop: int) -> np.ndarray:
+        """Rows start to stop: a view if they are in one block, otherwise a joined copy."""
+        if start >= stop:
+            return np.zeros((0, self.shape[1]), dtype=np.float32)
+        first, last = self._block(start), self._block(stop - 1)
+        if first == last:
+            offset = self.offsets[first]
+            return self.blocks[first][start - offset:stop - offset]
+        return np.concatenate([
+            self.blocks[block][max(start, self.offsets[block]) - self.offsets[block]:
+                               min(stop, self.offsets[block + 1]) - self.offsets[block]]
+            for block in range(first, last + 1)
+        ])
+
+    def __getitem__(self, key) -> np.ndarray:
+        if isinstance(key, (int, np.integer)):
+            row = int(key) + len(self) if key < 0 else int(key)
+            if not 0 <= row < len(self):
+                raise IndexError(f"Row {key} out of range for matrix with {len(self)} rows")
+            block = self._block(row)
+            return self.blocks[block][row - self.offsets[block]]
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return self._rows(start, stop)
+            key = np.arange(start, stop, step)
+
+        rows = np.asarray(key)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        rows = rows.astype(np.int64, copy=False)
+        rows = np.where(rows < 0, rows + len(self), rows)
+        vectors = np.empty((len(rows), self.shape[1]), dtype=np.float32)
+        blocks = np.searchsorted(self.offsets, rows, side='right') - 1
+        for block in np.unique(blocks).tolist():
+            selected = blocks == block
+            vectors[selected] = self.blocks[block][rows[selected] - self.offsets[block]]
+        return vectors
+
+
+def score_rows(queries: np.ndarray, array: Union[np.ndarray, RowBlocks], start: int = 0,
+               end: Optional[int] = None) -> np.ndarray:
+    """
+    Compute queries @ array[start:end].T, block by block for a RowBlocks matrix.
+
+    Args:
+        queries: A (num_queries, dim) array of normalized queries
+        array: The (size, dim) normalized rows
+        start: The first row to score
+        end: The row after the last one to score (defaults to every row)
+
+    Returns:
+        np.ndarray: A (num_queries, end - start) array of similarities
+    """
+    end = len(array) if end is None else end
+    if not isinstance(array, RowBlocks):
+        return queries @ array[start:end].T
+    scores = np.empty((len(queries), max(0, end - start)), dtype=np.result_type(queries.dtype, np.float32))
+    for block, offset in zip(array.blocks, array.offsets[:-1].tolist()):
+        block_start, block_end = max(start, offset), min(end, offset + len(block))
+        if block_start < block_end:
+            scores[:, block_start - start:block_end - start] = queries @ block[block_start - offset:block_end - offset].T
+    return scores
+
+
+class EmbeddingMatrix:
+    """
+    A growable, contiguous float32 matrix of L2-normalized embedding rows.
+
+    Rows are normalized once when they are appended, so cosine similarity against
+    a normalized query is a single matrix-vector product. Capacity doubles when the
+    buffer is full, which keeps appends amortized O(1) without ever converting the
+    whole corpus on the query path.
+
+    If `backing_dir` is given, the buffer is a memory-mapped scratch file in that
+    directory instead of anonymous memory, so rows only occupy (evictable) page
+    cache while they are being read.
+
+    A matrix made with from_array() keeps the given rows as a read-only base and
+    only puts rows appended later in its buffer, so a memory-mapped index stays
+    shared with other processes however many rows are added after it. `array` is
+    then a RowBlocks matrix once there is more than one block.
+    """
+
+    def __init__(self, dim: Optional[int] = None, initial_capacity: int = 64, backing_dir: Optional[str] = None):
+        self._dim = dim
+        self._initial_capacity = max(1, initial_capacity)
+        self._backing_dir = backing_dir
+        self._size = 0
+        self._base = []  # Read-only blocks holding the first rows (see from_array)
+        self._base_rows = 0
+        self._buffer = None  # Rows after the base
+        if dim is not None:
+            self._buffer = self._allocate(self._initial_capacity)
+
+    def _allocate(self, capacity: int) -> np.ndarray:
+        """Allocate a zeroed (capacity, dim) buffer, in memory or in a scratch file."""
+        if self._backing_dir is None:
+            return np.zeros((capacity, self._dim), dtype=np.float32)
+
+        os.makedirs(self._backing_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix='.f32', dir=self._backing_dir)
+        os.close(fd)
+        buffer = np.memmap(path, dtype=np.float32, mode='w+', shape=(capacity, self._dim))
+        try:
+            # The mapping keeps the file alive; unlinking it means it is cleaned up on exit
+            os.remove(path)
+        except OSError:
+            pass
+        return buffer
+
+    @classmethod
+    def from_array(cls, array: Union[np.ndarray, RowBlocks], backing_dir: Optional[str] = None) -> 'EmbeddingMatrix':
+        """
+        Wrap an existing (n, dim) array (or RowBlocks) of already-normalized float32 rows.
+
+        The rows are kept as the read-only base of the matrix without copying, so a
+        memory map stays shared with other processes; appended rows go to a separate
+        buffer.
+
+        Args:
+            array: The normalized float32 rows
+            backing_dir: Directory for scratch files of appended rows (see __init__)
+
+        Returns:
+            EmbeddingMatrix: A matrix backed by the given array
+        """
+        blocks = array.blocks if isinstance(array, RowBlocks) else [array]
+        blocks = [block if block.dtype == np.float32 and block.ndim == 2
+                  else np.asarray(block, dtype=np.float32).reshape(len(block), -1) for block in blocks]
+        matrix = cls(backing_dir=backing_dir)
+        matrix._dim = array.shape[1]
+        matrix._base = [block for block in blocks if len(block) > 0]
+        matrix._base_rows = len(array)
+        matrix._size = len(array)
+        return matrix
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def dim(self) -> Optional[int]:
+        """The embedding dimension, or None until the first row is added."""
+        return self._dim
+
+    @property
+    def base_rows(self) -> int:
+        """The number of leading rows held by the read-only base the matrix was made from (see from_array)."""
+        return self._base_rows
+
+    @property
+    def capacity(self) -> int:
+        """The number of rows the matrix can hold without growing its buffer."""
+        return self._base_rows + (0 if self._buffer is None else self._buffer.shape[0])
+
+    @property
+    def array(self) -> Union[np.ndarray, RowBlocks]:
+        """A (size, dim) view of the stored rows (a RowBlocks matrix if they span several blocks). No data is copied."""
+        blocks = list(self._base)
+        if self._buffer is not None and (self._size > self._base_rows or not blocks):
+            blocks.append(self._buffer[:self._size - self._base_rows])
+        if not blocks:
+            return np.zeros((0, self._dim or 0), dtype=np.float32)
+        if len(blocks) == 1:
+            return blocks[0]
+        return RowBlocks(blocks)
+
+    def _ensure_capacity(self, required: int) -> None:
+        """Grow the buffer (by doubling) until it can hold `required` rows (counting the base)."""
+        required -= self._base_rows
+        if self._buffer is None:
+            capacity = self._initial_capacity
+            while capacity < required:
+                capacity *= 2
+            self._buffer = self._allocate(capacity)
+            return
+
+        capacity = self._buffer.shape[0]
+        if required <= capacity:
+            return
+        while capacity < required:
+            capacity *= 2
+
+        # Copy into a new buffer rather than resizing in place, so views handed out
+        # earlier stay valid
+        new_buffer = self._allocate(capacity)
+        new_buffer[:self._size - self._base_rows] = self._buffer[:self._size - self._base_rows]
+        self._buffer = new_buffer
+
+    def append(self, embedding: VectorLike) -> int:
+        """
+        Normalize an embedding and append it as a new row.
+
+        Args:
+            embedding: The embedding vector
+
+        Returns:
+            int: The row index of the new embedding
+        """
+        vector = normalize_vector(embedding)
+        if self._dim is None:
+            self._dim = vector.shape[0]
+        elif vector.shape[0] != self._dim:
+            raise ValueError(f"Embedding has dimension {vector.shape[0]}, expected {self._dim}")
+
+        self._ensure_capacity(self._size + 1)
+        self._buffer[self._size - self._base_rows] = vector
+        self._size += 1
+        return self._size - 1
+
+    def extend(self, embeddings: Union[List[VectorLike], np.ndarray]) -> range:
+        """
+        Normalize a batch of embeddings and append them as new rows.
+
+        Args:
+            embeddings: A list of vectors or a 2-D array
+
+        Returns:
+            range: The row indices of the new embeddings
+        """
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.size == 0:
+            return range(self._size, self._size)
+        matrix = matrix.reshape(len(matrix), -1)
+        if self._dim is None:
+            self._dim = matrix.shape[1]
+        elif matrix.shape[1] != self._dim:
+            raise ValueError(f"Embeddings have dimension {matrix.shape[1]}, expected {self._dim}")
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+
+        start = self._size
+        self._ensure_capacity(start + len(matrix))
+        self._buffer[start - self._base_rows:start - self._base_rows + len(matrix)] = matrix / norms
+        self._size += len(matrix)
+        return range(start, self._size)
+
+    @property
+    def nbytes_resident(self) -> int:
+        """Bytes of anonymous memory held by the rows (memory-mapped blocks and buffers do not count)."""
+        blocks = self._base + ([self._buffer] if self._buffer is not None else [])
+        return sum(block.nbytes for block in blocks if not isinstance(block, np.memmap))
+
+    def take(self, rows: np.ndarray) -> 'EmbeddingMatrix':
+        """
+        Build a new matrix from a subset of rows, allocated like this one.
+
+        Args:
+            rows: The row indices to keep, in their new order
+
+        Returns:
+            EmbeddingMatrix: A matrix holding only the selected rows
+        """
+        matrix = EmbeddingMatrix(dim=self._dim, initial_capacity=max(1, len(rows)), backing_dir=self._backing_dir)
+        if len(rows) > 0:
+            matrix._buffer[:len(rows)] = self.array[rows]
+            matrix._size = len(rows)
+        return matrix
+
+    def row(self, index: int) -> np.ndarray:
+        """Return a single normalized row."""
+        if index < 0 or index >= self._size:
+            raise IndexError(f"Row {index} out of range for matrix with {self._size} rows")
+        return self.array[index]
+
+    def scores(self, query_embedding: VectorLike) -> np.ndarray:
+        """
+        Compute cosine similarities between a query and every stored row.
+
+        Args:
+            query_embedding: The query vector (does not need to be normalized)
+
+        Returns:
+            np.ndarray: A float32 array of similarities, one per row
+        """
+        if self._size == 0:
+            return np.zeros(0, dtype=np.float32)
+        query = normalize_vector(query_embedding)
+        if query.shape[0] != self._dim:
+            raise ValueError(f"Query has dimension {query.shape[0]}, expected {self._dim}")
+        return score_rows(query[np.newaxis], self.array)[0]
+
+    def scores_batch(self, query_matrix: Union[List[VectorLike], np.ndarray]) -> np.ndarray:
+        """
+        Compute cosine similarities for several queries with one matrix product.
+
+        Args:
+            query_matrix: A list of query vectors or a (num_queries, dim) array
+
+        Returns:
+            np.ndarray: A (num_queries, size) float32 array of similarities
+        """
+        queries = np.asarray(query_matrix, dtype=np.float32)
+        queries = queries.reshape(len(queries), -1)
+        if self._size == 0:
+            return np.zeros((len(queries), 0), dtype=np.float32)
+        if queries.shape[1] != self._dim:
+            raise ValueError(f"Queries have dimension {queries.shape[1]}, expected {self._dim}")
+
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return score_rows(queries / norms, self.array)
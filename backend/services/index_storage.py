@@ -0,0 +1,724 @@
+import os
+import json
+import numpy as np
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; index writes are then not serialized across processes
+    fcntl = None
+
+from services.embedding_matrix import EmbeddingMatrix, RowBlocks
+
+# Name of the directory (inside the knowledge base directory) holding the binary index
+INDEX_DIR_NAME = '_index'
+
+# Bump when the on-disk layout changes in an incompatible way
+INDEX_FORMAT = 2
+
+# Lock file (inside the index directory) serializing index writes across processes
+LOCK_FILE_NAME = 'lock'
+
+# New documents go to a fresh segment once the current one holds this many rows
+SEGMENT_MAX_ROWS = 1 << 20
+
+# Merge the segments when there are more than this many, or when this fraction of
+# their rows belongs to deleted documents
+MERGE_MAX_SEGMENTS = 8
+MERGE_DELETED_FRACTION = 0.25
+
+# Rows copied per step when merging segments
+MERGE_BLOCK_ROWS = 65536
+
+
+class MappedIndex:
+    """
+    A knowledge base index loaded from disk.
+
+    `vectors` holds one float32 row per chunk: a read-only memory map over the
+    segment's vectors file, or a RowBlocks matrix of one such map per segment, so
+    every process that opens the same index shares the OS page cache instead of
+    holding its own copy.
+    `chunks` holds one [chunk_index, content] pair per row, and `documents` holds
+    one metadata entry per live document, including the `start` row and `count`
+    of its chunks. Rows of deleted documents (until the next merge) are not
+    covered by any document. `embedding_backend` is the ID of the embedding
+    backend the vectors were made with (None for indexes written before it was
+    recorded, which all used the local hash embeddings). `manifest` is the
+    manifest the index was read from, which read_index_changes() takes to find
+    what a later version added.
+    """
+
+    def __init__(self, version: int, vectors: np.ndarray, documents: List[Dict[str, Any]], chunks: List[List[Any]],
+                 embedding_backend: Optional[str] = None, manifest: Optional[Dict[str, Any]] = None):
+        self.version = version
+        self.vectors = vectors
+        self.documents = documents
+        self.chunks = chunks
+        self.embedding_backend = embedding_backend
+        self.manifest = manifest
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+
+class IndexChanges:
+    """
+    The documents appended to and deleted from an index since an older version.
+
+    `documents` holds the metadata entry of every live document appended since
+    then, with the `start` row of its chunks (in the newer index) and their
+    `count`. `chunks` holds their [chunk_index, content] pairs and `vectors` their
+    float32 rows, in document order. `deleted` lists the documents deleted since
+    then; rows appended for them after the deletion are in `documents` again.
+    `manifest` is the newer manifest, to pass to the next read_index_changes().
+    """
+
+    def __init__(self, manifest: Dict[str, Any], documents: List[Dict[str, Any]], chunks: List[List[Any]],
+                 vectors: np.ndarray, deleted: List[str]):
+        self.version = manifest['version']
+        self.manifest = manifest
+        self.documents = documents
+        self.chunks = chunks
+        self.vectors = vectors
+        self.deleted = deleted
+
+
+def get_index_dir(kb_dir: str) -> str:
+    """Return the index directory for a knowledge base directory."""
+    return os.path.join(kb_dir, INDEX_DIR_NAME)
+
+
+def _segment_paths(index_dir: str, segment_id: int) -> Tuple[str, str]:
+    """Return the vectors file and the chunk log of a segment."""
+    return (os.path.join(index_dir, f"segment-{segment_id}.f32"),
+            os.path.join(index_dir, f"segment-{segment_id}.log"))
+
+
+@contextmanager
+def index_lock(kb_dir: str):
+    """
+    Hold an exclusive lock on the index of a knowledge base.
+
+    Every worker process can write to the index; the lock makes sure only one of
+    them does at a time. Readers never need the lock, because new rows only become
+    visible when the manifest that counts them is moved into place.
+    """
+    index_dir = get_index_dir(kb_dir)
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, LOCK_FILE_NAME), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _write_json_atomic(path: str, data: Any) -> None:
+    """Write JSON to a temporary file and move it into place."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_manifest(kb_dir: str) -> Optional[Dict[str, Any]]:
+    """Read the index manifest, or return None if it is missing, unreadable or in an older format."""
+    try:
+        with open(os.path.join(get_index_dir(kb_dir), 'manifest.json'), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('format') != INDEX_FORMAT:
+        print(f"Ignoring index with unsupported format {manifest.get('format')}")
+        return None
+    return manifest
+
+
+def _new_manifest(version: int, dim: int, embedding_backend: Optional[str] = None) -> Dict[str, Any]:
+    """Create the manifest of an index without segments."""
+    return {
+        'format': INDEX_FORMAT,
+        'version': version,
+        'dim': dim,
+        'embedding_backend': embedding_backend,  # ID of the embedding backend the vectors were made with
+        'segments': [],  # [{'id', 'rows', 'log_bytes'}], in row order
+        'next_segment': 1,
+        'deleted': {},  # Deleted document ID -> number of rows appended before the deletion
+        'dead_rows': 0,  # Rows belonging to deleted documents
+        'updated_at': datetime.now().isoformat()
+    }
+
+
+def _write_manifest(kb_dir: str, manifest: Dict[str, Any]) -> None:
+    """Publish a manifest, which makes everything it lists visible to readers."""
+    manifest['updated_at'] = datetime.now().isoformat()
+    _write_json_atomic(os.path.join(get_index_dir(kb_dir), 'manifest.json'), manifest)
+
+
+def read_index_version(kb_dir: str) -> Optional[int]:
+    """
+    Read the version of the current index from its manifest, without mapping it.
+
+    Args:
+        kb_dir: The knowledge base directory
+
+    Returns:
+        Optional[int]: The index version, or None if there is no readable index
+    """
+    try:
+        with open(os.path.join(get_index_dir(kb_dir), 'manifest.json'), 'r') as f:
+            return json.load(f).get('version')
+    except (OSError, ValueError):
+        return None
+
+
+def read_index_metadata(kb_dir: str) -> Optional[Dict[str, Any]]:
+    """
+    Read the embedding dimension and embedding backend ID recorded in the index manifest.
+
+    Args:
+        kb_dir: The knowledge base directory
+
+    Returns:
+        Optional[Dict[str, Any]]: {'dim', 'embedding_backend'}, or None if there is no readable index
+    """
+    manifest = _read_manifest(kb_dir)
+    if manifest is None:
+        return None
+    return {'dim': manifest.get('dim') or None, 'embedding_backend': manifest.get('embedding_backend')}
+
+
+def read_index(kb_dir: str) -> Optional[MappedIndex]:
+    """
+    Open the index of a knowledge base by replaying its manifest.
+
+    Every segment listed in the manifest is mapped up to its committed row count,
+    and its chunk log is read up to its committed length, so bytes appended by a
+    writer that has not (or never) committed are ignored.
+
+    Args:
+        kb_dir: The knowledge base directory
+
+    Returns:
+        Optional[MappedIndex]: The mapped index, or None if it is missing or unreadable
+    """
+    manifest = _read_manifest(kb_dir)
+    if manifest is None:
+        return None
+
+    index_dir = get_index_dir(kb_dir)
+    dim = manifest.get('dim') or 0
+    deleted = manifest.get('deleted', {})
+    try:
+        segment_vectors = []
+        records = []  # (document, chunks, first row)
+        row = 0
+        for segment in manifest['segments']:
+            vectors_path, log_path = _segment_paths(index_dir, segment['id'])
+            if segment['rows'] > 0:
+                segment_vectors.append(np.memmap(vectors_path, dtype=np.float32, mode='r', shape=(segment['rows'], dim)))
+            with open(log_path, 'rb') as f:
+                log = f.read(segment['log_bytes'])
+            segment_start = row
+            for line in log.splitlines():
+                record = json.loads(line)
+                records.append((record['doc'], record['chunks'], row))
+                row += len(record['chunks'])
+            if row - segment_start != segment['rows']:
+                print(f"Segment {segment['id']} log and vectors disagree, ignoring index")
+                return None
+
+        # A document appended more than once (re-processed) keeps only its latest rows
+        latest = {document['doc_id']: first_row for document, _, first_row in records}
+        documents = []
+        chunks = []
+        for document, doc_chunks, first_row in records:
+            doc_id = document['doc_id']
+            if latest[doc_id] == first_row and first_row >= deleted.get(doc_id, -1):
+                entry = dict(document)
+                entry['start'] = first_row
+                entry['count'] = len(doc_chunks)
+                documents.append(entry)
+            chunks.extend(doc_chunks)
+
+        if len(segment_vectors) == 1:
+            vectors = segment_vectors[0]
+        elif segment_vectors:
+            # Several segments stay separate maps (scored one after the other) rather
+            # than being joined into a private copy
+            vectors = RowBlocks(segment_vectors)
+        else:
+            vectors = np.zeros((0, dim), dtype=np.float32)
+        return MappedIndex(manifest['version'], vectors, documents, chunks, manifest.get('embedding_backend'), manifest)
+    except Exception as e:
+        print(f"Error reading knowledge base index: {str(e)}")
+        return None
+
+
+def read_index_changes(kb_dir: str, manifest: Dict[str, Any]) -> Optional[IndexChanges]:
+    """
+    Read what was appended to and deleted from an index since an older manifest.
+
+    Only the log bytes and vector rows past the counts in the older manifest are
+    read, so catching up costs time in the size of the change, not of the index.
+    This only works while the older segments are still in place: after a merge
+    (or a rebuild) the index has to be read again with read_index().
+
+    Args:
+        kb_dir: The knowledge base directory
+        manifest: The manifest of the version the caller holds (MappedIndex.manifest or IndexChanges.manifest)
+
+    Returns:
+        Optional[IndexChanges]: The changes (none if the version is unchanged), or None if the
+        segments were rewritten since the older manifest or the index is unreadable
+    """
+    new_manifest = _read_manifest(kb_dir)
+    if new_manifest is None:
+        return None
+    old_segments = manifest['segments']
+    segments = new_manifest['segments']
+    if len(segments) < len(old_segments) or (manifest.get('dim') and new_manifest.get('dim') != manifest['dim']):
+        return None
+    for i, (old, segment) in enumerate(zip(old_segments, segments)):
+        # Rows are only ever appended to the last segment; anything else means the segments were rewritten
+        grew = segment['rows'] != old['rows'] or segment['log_bytes'] != old['log_bytes']
+        if (segment['id'] != old['id'] or segment['rows'] < old['rows'] or segment['log_bytes'] < old['log_bytes']
+                or (grew and i < len(old_segments) - 1)):
+            return None
+
+    index_dir = get_index_dir(kb_dir)
+    dim = new_manifest.get('dim') or 0
+    deleted = new_manifest.get('deleted', {})
+    first_new_row = sum(segment['rows'] for segment in old_segments)
+    try:
+        segment_vectors = []
+        records = []  # (document, chunks, first row)
+        row = first_new_row
+        for i, segment in enumerate(segments):
+            old = old_segments[i] if i < len(old_segments) else {'rows': 0, 'log_bytes': 0}
+            new_rows = segment['rows'] - old['rows']
+            if segment['log_bytes'] == old['log_bytes'] and new_rows == 0:
+                continue
+            vectors_path, log_path = _segment_paths(index_dir, segment['id'])
+            if new_rows > 0:
+                segment_vectors.append(np.memmap(vectors_path, dtype=np.float32, mode='r',
+                                                 offset=old['rows'] * dim * 4, shape=(new_rows, dim)))
+            with open(log_path, 'rb') as f:
+                f.seek(old['log_bytes'])
+                log = f.read(segment['log_bytes'] - old['log_bytes'])
+            segment_start = row
+            for line in log.splitlines():
+                record = json.loads(line)
+                records.append((record['doc'], record['chunks'], row))
+                row += len(record['chunks'])
+            if row - segment_start != new_rows:
+                print(f"Segment {segment['id']} log and vectors disagree, ignoring index changes")
+                return None
+
+        # Same rules as read_index(): a document's latest record wins unless it was deleted after it
+        latest = {document['doc_id']: first_row for document, _, first_row in records}
+        documents = []
+        chunks = []
+        rows = []
+        for document, doc_chunks, first_row in records:
+            doc_id = document['doc_id']
+            if latest[doc_id] == first_row and first_row >= deleted.get(doc_id, -1):
+                entry = dict(document)
+                entry['start'] = first_row
+                entry['count'] = len(doc_chunks)
+                documents.append(entry)
+                chunks.extend(doc_chunks)
+                rows.append(np.arange(first_row - first_new_row, first_row - first_new_row + len(doc_chunks)))
+
+        vectors = np.zeros((0, dim), dtype=np.float32)
+        if rows:
+            new_vectors = segment_vectors[0] if len(segment_vectors) == 1 else np.concatenate(segment_vectors)
+            vectors = np.asarray(new_vectors[np.concatenate(rows)])
+        old_deleted = manifest.get('deleted', {})
+        deleted_doc_ids = [doc_id for doc_id, total_rows in deleted.items() if old_deleted.get(doc_id) != total_rows]
+        return IndexChanges(new_manifest, documents, chunks, vectors, deleted_doc_ids)
+    except Exception as e:
+        print(f"Error reading knowledge base index changes: {str(e)}")
+        return None
+
+
+def _append_segment(index_dir: str, segment: Dict[str, Any], dim: int, documents: List[Dict[str, Any]],
+                    chunks: List[List[Any]], vectors: np.ndarray) -> None:
+    """
+    Append documents to a segment's files and fsync each file once.
+
+    Anything past the segment's committed size (left by a writer that crashed
+    before committing) is truncated first.
+    """
+    vectors_path, log_path = _segment_paths(index_dir, segment['id'])
+    lines = []
+    start = 0
+    for document in documents:
+        doc_chunks = chunks[start:start + document['count']]
+        start += document['count']
+        record = {'doc': {key: value for key, value in document.items() if key not in ('start', 'count')},
+                  'chunks': doc_chunks}
+        lines.append(json.dumps(record, separators=(',', ':')) + '\n')
+    log_data = ''.join(lines).encode('utf-8')
+
+    with open(vectors_path, 'ab') as f:
+        f.truncate(segment['rows'] * dim * 4)
+        f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    with open(log_path, 'ab') as f:
+        f.truncate(segment['log_bytes'])
+        f.write(log_data)
+        f.flush()
+        os.fsync(f.fileno())
+
+    segment['rows'] += len(vectors)
+    segment['log_bytes'] += len(log_data)
+
+
+def append_documents(kb_dir: str, documents: List[Dict[str, Any]], chunks: List[List[Any]], vectors: np.ndarray,
+                     embedding_backend: Optional[str] = None) -> Tuple[int, int]:
+    """
+    Append documents to the current segment and commit them.
+
+    The chunks and vectors are appended to the segment files with one fsync each,
+    then a new manifest counting them is swapped in, so a reader sees either none
+    or all of the documents.
+
+    Args:
+        kb_dir: The knowledge base directory
+        documents: Document metadata entries, each with `doc_id` and the `count` of its chunks
+        chunks: One [chunk_index, content] pair per vector row, in document order
+        vectors: A (len(chunks), dim) array of normalized float32 vectors
+        embedding_backend: The ID of the embedding backend the vectors were made with
+
+    Returns:
+        Tuple[int, int]: The version number of the new index and the row of the first appended chunk
+
+    Raises:
+        ValueError: If the vectors do not match the dimension or embedding backend of the index
+    """
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(chunks), -1)
+    with index_lock(kb_dir):
+        manifest = _read_manifest(kb_dir) or _new_manifest(read_index_version(kb_dir) or 0, vectors.shape[1])
+        if not manifest['dim']:
+            manifest['dim'] = vectors.shape[1]
+        if vectors.shape[1] != manifest['dim']:
+            raise ValueError(f"Vectors have dimension {vectors.shape[1]}, index has {manifest['dim']}")
+        if embedding_backend is not None:
+            if manifest.get('embedding_backend') is None:
+                manifest['embedding_backend'] = embedding_backend
+            elif manifest['embedding_backend'] != embedding_backend:
+                raise ValueError(f"Vectors were made by embedding backend {embedding_backend}, "
+                                 f"index has {manifest['embedding_backend']}")
+
+        segments = manifest['segments']
+        first_row = sum(segment['rows'] for segment in segments)
+        if not segments or segments[-1]['rows'] + len(vectors) > SEGMENT_MAX_ROWS:
+            segments.append({'id': manifest['next_segment'], 'rows': 0, 'log_bytes': 0})
+            manifest['next_segment'] += 1
+        _append_segment(get_index_dir(kb_dir), segments[-1], manifest['dim'], documents, chunks, vectors)
+
+        manifest['version'] += 1
+        _write_manifest(kb_dir, manifest)
+        return manifest['version'], first_row
+
+
+def delete_documents(kb_dir: str, doc_ids: List[str], row_counts: Optional[Dict[str, int]] = None) -> Optional[int]:
+    """
+    Mark documents as deleted in the manifest; their rows are dropped by the next merge.
+
+    Args:
+        kb_dir: The knowledge base directory
+        doc_ids: The document IDs to delete
+        row_counts: The number of rows of each document, if the caller already knows them;
+            otherwise the whole index is read to count them. Documents without a count are skipped
+
+    Returns:
+        Optional[int]: The version number of the new index, or None if there is no index
+    """
+    with index_lock(kb_dir):
+        manifest = _read_manifest(kb_dir)
+        if manifest is None:
+            return None
+        if row_counts is None:
+            index = read_index(kb_dir)
+            if index is None:
+                return None
+            row_counts = {doc['doc_id']: doc['count'] for doc in index.documents}
+        total_rows = sum(segment['rows'] for segment in manifest['segments'])
+        for doc_id in doc_ids:
+            if doc_id in row_counts:
+                manifest['deleted'][doc_id] = total_rows
+                manifest['dead_rows'] += row_counts[doc_id]
+
+        manifest['version'] += 1
+        _write_manifest(kb_dir, manifest)
+        return manifest['version']
+
+
+def needs_merge(kb_dir: str) -> bool:
+    """Check whether the index has enough segments or deleted rows to be worth merging."""
+    manifest = _read_manifest(kb_dir)
+    if manifest is None:
+        return False
+    total_rows = sum(segment['rows'] for segment in manifest['segments'])
+    return (len(manifest['segments']) > MERGE_MAX_SEGMENTS
+            or (total_rows > 0 and manifest['dead_rows'] / total_rows > MERGE_DELETED_FRACTION))
+
+
+def write_index(kb_dir: str, documents: List[Dict[str, Any]], chunks: List[List[Any]], vectors: np.ndarray,
+                embedding_backend: Optional[str] = None) -> int:
+    """
+    Write a new index consisting of a single segment, replacing all existing segments.
+
+    The new segment is written under a fresh name and the manifest is swapped in
+    last, so readers see either the old or the new index, never a mix. Processes
+    that still map an older segment keep working until they reload. Callers hold
+    index_lock().
+
+    Args:
+        kb_dir: The knowledge base directory
+        documents: Document metadata entries, each with `doc_id` and the `count` of its chunks
+        chunks: One [chunk_index, content] pair per vector row, in document order
+        vectors: A (len(chunks), dim) array of normalized float32 vectors
+        embedding_backend: The ID of the embedding backend the vectors were made with
+            (defaults to the one recorded by the index being replaced)
+
+    Returns:
+        int: The version number of the written index
+    """
+    index_dir = get_index_dir(kb_dir)
+    os.makedirs(index_dir, exist_ok=True)
+
+    previous = _read_manifest(kb_dir)
+    version = (read_index_version(kb_dir) or 0) + 1
+    vectors = np.asarray(vectors, dtype=np.float32)
+    dim = int(vectors.shape[1]) if vectors.ndim == 2 else 0
+
+    if embedding_backend is None and previous:
+        embedding_backend = previous.get('embedding_backend')
+    manifest = _new_manifest(version, dim, embedding_backend)
+    manifest['next_segment'] = previous['next_segment'] if previous else 1
+    segment = {'id': manifest['next_segment'], 'rows': 0, 'log_bytes': 0}
+    manifest['next_segment'] += 1
+    _append_segment(index_dir, segment, dim, documents, chunks, vectors)
+    manifest['segments'] = [segment]
+    _write_manifest(kb_dir, manifest)
+
+    # Remove files of older segments (and of the pre-segment index format); processes
+    # that still map them keep their open handles until they reload
+    keep = set(_segment_paths(index_dir, segment['id']))
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        if path not in keep and name.startswith(('segment-', 'vectors-', 'metadata-')):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    return version
+
+
+def merge_segments(kb_dir: str) -> Optional[MappedIndex]:
+    """
+    Compact the index into a single segment without the rows of deleted documents.
+
+    Args:
+        kb_dir: The knowledge base directory
+
+    Returns:
+        Optional[MappedIndex]: The merged index, or None if there is no index
+    """
+    with index_lock(kb_dir):
+        index = read_index(kb_dir)
+        if index is None:
+            return None
+
+        rows = np.zeros(0, dtype=np.int64)
+        if index.documents:
+            rows = np.concatenate([np.arange(doc['start'], doc['start'] + doc['count']) for doc in index.documents])
+        matrix = EmbeddingMatrix(initial_capacity=max(1, len(rows)))
+        for start in range(0, len(rows), MERGE_BLOCK_ROWS):
+            # Rows are already normalized, so re-normalizing them is a no-op
+            matrix.extend(index.vectors[rows[start:start + MERGE_BLOCK_ROWS]])
+        chunks = [index.chunks[row] for row in rows.tolist()]
+
+        write_index(kb_dir, index.documents, chunks, matrix.array)
+        print(f"Merged knowledge base index: {len(index.documents)} documents, {len(chunks)} chunks "
+              f"({len(index) - len(chunks)} deleted rows dropped)")
+        return read_index(kb_dir)
+
+
+def list_document_dirs(kb_dir: str) -> Dict[str, float]:
+    """
+    Find all document directories that have a metadata file.
+
+    Args:
+        kb_dir: The knowledge base directory
+
+    Returns:
+        Dict[str, float]: The modification time of each document's metadata file, by document ID
+    """
+    if not os.path.exists(kb_dir):
+        return {}
+    doc_dirs = {}
+    for name in sorted(os.listdir(kb_dir)):
+        if name == INDEX_DIR_NAME:
+            continue
+        metadata_path = os.path.join(kb_dir, name, 'metadata.json')
+        if os.path.exists(metadata_path):
+            doc_dirs[name] = os.path.getmtime(metadata_path)
+    return doc_dirs
+
+
+def _chunk_sort_key(chunk_file: str) -> Tuple[int, Any]:
+    """Sort chunk files numerically (0.json, 1.json, ..., 10.json)."""
+    stem = chunk_file.split('.')[0]
+    return (0, int(stem)) if stem.isdigit() else (1, stem)
+
+
+def read_document_dir(kb_dir: str, doc_id: str) -> Tuple[Dict[str, Any], List[List[Any]], List[List[float]]]:
+    """
+    Read a document from the legacy per-chunk JSON directory layout.
+
+    Args:
+        kb_dir: The knowledge base directory
+        doc_id: The document directory name
+
+    Returns:
+        Tuple: The document metadata, the [chunk_index, content] pairs and the embeddings
+    """
+    doc_dir = os.path.join(kb_dir, doc_id)
+    with open(os.path.join(doc_dir, 'metadata.json'), 'r') as f:
+        metadata = json.load(f)
+
+    chunks = []
+    embeddings = []
+    chunk_files = [name for name in os.listdir(doc_dir) if name.endswith('.json') and name != 'metadata.json']
+    for chunk_file in sorted(chunk_files, key=_chunk_sort_key):
+        with open(os.path.join(doc_dir, chunk_file), 'r') as f:
+            chunk_data = json.load(f)
+        if 'embedding' in chunk_data and 'content' in chunk_data:
+            stem = chunk_file.split('.')[0]
+            chunks.append([int(stem) if stem.isdigit() else stem, chunk_data['content']])
+            embeddings.append(chunk_data['embedding'])
+
+    document = {
+        'doc_id': doc_id,
+        'title': metadata.get('title', 'Untitled'),
+        'source': metadata.get('source', 'Unknown'),
+        'date_added': metadata.get('date_added', datetime.now().isoformat())
+    }
+    return document, chunks, embeddings
+
+
+def _has_segment_logs(kb_dir: str) -> bool:
+    """Check whether the index directory holds segment files (written since the segment index was introduced)."""
+    index_dir = get_index_dir(kb_dir)
+    return os.path.isdir(index_dir) and any(name.startswith('segment-') for name in os.listdir(index_dir))
+
+
+def build_index(kb_dir: str) -> Optional[MappedIndex]:
+    """
+    Build an index from the legacy per-chunk JSON files of every document directory.
+
+    Documents added since the segment index was introduced only exist in the
+    segment logs, so an index that has segment files is never rebuilt from JSON.
+    Callers hold index_lock().
+
+    Args:
+        kb_dir: The knowledge base directory
+
+    Returns:
+        Optional[MappedIndex]: The newly written index, mapped from disk
+
+    Raises:
+        RuntimeError: If the index directory already holds segment files
+    """
+    if _has_segment_logs(kb_dir):
+        raise RuntimeError(f"The index in {get_index_dir(kb_dir)} has segment files but could not be read; "
+                           f"rebuilding it from the document directories would drop the documents only its "
+                           f"segment logs hold")
+
+    documents = []
+    chunks = []
+    matrix = EmbeddingMatrix()
+
+    for doc_id in list_document_dirs(kb_dir):
+        try:
+            entry, doc_chunks, embeddings = read_document_dir(kb_dir, doc_id)
+        except Exception as e:
+            print(f"Error reading document {doc_id}: {str(e)}")
+            continue
+        if not doc_chunks:
+            continue
+        matrix.extend(embeddings)
+        chunks.extend(doc_chunks)
+        entry['count'] = len(doc_chunks)
+        documents.append(entry)
+
+    write_index(kb_dir, documents, chunks, matrix.array)
+    print(f"Wrote knowledge base index: {len(documents)} documents, {len(chunks)} chunks (parsed from JSON)")
+    return read_index(kb_dir)
+
+
+def migrate_directory_layout(kb_dir: str) -> Optional[MappedIndex]:
+    """
+    One-shot migration from the per-chunk JSON layout to the segment index.
+
+    Every document directory is parsed from JSON, replacing any index in an older
+    format. An index that already has segment files is left alone (see build_index).
+
+    Args:
+        kb_dir: The knowledge base directory
+
+    Returns:
+        Optional[MappedIndex]: The newly written index
+
+    Raises:
+        RuntimeError: If the index directory already holds segment files
+    """
+    with index_lock(kb_dir):
+        return build_index(kb_dir)
+
+
+def open_index(kb_dir: str) -> Optional[MappedIndex]:
+    """
+    Open the index for a knowledge base at startup.
+
+    Only the manifest and the segments it lists are read; document directories are
+    not scanned. If there is no index yet (or only one in an older format), it is
+    built once from the legacy per-chunk JSON files. When several worker processes
+    start at once, only the first one builds it; the others wait for the lock and
+    then map the index it wrote. A segment index that cannot be read is an error,
+    not something to rebuild, since newer documents only exist in its segment logs.
+
+    Args:
+        kb_dir: The knowledge base directory
+
+    Returns:
+        Optional[MappedIndex]: The mapped index, or None if there is nothing to index
+
+    Raises:
+        RuntimeError: If the index has segment files but cannot be read
+    """
+    index = read_index(kb_dir)
+    if index is not None:
+        return index
+    if not list_document_dirs(kb_dir) and not _has_segment_logs(kb_dir):
+        return None
+
+    with index_lock(kb_dir):
+        # Another process may have built the index while we waited for the lock
+        index = read_index(kb_dir)
+        if index is not None:
+            return index
+        return build_index(kb_dir)
@@ -0,0 +1,246 @@
+import numpy as np
+from typing import List, Optional
+
+# Default number of inverted lists probed per query
+DEFAULT_NPROBE = 8
+
+# Maximum number of vectors used to train the coarse quantizer
+MAX_TRAINING_SAMPLE = 50000
+
+# Rows are assigned to centroids in blocks of this size to bound memory use
+ASSIGN_BLOCK_SIZE = 16384
+
+
+def default_num_lists(num_vectors: int) -> int:
+    """Pick the number of inverted lists for a corpus size (about sqrt(n))."""
+    return int(min(4096, max(8, np.sqrt(num_vectors))))
+
+
+def assign_to_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """
+    Assign each (normalized) vector to its most similar centroid.
+
+    Args:
+        vectors: A (n, dim) array of normalized vectors
+        centroids: A (num_lists, dim) array of normalized centroids
+
+    Returns:
+        np.ndarray: The list number of every vector
+    """
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_SIZE):
+        block = np.asarray(vectors[start:start + ASSIGN_BLOCK_SIZE], dtype=np.float32)
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def spherical_kmeans(vectors: np.ndarray, num_clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    Cluster normalized vectors with k-means on the unit sphere.
+
+    Args:
+        vectors: A (n, dim) array of normalized vectors
+        num_clusters: The number of clusters
+        iterations: The number of Lloyd iterations
+        seed: Random seed for initialization
+
+    Returns:
+        np.ndarray: A (num_clusters, dim) array of normalized centroids
+    """
+    rng = np.random.default_rng(seed)
+    num_clusters = min(num_clusters, len(vectors))
+    centroids = np.array(vectors[rng.choice(len(vectors), num_clusters, replace=False)], dtype=np.float32)
+
+    for _ in range(iterations):
+        assignments = assign_to_centroids(vectors, centroids)
+        counts = np.bincount(assignments, minlength=num_clusters)
+        sums = np.empty_like(centroids)
+        for dim in range(vectors.shape[1]):
+            sums[:, dim] = np.bincount(assignments, weights=vectors[:, dim], minlength=num_clusters)
+
+        # Re-seed empty clusters with random vectors
+        empty = np.flatnonzero(counts == 0)
+        if len(empty) > 0:
+            sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+
+    return centroids
+
+
+class PostingList:
+    """
+    A growable array of row numbers belonging to one inverted list.
+
+    New rows are written before the size is bumped, and a full buffer is replaced
+    by a grown copy, so `rows` can be read without a lock while rows are appended.
+    """
+
+    def __init__(self, rows: Optional[np.ndarray] = None):
+        if rows is None:
+            rows = np.zeros(0, dtype=np.int64)
+        self._rows = np.array(rows, dtype=np.int64)
+        self._size = len(rows)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def rows(self) -> np.ndarray:
+        size = self._size
+        return self._rows[:size]
+
+    def extend(self, rows: np.ndarray) -> None:
+        required = self._size + len(rows)
+        if required > len(self._rows):
+            capacity = max(16, len(self._rows))
+            while capacity < required:
+                capacity *= 2
+            grown = np.zeros(capacity, dtype=np.int64)
+            grown[:self._size] = self._rows[:self._size]
+            grown[self._size:required] = rows
+            self._rows = grown
+        else:
+            self._rows[self._size:required] = rows
+        self._size = required
+
+    def append(self, row: int) -> None:
+        self.extend(np.array([row], dtype=np.int64))
+
+
+class IVFIndex:
+    """
+    An inverted-file (IVF) approximate nearest-neighbour index.
+
+    A k-means coarse quantizer splits the rows of an embedding matrix into
+    inverted lists. A query only scores the rows in the `nprobe` lists whose
+    centroids are most similar to it. The index stores row numbers, not vectors;
+    scoring is done against the store's embedding matrix.
+    """
+
+    def __init__(self, centroids: np.ndarray, nprobe: int = DEFAULT_NPROBE):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        self.lists = [PostingList() for _ in range(len(centroids))]
+        self.size = 0  # Number of rows assigned to lists
+        self.trained_size = 0  # Number of rows the quantizer was trained on
+
+    @property
+    def num_lists(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, num_lists: Optional[int] = None, nprobe: int = DEFAULT_NPROBE, seed: int = 0) -> 'IVFIndex':
+        """
+        Train a coarse quantizer on normalized vectors and assign all of them.
+
+        Args:
+            vectors: A (n, dim) array of normalized vectors; row i becomes row number i
+            num_lists: The number of inverted lists (defaults to about sqrt(n))
+            nprobe: The default number of lists probed per query
+            seed: Random seed for sampling and initialization
+
+        Returns:
+            IVFIndex: The trained index
+        """
+        if num_lists is None:
+            num_lists = default_num_lists(len(vectors))
+
+        sample = vectors
+        if len(vectors) > MAX_TRAINING_SAMPLE:
+            rng = np.random.default_rng(seed)
+            sample = vectors[np.sort(rng.choice(len(vectors), MAX_TRAINING_SAMPLE, replace=False))]
+
+        index = cls(spherical_kmeans(np.asarray(sample, dtype=np.float32), num_lists, seed=seed), nprobe=nprobe)
+        index.add_rows(0, vectors)
+        index.trained_size = len(vectors)
+        return index
+
+    def add_rows(self, first_row: int, vectors: np.ndarray) -> None:
+        """
+        Assign consecutive rows to their nearest lists.
+
+        Args:
+            first_row: The row number of vectors[0]
+            vectors: A (n, dim) array of normalized vectors
+        """
+        if len(vectors) == 0:
+            return
+        assignments = assign_to_centroids(vectors, self.centroids)
+        order = np.argsort(assignments, kind='stable')
+        boundaries = np.searchsorted(assignments[order], np.arange(self.num_lists + 1))
+        for list_number in range(self.num_lists):
+            start, end = boundaries[list_number], boundaries[list_number + 1]
+            if start == end:
+                continue
+            self.lists[list_number].extend(order[start:end] + first_row)
+        self.size += len(vectors)
+
+    def add(self, row: int, vector: np.ndarray) -> None:
+        """Assign a single normalized vector to its nearest list."""
+        list_number = int(np.argmax(self.centroids @ vector))
+        self.lists[list_number].append(row)
+        self.size += 1
+
+    def remapped(self, old_to_new: np.ndarray) -> 'IVFIndex':
+        """
+        Build a renumbered copy of the index after the store has been compacted.
+
+        Args:
+            old_to_new: The new row number of every old row, or -1 if it was removed
+
+        Returns:
+            IVFIndex: The renumbered index, sharing the centroids; this one is left unchanged
+        """
+        index = IVFIndex(self.centroids, nprobe=self.nprobe)
+        index.trained_size = self.trained_size
+        for list_number, posting in enumerate(self.lists):
+            rows = old_to_new[posting.rows]
+            rows = rows[rows >= 0]
+            index.lists[list_number] = PostingList(rows)
+            index.size += len(rows)
+        return index
+
+    def reassigned(self, vectors: np.ndarray) -> 'IVFIndex':
+        """
+        Build an index over a new set of rows that keeps the trained centroids.
+
+        Args:
+            vectors: A (n, dim) array of normalized vectors; row i becomes row number i
+
+        Returns:
+            IVFIndex: The new index, sharing the centroids; this one is left unchanged
+        """
+        index = IVFIndex(self.centroids, nprobe=self.nprobe)
+        index.trained_size = self.trained_size
+        index.add_rows(0, vectors)
+        return index
+
+    def imbalance(self) -> float:
+        """The ratio of the largest list to the average list size (1.0 is perfectly balanced)."""
+        if self.size == 0:
+            return 1.0
+        largest = max(len(posting) for posting in self.lists)
+        return largest / (self.size / self.num_lists)
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """
+        Return the rows in the lists closest to a normalized query.
+
+        Args:
+            query: The normalized query vector
+            nprobe: The number of lists to probe (defaults to self.nprobe)
+
+        Returns:
+            np.ndarray: Candidate row numbers
+        """
+        nprobe = min(nprobe or self.nprobe, self.num_lists)
+        centroid_scores = self.centroids @ query
+        if nprobe < self.num_lists:
+            probed = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probed = np.arange(self.num_lists)
+        rows: List[np.ndarray] = [self.lists[list_number].rows for list_number in probed]
+        return np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
@@ -1,4 +1,5 @@
 import os
+import re
 import json
 import numpy as np
 from typing import List, Dict, Any, Tuple, Optional
@@ -7,6 +8,26 @@ from openai import OpenAI
 from dotenv import load_dotenv
 from datetime import datetime
 import uuid
+import threading
+import tempfile
+import time
+
+from services.embedding_matrix import EmbeddingMatrix, normalize_vector, score_rows, top_k_indices, top_k_indices_batch
+from services.ivf_index import IVFIndex, DEFAULT_NPROBE
+from services.index_storage import (MappedIndex, IndexChanges, open_index, read_index, read_index_changes,
+                                    read_index_version, read_index_metadata, append_documents, delete_documents, needs_merge, merge_segments, list_document_dirs)
+from services.quantization import QuantizedMatrix, QUANTIZATION_INT8, QUANTIZATION_FLOAT16
+from services.binary_sketch import BinarySketch
+from services.partitioned_search import PartitionedSearch
+from services.lexical_index import BM25Index
+from services.mmr import mmr_select, validate_mmr_lambda, MMR_POOL_FACTOR
+from services.document_centroids import DocumentCentroids
+from services.tiered_storage import TieredRows, parse_byte_size
+from services.chunk_text import ChunkText
+from services.chunk_table import ChunkTable, get_document_id, get_chunk_document_id, get_chunk_index
+from services.embedding_cache import EmbeddingCache, QueryEmbeddingCache
+from services.embedding_backends import (EmbeddingBackend, create_embedding_backend, simple_embedding, simple_embeddings,
+                                         HASH_BACKEND_ID)
 
 # Load environment variables
 load_dotenv()
@@ -20,128 +41,1646 @@ KNOWLEDGE_BASE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspat
 # Ensure the knowledge base directory exists
 os.makedirs(KNOWLEDGE_BASE_DIR, exist_ok=True)
 
+# Every collection has its own documents, index and vector store. The default collection
+# lives in KNOWLEDGE_BASE_DIR itself, so existing knowledge bases keep working; any other
+# collection lives in KNOWLEDGE_BASE_DIR/<name>, marked by a COLLECTION_MARKER file
+DEFAULT_COLLECTION = 'default'
+COLLECTION_MARKER = 'collection.json'
+# Collection names are directory names
+COLLECTION_NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$')
+
+# Compact the store once this fraction of its rows has been deleted
+COMPACTION_THRESHOLD = 0.25
+
+# Index types supported by SimpleVectorStore: exact brute force, inverted file (IVF),
+# or a sign-bit sketch scan followed by an exact re-score
+INDEX_TYPE_FLAT = 'flat'
+INDEX_TYPE_IVF = 'ivf'
+INDEX_TYPE_SKETCH = 'sketch'
+INDEX_TYPES = (INDEX_TYPE_FLAT, INDEX_TYPE_IVF, INDEX_TYPE_SKETCH)
+
+# An IVF store keeps using brute force until it holds this many chunks
+IVF_MIN_TRAIN_SIZE = 20000
+# Retrain the IVF quantizer when its largest list is this many times the average list,
+# or when the store has grown to this many times the size it was trained on
+IVF_MAX_IMBALANCE = 8.0
+IVF_MAX_GROWTH = 2.0
+# How many added chunks between checks of the IVF balance
+IVF_CHECK_INTERVAL = 1024
+
+# How often (in seconds) a worker checks whether another process published a new index version
+INDEX_CHECK_INTERVAL = float(os.getenv('INDEX_CHECK_INTERVAL', 2.0))
+
+# With quantized storage, this many first-pass candidates per query are re-scored exactly
+RERANK_CANDIDATES = 256
+# With index_type='sketch', this many rows nearest in Hamming distance are re-scored exactly per query
+SKETCH_CANDIDATES = 2048
+
+# Metadata fields a search can be restricted by (see SimpleVectorStore.filter_rows)
+FILTER_FIELDS = ('doc_id', 'title', 'source', 'date_added')
+# Filters matching at most this fraction of the store only score the matching rows;
+# broader filters are applied as a mask over the normal search path
+FILTER_SUBSET_FRACTION = 0.5
+
+# Search modes: embedding similarity, BM25 over chunk terms, both fused by rank, or
+# embedding similarity within the documents whose centroids are closest to the query
+SEARCH_MODE_VECTOR = 'vector'
+SEARCH_MODE_LEXICAL = 'lexical'
+SEARCH_MODE_HYBRID = 'hybrid'
+SEARCH_MODE_HIERARCHICAL = 'hierarchical'
+SEARCH_MODES = (SEARCH_MODE_VECTOR, SEARCH_MODE_LEXICAL, SEARCH_MODE_HYBRID, SEARCH_MODE_HIERARCHICAL)
+# Reciprocal rank fusion constant: a row at rank r in a ranking scores 1 / (RRF_K + r)
+RRF_K = 60
+# Hybrid search fuses at least this many candidates from each ranking
+HYBRID_CANDIDATES = 50
+# Largest number of neighbouring chunks a search may add on each side of a hit
+MAX_EXPAND = 10
+# Hierarchical search scores the chunks of this many best-matching documents by default
+TOP_DOCUMENTS = 5
+
+# Embedding backend of new collections (see embedding_backends.create_embedding_backend):
+# 'hash' for the local hash embeddings, 'openai:<model>', or the URL of an embedding server.
+# A collection keeps the backend recorded in its index, so its vectors stay comparable
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'hash')
+# Number of chunks embedded per get_embeddings call while ingesting a document
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', 64))
+# Persistent embedding cache shared by the worker processes, next to the knowledge base
+# directory, and the number of embeddings it keeps (0 disables it)
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH',
+                                 os.path.join(os.path.dirname(KNOWLEDGE_BASE_DIR), 'embedding_cache.sqlite3'))
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', 500000))
+# In-process cache of query embeddings: the number of queries it keeps (0 disables it),
+# and optionally how many seconds an entry stays valid (0 for no expiry)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', 1024))
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv('QUERY_EMBEDDING_CACHE_TTL', 0))
+
+def get_lexical_text(document: Dict[str, Any], content: Optional[str] = None) -> str:
+    """The text of a chunk that is indexed for lexical search (its title and content, by default its 'content')."""
+    if content is None:
+        content = document.get('content', '')
+    return f"{document.get('title', '')} {content}"
+
+def order_chunk_rows(rows: List[int], chunks: ChunkTable) -> np.ndarray:
+    """Sort the rows of one document's chunks into chunk order (ties keep row order)."""
+    rows = np.asarray(rows, dtype=np.int64)
+    return rows[np.lexsort((rows, chunks.chunk_indexes(rows)))]
+
+def parse_date_bound(value: Any, end: bool = False) -> float:
+    """
+    Parse one bound of a date range filter to a POSIX timestamp.
+    
+    A plain date (YYYY-MM-DD) used as the end of a range covers that whole day.
+    
+    Raises:
+        ValueError: If the value is not an ISO 8601 date
+    """
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid date: {value!r}")
+    timestamp = datetime.fromisoformat(value).timestamp()
+    if end and len(value) == 10:
+        timestamp += 86400 - 1e-6
+    return timestamp
+
+def parse_timestamp(value: Any) -> float:
+    """Convert an ISO 8601 date string to a POSIX timestamp, or NaN if it is missing or invalid."""
+    if not value:
+        return float('nan')
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return float('nan')
+
+def add_to_row_indexes(row: int, chunk_id: Optional[str], fields: Dict[str, Any], id_to_row: Dict[str, int],
+                       title_rows: Dict[str, List[int]], source_rows: Dict[str, List[int]]):
+    """Add a row, given its chunk ID and document-level fields, to the chunk ID, title and source indexes of a vector store."""
+    title_rows.setdefault(str(fields.get('title', '')).lower(), []).append(row)
+    source_rows.setdefault(str(fields.get('source', '')).lower(), []).append(row)
+    if chunk_id is not None:
+        id_to_row[chunk_id] = row
+
+class StoreSnapshot:
+    """
+    An immutable, versioned view of the rows of a vector store.
+    
+    Searches read the current snapshot without taking the store's lock. Everything
+    a snapshot refers to is either never modified again (the tombstone mask, the
+    BM25 statistics, the quantized rows, the sketches) or only ever appended to past
+    `size` (the embedding matrix, the chunk table, the chunk text, the metadata
+    index lists and the posting lists), and rows at or past `size` are ignored.
+    Writers apply a change first and then publish a new snapshot with a single
+    assignment, so a search never sees a half-applied batch, and rows never shift
+    under it. The only exception is the document centroids, whose existing sections
+    are updated in place (see services/document_centroids.py); that can change how
+    a search in flight ranks documents, but not which rows it can return.
+    """
+    
+    def __init__(self, version: int, array: np.ndarray, documents: ChunkTable, text: ChunkText,
+                 deleted: np.ndarray, deleted_count: int, id_to_row: Dict[str, int], doc_rows: Dict[str, np.ndarray],
+                 title_rows: Dict[str, List[int]], source_rows: Dict[str, List[int]], dates: np.ndarray,
+                 lexical: BM25Index, centroids: DocumentCentroids, ivf: Optional[IVFIndex],
+                 quantized: Optional[QuantizedMatrix], sketch: Optional[BinarySketch], tiers: Optional[TieredRows]):
+        self.version = version
+        self.array = array  # (size, dim) view of the normalized embeddings
+        self.size = len(array)
+        self.documents = documents  # Chunk metadata (without the 'content'), column by column
+        self.text = text
+        self.deleted = deleted
+        self.deleted_count = deleted_count
+        self.id_to_row = id_to_row
+        self.doc_rows = doc_rows
+        self.title_rows = title_rows
+        self.source_rows = source_rows
+        self.dates = dates
+        self.lexical = lexical
+        self.centroids = centroids
+        self.ivf = ivf
+        self.quantized = quantized
+        self.sketch = sketch
+        self.tiers = tiers
+    
+    def __len__(self) -> int:
+        """The number of live chunks in the snapshot."""
+        return self.size - self.deleted_count
+    
+    def chunk(self, row: int, max_chars: Optional[int] = None) -> Dict[str, Any]:
+        """A copy of a row's chunk dictionary with its 'content' read back (only the first max_chars characters if given)."""
+        chunk = self.documents.get(row)
+        chunk['content'] = self.text.get(row, max_chars)
+        return chunk
+    
+    def vectors(self, rows: np.ndarray) -> np.ndarray:
+        """The normalized embeddings of some rows (read through the hot tier of a tiered store)."""
+        if self.tiers is None:
+            return self.array[rows]
+        return self.tiers.take(self.array, rows)
+    
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """The cosine similarities of normalized queries against every row, as a (num_queries, size) array."""
+        if self.tiers is None:
+            return score_rows(queries, self.array)
+        return self.tiers.scores(queries, self.array)
+    
+    def live_rows(self, rows: List[int]) -> np.ndarray:
+        """Keep the rows that are inside the snapshot and not deleted, in order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[rows < self.size]
+        return rows[~self.deleted[rows]]
+
 class SimpleVectorStore:
-    """A simple vector store for document embeddings."""
+    """
+    A simple vector store for document embeddings.
+    
+    Chunks are stored as rows of a float32 embedding matrix with parallel metadata
+    columns (see services/chunk_table.py): document-level fields such as the title
+    and source are stored once per document, and chunk dictionaries are only built
+    for the chunks a search or lookup returns. Chunk text is kept in one
+    memory-mapped UTF-8 blob (see services/chunk_text.py) and only read back for
+    those chunks too. A hash index maps chunk IDs to rows and document IDs to their
+    rows, so lookups and deletes never scan the store. Deleted rows are tombstoned
+    (masked out of searches) and reclaimed by a background compaction once the dead
+    fraction crosses COMPACTION_THRESHOLD (unless the store was loaded from a
+    memory-mapped index, whose merge reclaims them without copying the mapped rows
+    into private memory).
     
-    def __init__(self):
-        self.documents = []  # List of document dictionaries
-        self.embeddings = []  # List of embedding vectors
+    Searches never take the store's lock: they read the current StoreSnapshot.
+    A batch of new chunks or deletions is applied under the lock and published as a
+    new snapshot in one step, and a full reindex (load_index) builds its rows and
+    indexes in the background and swaps them in the same way.
+    
+    Searches can be restricted by metadata (see filter_rows). Titles and sources
+    have their own inverted indexes and the date each row was added is kept in a
+    parallel timestamp array, so a filter resolves to candidate rows without
+    touching the embeddings.
+    
+    A BM25 inverted index over chunk text (see services/lexical_index.py) is kept in
+    step with the rows, so searches can also rank by exact terms (mode='lexical')
+    or fuse both rankings (mode='hybrid').
+    
+    Running centroids of each document's chunks (see services/document_centroids.py)
+    are updated as chunks are added and deleted, so mode='hierarchical' can pick the
+    closest documents first and only score their chunks.
+    
+    With index_type='ivf' the store also maintains an inverted-file index (see
+    services/ivf_index.py) once it holds IVF_MIN_TRAIN_SIZE chunks, and searches
+    only score the rows in the `nprobe` closest lists. The quantizer is trained and
+    retrained in the background; brute force is used until it is ready.
+    
+    With index_type='sketch' the store keeps a sign-bit sketch of every row (see
+    services/binary_sketch.py), 1 bit per dimension. Searches scan the sketches by
+    Hamming distance and re-score only the `sketch_candidates` nearest rows exactly.
+    
+    With `search_workers` > 1, brute-force searches split the rows into
+    `search_shards` shards (one per worker by default) and score them in parallel
+    on a thread pool shared by all searches (see services/partitioned_search.py).
+    
+    With quantization='int8' or 'float16' the store keeps a compact quantized copy
+    of the embeddings in memory (see services/quantization.py) for the first scoring
+    pass, and the full-precision rows live in memory-mapped files (the on-disk index,
+    plus scratch files under `storage_dir` for new rows). Only the best
+    `rerank_candidates` rows per query are read back and re-scored exactly.
+    
+    With a `ram_budget` (in bytes) the full-precision rows also live in
+    memory-mapped files, and a hot tier of at most that many bytes of row segments
+    is kept in process memory (see services/tiered_storage.py). Segments are
+    promoted and evicted by how often searches read them; the rest are scored in
+    streaming blocks from the mapped files.
+    """
+    
+    def __init__(self, compaction_threshold: float = COMPACTION_THRESHOLD, index_type: str = INDEX_TYPE_FLAT,
+                 nprobe: int = DEFAULT_NPROBE, quantization: Optional[str] = None,
+                 rerank_candidates: int = RERANK_CANDIDATES, storage_dir: Optional[str] = None,
+                 ram_budget: Optional[int] = None, sketch_candidates: int = SKETCH_CANDIDATES,
+                 search_workers: int = 1, search_shards: Optional[int] = None):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {index_type}")
+        if quantization not in (None, QUANTIZATION_INT8, QUANTIZATION_FLOAT16):
+            raise ValueError(f"Unknown quantization mode: {quantization}")
+        if ram_budget is not None and ram_budget < 0:
+            raise ValueError(f"Invalid RAM budget: {ram_budget}")
+        self.quantization = quantization
+        self.rerank_candidates = rerank_candidates
+        self.sketch_candidates = sketch_candidates
+        # Full-precision rows of a quantized or tiered store are kept in scratch files, not RAM
+        self._backing_dir = None
+        if quantization or ram_budget is not None:
+            self._backing_dir = storage_dir or tempfile.mkdtemp(prefix='vector-store-')
+        # Hot tier of a tiered store, or None when every row is read from self.embeddings
+        self._tiers = TieredRows(ram_budget) if ram_budget is not None else None
+        self.documents = ChunkTable()  # Metadata of every row (without its 'content'), column by column
+        self._text = ChunkText(self._backing_dir)  # The 'content' of every row
+        # Contiguous float32 matrix of L2-normalized embeddings, one row per document
+        self.embeddings = EmbeddingMatrix(backing_dir=self._backing_dir)
+        self._quantized = QuantizedMatrix(quantization) if quantization else None
+        self._sketch = BinarySketch() if index_type == INDEX_TYPE_SKETCH else None
+        # Parallel brute-force scoring, or None to score every row on the calling thread
+        self._partitioned = PartitionedSearch(search_workers, search_shards) if search_workers > 1 else None
+        self.compaction_threshold = compaction_threshold
+        self._id_to_row = {}  # Chunk ID -> row
+        # Document ID -> array of the rows of its chunks, in chunk order (may include deleted rows).
+        # Arrays are replaced, never modified, when a document gets new rows
+        self._doc_rows = {}
+        self._title_rows = {}  # Lowercased title -> rows (may include deleted rows)
+        self._source_rows = {}  # Lowercased source -> rows (may include deleted rows)
+        self._dates = np.zeros(0, dtype=np.float64)  # date_added timestamp (NaN if unknown), one entry per row
+        self._lexical = BM25Index()  # BM25 index over the text of every row
+        self._centroids = DocumentCentroids()  # Centroids of the chunks of every document
+        self._deleted = np.zeros(0, dtype=bool)  # Tombstone mask, one entry per row
+        self._deleted_count = 0
+        self._compacting = False
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self._ivf = None  # Trained IVFIndex, or None while brute force is used
+        self._ivf_training = False
+        self._adds_since_ivf_check = 0
+        # Serializes writers; searches read self._snapshot instead
+        self._lock = threading.RLock()
+        self._version = 0
+        self._snapshot = None
+        self._publish()
+    
+    def __len__(self) -> int:
+        """The number of live (not deleted) chunks in the store."""
+        return len(self._snapshot)
+    
+    def _publish(self):
+        """Publish the current rows and indexes as a new snapshot. Caller holds the lock."""
+        self._version += 1
+        self._snapshot = StoreSnapshot(
+            self._version, self.embeddings.array, self.documents.frozen(), self._text.frozen(), self._deleted, self._deleted_count,
+            self._id_to_row, self._doc_rows, self._title_rows, self._source_rows, self._dates,
+            self._lexical.frozen(), self._centroids.frozen(), self._ivf,
+            self._quantized.frozen() if self._quantized is not None else None,
+            self._sketch.frozen() if self._sketch is not None else None, self._tiers
+        )
+    
+    def snapshot(self) -> StoreSnapshot:
+        """The current snapshot; pass it to several searches to run them against the same rows."""
+        return self._snapshot
+    
+    def _grow_row_arrays(self, required: int):
+        """Grow the per-row tombstone and date arrays (by doubling) to hold `required` rows."""
+        if required <= len(self._deleted):
+            return
+        capacity = max(64, 2 * len(self._deleted), required)
+        deleted = np.zeros(capacity, dtype=bool)
+        deleted[:len(self._deleted)] = self._deleted
+        dates = np.full(capacity, np.nan, dtype=np.float64)
+        dates[:len(self._dates)] = self._dates
+        self._deleted = deleted
+        self._dates = dates
+    
+    def _index_rows(self, rows: range):
+        """Add new rows (already in self.documents) to the ID, document and metadata indexes."""
+        new_doc_rows = {}
+        for row in rows:
+            fields = self.documents.fields(row)
+            self._dates[row] = parse_timestamp(fields.get('date_added'))
+            add_to_row_indexes(row, self.documents.ids[row], fields, self._id_to_row, self._title_rows, self._source_rows)
+            doc_id = self.documents.document_id(row)
+            if doc_id is not None:
+                new_doc_rows.setdefault(doc_id, []).append(row)
+        for doc_id, doc_rows in new_doc_rows.items():
+            existing = self._doc_rows.get(doc_id)
+            if existing is not None:
+                doc_rows = np.concatenate([existing, doc_rows])
+            self._doc_rows[doc_id] = order_chunk_rows(doc_rows, self.documents)
+    
+    @staticmethod
+    def _build_row_indexes(chunks: ChunkTable) -> Tuple[Dict, Dict, Dict, Dict, np.ndarray]:
+        """Build the ID, document and metadata indexes and the date array for a full set of rows."""
+        id_to_row, doc_rows, title_rows, source_rows = {}, {}, {}, {}
+        dates = np.full(max(64, len(chunks)), np.nan, dtype=np.float64)
+        for row in range(len(chunks)):
+            fields = chunks.fields(row)
+            dates[row] = parse_timestamp(fields.get('date_added'))
+            add_to_row_indexes(row, chunks.ids[row], fields, id_to_row, title_rows, source_rows)
+            doc_id = chunks.document_id(row)
+            if doc_id is not None:
+                doc_rows.setdefault(doc_id, []).append(row)
+        doc_rows = {doc_id: order_chunk_rows(rows, chunks) for doc_id, rows in doc_rows.items()}
+        return id_to_row, doc_rows, title_rows, source_rows, dates
     
     def add(self, document: Dict[str, Any], embedding: List[float]):
         """Add a document and its embedding to the store."""
-        self.documents.append(document)
-        self.embeddings.append(embedding)
+        self.add_batch([document], [embedding])
+    
+    def add_batch(self, documents: List[Dict[str, Any]], embeddings: List[List[float]]):
+        """
+        Add several documents and their embeddings to the store at once.
+        
+        The batch is published as one snapshot, so searches see all of it or none of it.
+        
+        Args:
+            documents: The chunk dictionaries
+            embeddings: One embedding per chunk (a list of vectors or a 2-D array)
+        """
+        if len(documents) != len(embeddings):
+            raise ValueError(f"Got {len(documents)} documents but {len(embeddings)} embeddings")
+        if not documents:
+            return
+        
+        with self._lock:
+            self._append(documents, embeddings)
+            self._publish()
+    
+    def apply_changes(self, documents: List[Dict[str, Any]], embeddings: List[List[float]],
+                      deleted_doc_ids: List[str] = ()):
+        """
+        Replace and delete whole documents at once, e.g. to catch up with a newer index version.
+        
+        Every existing chunk of the deleted documents and of the documents that have
+        new chunks is tombstoned (a re-processed document replaces all of its old
+        chunks), then the new chunks are added. All of it is published as one snapshot.
+        
+        Args:
+            documents: The chunk dictionaries of the new chunks
+            embeddings: One embedding per chunk (a list of vectors or a 2-D array)
+            deleted_doc_ids: The documents to delete
+        """
+        if len(documents) != len(embeddings):
+            raise ValueError(f"Got {len(documents)} documents but {len(embeddings)} embeddings")
+        
+        with self._lock:
+            doc_ids = set(deleted_doc_ids)
+            doc_ids.update(get_chunk_document_id(document) for document in documents)
+            self._tombstone([row for doc_id in doc_ids for row in self._doc_rows.get(doc_id, [])])
+            if documents:
+                self._append(documents, embeddings)
+            self._publish()
+        self._maybe_compact()
+    
+    def _append(self, documents: List[Dict[str, Any]], embeddings: List[List[float]]):
+        """Add rows for new chunks to the embeddings and every index. Caller holds the lock and publishes the change."""
+        # Replace any existing chunks with the same IDs
+        existing = [self._id_to_row[doc['id']] for doc in documents if doc.get('id') in self._id_to_row]
+        if existing:
+            self._tombstone(existing)
+        
+        rows = self.embeddings.extend(embeddings)
+        if self._quantized is not None:
+            self._quantized.extend(self.embeddings.array[rows.start:rows.stop])
+        if self._sketch is not None:
+            self._sketch.extend(self.embeddings.array[rows.start:rows.stop])
+        self._text.extend([document.get('content') or '' for document in documents])
+        self.documents.extend(documents)
+        self._grow_row_arrays(rows.stop)
+        self._index_rows(rows)
+        self._lexical.add_rows(rows.start, [get_lexical_text(document) for document in documents])
+        self._centroids.add_rows(rows.start, [self.documents.document_id(row) for row in rows],
+                                 self.documents.chunk_indexes(rows).tolist(),
+                                 self.embeddings.array[rows.start:rows.stop])
+        
+        if self._ivf is not None:
+            self._ivf.add_rows(rows.start, self.embeddings.array[rows.start:rows.stop])
+        self._adds_since_ivf_check += len(documents)
+        if self._adds_since_ivf_check >= IVF_CHECK_INTERVAL:
+            self._adds_since_ivf_check = 0
+            self._maybe_train_ivf()
     
     def add_document(self, document: Dict[str, Any], embedding: List[float]):
         """Alias for add method to maintain compatibility."""
         self.add(document, embedding)
     
-    def search(self, query_embedding: List[float], top_k: int = 3) -> List[Dict[str, Any]]:
-        """Search for documents similar to the query embedding."""
-        if not self.embeddings:
+    def load_index(self, index: MappedIndex):
+        """
+        Replace the contents of the store with a memory-mapped index.
+        
+        The index vectors are used in place, so the embedding matrix stays backed by
+        the shared OS page cache until new documents are added. Rows of documents
+        deleted since the index segments were last merged are loaded as tombstones.
+        """
+        chunks = ChunkTable()
+        text = ChunkText(self._backing_dir)
+        dead_rows = []
+        
+        def add_dead_rows(end: int):
+            # Rows no document covers any more are loaded as placeholders and tombstoned
+            dead = range(len(chunks), end)
+            dead_rows.extend(dead)
+            chunks.extend([{'id': None}] * len(dead))
+            text.extend([''] * len(dead))
+        
+        for entry in sorted(index.documents, key=lambda entry: entry['start']):
+            add_dead_rows(entry['start'])
+            entry_chunks = index.chunks[entry['start']:entry['start'] + entry['count']]
+            fields = {
+                'doc_id': entry['doc_id'],
+                'title': entry.get('title', 'Untitled'),
+                'source': entry.get('source', 'Unknown'),
+                'date_added': entry.get('date_added')
+            }
+            chunks.extend_document(fields, [f"{entry['doc_id']}-{chunk_index}" for chunk_index, _ in entry_chunks],
+                                   [chunk_index for chunk_index, _ in entry_chunks])
+            text.extend([content for _, content in entry_chunks])
+        add_dead_rows(len(index))
+        
+        if len(index) == 0:
+            # An empty index has no dimension yet; start with an empty growable matrix
+            embeddings = EmbeddingMatrix(backing_dir=self._backing_dir)
+        else:
+            embeddings = EmbeddingMatrix.from_array(index.vectors, backing_dir=self._backing_dir)
+        self._replace(embeddings, chunks, text, dead_rows=dead_rows)
+    
+    def _replace(self, embeddings: EmbeddingMatrix, chunks: ChunkTable, text: ChunkText,
+                 old_to_new: Optional[np.ndarray] = None, quantized: Optional[QuantizedMatrix] = None,
+                 sketch: Optional[BinarySketch] = None, dead_rows: Optional[List[int]] = None):
+        """
+        Swap in a new set of rows, rebuild the indexes and publish a new snapshot.
+        
+        When the new rows are a compaction of the old ones, `old_to_new` gives the new
+        row of every old row (-1 if removed) so the IVF and BM25 indexes can be
+        renumbered instead of rebuilt, and `quantized` and `sketch` hold the matching
+        quantized rows and sketches. Otherwise (a full reindex) everything is built
+        before the lock is taken, so writers only wait for the swap and searches keep
+        using the previous snapshot until it is done. The new rows are assigned to the
+        centroids of a trained IVF index rather than retraining it, which only happens
+        once they no longer fit (see _maybe_train_ivf). `dead_rows` are tombstoned as part of the swap.
+        """
+        if self.quantization and quantized is None:
+            quantized = QuantizedMatrix(self.quantization)
+            for start in range(0, len(embeddings), 65536):
+                quantized.extend(embeddings.array[start:start + 65536])
+        if self.index_type == INDEX_TYPE_SKETCH and sketch is None:
+            sketch = BinarySketch()
+            for start in range(0, len(embeddings), 65536):
+                sketch.extend(embeddings.array[start:start + 65536])
+        lexical = None
+        if old_to_new is None:
+            lexical = BM25Index()
+            lexical.add_rows(0, [get_lexical_text(chunks.fields(row), text.get(row)) for row in range(len(chunks))])
+        row_indexes = self._build_row_indexes(chunks)
+        centroids = DocumentCentroids.build([chunks.document_id(row) for row in range(len(chunks))],
+                                            chunks.chunk_indexes(np.arange(len(chunks))).tolist(), embeddings.array)
+        ivf = None
+        previous_ivf = self._ivf
+        if (old_to_new is None and previous_ivf is not None and embeddings.array.ndim == 2
+                and embeddings.array.shape[1] == previous_ivf.centroids.shape[1]):
+            ivf = previous_ivf.reassigned(embeddings.array)
+        with self._lock:
+            if old_to_new is not None:
+                lexical = self._lexical.remapped(old_to_new)
+                if self._ivf is not None:
+                    ivf = self._ivf.remapped(old_to_new)
+            self._quantized = quantized
+            self._sketch = sketch
+            self._ivf = ivf
+            self._lexical = lexical
+            self._centroids = centroids
+            if self._tiers is not None:
+                # The rows are renumbered, so the hot segments no longer match them
+                self._tiers = self._tiers.renewed()
+            self.embeddings = embeddings
+            self.documents = chunks
+            self._text = text
+            self._id_to_row, self._doc_rows, self._title_rows, self._source_rows, self._dates = row_indexes
+            self._deleted = np.zeros(len(self._dates), dtype=bool)
+            self._deleted_count = 0
+            if dead_rows:
+                self._tombstone(dead_rows)
+            self._maybe_train_ivf()
+            self._publish()
+    
+    def get(self, chunk_id: str) -> Optional[Dict[str, Any]]:
+        """Get a chunk by its ID, or None if it does not exist."""
+        snapshot = self._snapshot
+        row = snapshot.id_to_row.get(chunk_id)
+        if row is None or row >= snapshot.size or snapshot.deleted[row]:
+            return None
+        return snapshot.chunk(row)
+    
+    def get_document_chunks(self, doc_id: str) -> List[Dict[str, Any]]:
+        """Get all live chunks of a document, in chunk order."""
+        snapshot = self._snapshot
+        return [snapshot.chunk(row) for row in snapshot.live_rows(snapshot.doc_rows.get(doc_id, [])).tolist()]
+    
+    def iter_documents(self, max_chars: Optional[int] = None):
+        """
+        Iterate over all live chunks in the store (as of the current snapshot).
+        
+        Args:
+            max_chars: If given, only the first max_chars characters of each chunk's content are read
+        """
+        snapshot = self._snapshot
+        for row in np.flatnonzero(~snapshot.deleted[:snapshot.size]).tolist():
+            yield snapshot.chunk(row, max_chars)
+    
+    def _tombstone(self, rows: List[int]):
+        """
+        Mark rows as deleted and drop them from the chunk ID index. Caller holds the
+        lock and publishes the change.
+        
+        The tombstone mask is replaced rather than updated in place, so published
+        snapshots keep their own view of which rows are live.
+        """
+        rows = sorted({row for row in rows if not self._deleted[row]})
+        if not rows:
+            return
+        deleted = self._deleted.copy()
+        deleted[rows] = True
+        self._lexical.remove_rows([get_lexical_text(self.documents.fields(row), self._text.get(row)) for row in rows])
+        self._centroids.remove_rows(rows, self.embeddings.array[rows])
+        for row in rows:
+            chunk_id = self.documents.ids[row]
+            if self._id_to_row.get(chunk_id) == row:
+                del self._id_to_row[chunk_id]
+        self._deleted = deleted
+        self._deleted_count += len(rows)
+    
+    def delete(self, chunk_ids: List[str]) -> int:
+        """
+        Delete chunks by ID.
+        
+        Args:
+            chunk_ids: The chunk IDs to delete
+            
+        Returns:
+            int: The number of chunks deleted
+        """
+        with self._lock:
+            # A set, so an ID given twice is deleted (and counted) once
+            rows = {self._id_to_row[chunk_id] for chunk_id in chunk_ids if chunk_id in self._id_to_row}
+            self._tombstone(rows)
+            self._publish()
+        self._maybe_compact()
+        return len(rows)
+    
+    def delete_document(self, doc_id: str) -> int:
+        """
+        Delete all chunks of a document.
+        
+        Args:
+            doc_id: The document ID
+            
+        Returns:
+            int: The number of chunks deleted
+        """
+        with self._lock:
+            rows = [row for row in self._doc_rows.get(doc_id, []) if not self._deleted[row]]
+            self._tombstone(rows)
+            self._publish()
+        self._maybe_compact()
+        return len(rows)
+    
+    def _maybe_compact(self):
+        """Start a background compaction if enough rows have been deleted."""
+        with self._lock:
+            total = len(self.documents)
+            if self._compacting or total == 0 or self._deleted_count / total < self.compaction_threshold:
+                return
+            if self.embeddings.base_rows:
+                # Rows of a mapped index are reclaimed by merging the index (see
+                # index_storage.merge_segments) and reloading it
+                return
+            self._compacting = True
+        threading.Thread(target=self.compact, daemon=True).start()
+    
+    def compact(self):
+        """Rewrite the store without its deleted rows."""
+        try:
+            with self._lock:
+                if self._deleted_count == 0:
+                    return
+                live = np.flatnonzero(~self._deleted[:len(self.documents)])
+                embeddings = self.embeddings.take(live)
+                quantized = self._quantized.take(live) if self._quantized is not None else None
+                sketch = self._sketch.take(live) if self._sketch is not None else None
+                text = self._text.take(live)
+                chunks = self.documents.take(live)
+                old_to_new = np.full(len(self.documents), -1, dtype=np.int64)
+                old_to_new[live] = np.arange(len(live))
+                removed = self._deleted_count
+                self._replace(embeddings, chunks, text, old_to_new, quantized, sketch)
+            print(f"Compacted vector store: removed {removed} deleted chunks, {len(chunks)} remain")
+        finally:
+            self._compacting = False
+    
+    def _maybe_train_ivf(self):
+        """Start (re)training the IVF index in the background if it is needed. Caller holds the lock."""
+        if self.index_type != INDEX_TYPE_IVF or self._ivf_training:
+            return
+        size = len(self.embeddings)
+        if self._ivf is None:
+            needed = size >= IVF_MIN_TRAIN_SIZE
+        else:
+            needed = (self._ivf.imbalance() > IVF_MAX_IMBALANCE
+                      or size > IVF_MAX_GROWTH * max(1, self._ivf.trained_size))
+        if not needed:
+            return
+        self._ivf_training = True
+        threading.Thread(target=self.train_ivf, daemon=True).start()
+    
+    def train_ivf(self):
+        """
+        Train a new IVF index on the current rows and swap it in.
+        
+        Normally this runs in a background thread started by the store; it can also
+        be called directly to build the index synchronously.
+        """
+        self._ivf_training = True
+        try:
+            with self._lock:
+                embeddings = self.embeddings
+                size = len(embeddings)
+                vectors = embeddings.array
+            
+            print(f"Training IVF index on {size} chunks")
+            ivf = IVFIndex.train(vectors, nprobe=self.nprobe)
+            
+            with self._lock:
+                if self.embeddings is not embeddings:
+                    # The rows were replaced while training; the new rows get their own training
+                    return
+                # Assign rows that were added while training
+                ivf.add_rows(size, self.embeddings.array[size:])
+                self._ivf = ivf
+                self._publish()
+            print(f"IVF index ready: {ivf.num_lists} lists, imbalance {ivf.imbalance():.1f}")
+        except Exception as e:
+            print(f"Error training IVF index: {str(e)}")
+        finally:
+            self._ivf_training = False
+    
+    def filter_rows(self, search_filter: Dict[str, Any], snapshot: Optional[StoreSnapshot] = None) -> Optional[np.ndarray]:
+        """
+        Resolve a metadata filter to the live rows it matches.
+        
+        `doc_id`, `title` and `source` take a string or a list of strings (titles and
+        sources match case-insensitively); `date_added` takes an object with an
+        optional `from` and `to` ISO 8601 date. A row must match every given field,
+        and any of the values given for a field.
+        
+        Args:
+            search_filter: The filter, e.g. {'title': ['a.pdf', 'b.pdf'], 'date_added': {'from': '2024-01-01'}}
+            snapshot: The snapshot to resolve the filter against (defaults to the current one)
+            
+        Returns:
+            Optional[np.ndarray]: The sorted matching rows, or None if the filter is empty
+            
+        Raises:
+            ValueError: If the filter is malformed
+        """
+        if not isinstance(search_filter, dict):
+            raise ValueError("Filter must be an object")
+        unknown = set(search_filter) - set(FILTER_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown filter field(s): {', '.join(sorted(unknown))}")
+        
+        if snapshot is None:
+            snapshot = self._snapshot
+        size = snapshot.size
+        rows = None
+        for field, index in (('doc_id', snapshot.doc_rows), ('title', snapshot.title_rows), ('source', snapshot.source_rows)):
+            if field not in search_filter:
+                continue
+            values = search_filter[field]
+            if isinstance(values, str):
+                values = [values]
+            if not isinstance(values, (list, tuple)) or not all(isinstance(value, str) for value in values):
+                raise ValueError(f"Filter field '{field}' must be a string or a list of strings")
+            if field != 'doc_id':
+                values = [value.lower() for value in values]
+            matched = np.unique(np.array([row for value in values for row in index.get(value, [])], dtype=np.int64))
+            # The index lists may already hold rows added after the snapshot
+            matched = matched[matched < size]
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        
+        if 'date_added' in search_filter:
+            date_range = search_filter['date_added']
+            if not isinstance(date_range, dict) or not date_range or not set(date_range) <= {'from', 'to'}:
+                raise ValueError("Filter field 'date_added' must be an object with 'from' and/or 'to' dates")
+            # Rows without a date compare False, so they never match a date range
+            dates = snapshot.dates[:size]
+            in_range = np.ones(size, dtype=bool)
+            if 'from' in date_range:
+                in_range &= dates >= parse_date_bound(date_range['from'])
+            if 'to' in date_range:
+                in_range &= dates <= parse_date_bound(date_range['to'], end=True)
+            rows = np.flatnonzero(in_range) if rows is None else rows[in_range[rows]]
+        
+        if rows is None:
+            return None
+        return rows[~snapshot.deleted[rows]]
+    
+    def _score_subset(self, queries: np.ndarray, snapshot: StoreSnapshot, rows: np.ndarray,
+                      top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Score normalized queries exactly against a subset of rows only.
+        
+        Returns:
+            List[Tuple[np.ndarray, np.ndarray]]: The top rows and their similarities, per query
+        """
+        similarities = queries @ snapshot.vectors(rows).T
+        return [(rows[indices], row_similarities[indices])
+                for row_similarities, indices in zip(similarities, top_k_indices_batch(similarities, top_k))]
+    
+    def _score_query(self, query: np.ndarray, snapshot: StoreSnapshot, deleted: Optional[np.ndarray],
+                     ivf: Optional[IVFIndex], top_k: int, nprobe: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score a single normalized query against the IVF candidates of the store.
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The top rows and their similarities
+        """
+        rows = ivf.candidates(query, nprobe)
+        rows = rows[rows < snapshot.size]
+        if deleted is not None:
+            rows = rows[~deleted[rows]]
+        similarities = snapshot.vectors(rows) @ query
+        best = top_k_indices(similarities, top_k)
+        return rows[best], similarities[best]
+    
+    def _score_quantized(self, queries: np.ndarray, snapshot: StoreSnapshot, quantized: QuantizedMatrix,
+                         deleted: Optional[np.ndarray], top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Score normalized queries against the quantized rows, then re-score the best candidates exactly.
+        
+        Returns:
+            List[Tuple[np.ndarray, np.ndarray]]: The top rows and their exact similarities, per query
+        """
+        size = snapshot.size
+        approximate = quantized.scores_batch(queries)[:, :size]
+        if deleted is not None:
+            approximate[:, deleted] = -np.inf
+        candidates = top_k_indices_batch(approximate, max(top_k, self.rerank_candidates))
+        
+        hits = []
+        for query, approximate_scores, rows in zip(queries, approximate, candidates):
+            rows = np.sort(rows[np.isfinite(approximate_scores[rows])])
+            # Reading the candidate rows pages in only their full-precision vectors
+            similarities = snapshot.vectors(rows) @ query
+            best = top_k_indices(similarities, top_k)
+            hits.append((rows[best], similarities[best]))
+        return hits
+    
+    def _score_sketch(self, queries: np.ndarray, snapshot: StoreSnapshot, sketch: BinarySketch,
+                      deleted: Optional[np.ndarray], top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Select candidates by the Hamming distance of their sign-bit sketches, then re-score them exactly.
+        
+        Returns:
+            List[Tuple[np.ndarray, np.ndarray]]: The top rows and their exact similarities, per query
+        """
+        hits = []
+        for query, rows in zip(queries, sketch.candidates(queries, max(top_k, self.sketch_candidates), deleted)):
+            similarities = snapshot.vectors(rows) @ query
+            best = top_k_indices(similarities, top_k)
+            hits.append((rows[best], similarities[best]))
+        return hits
+    
+    def memory_usage(self) -> Dict[str, Any]:
+        """Report how many bytes the store's vectors occupy in memory."""
+        chunks = len(self.documents)
+        resident = self.embeddings.nbytes_resident
+        if self._quantized is not None:
+            resident += self._quantized.nbytes
+        if self._sketch is not None:
+            resident += self._sketch.nbytes
+        tiers = self._tiers.stats() if self._tiers is not None else None
+        if tiers is not None:
+            resident += tiers['hot_bytes']
+        return {
+            'chunks': chunks,
+            'quantization': self.quantization,
+            'vector_bytes': resident,
+            'bytes_per_chunk': resident / chunks if chunks else 0,
+            'text_bytes': self._text.nbytes,  # Memory-mapped, not resident
+            'tiers': tiers
+        }
+    
+    def search(self, query_embedding: List[float], top_k: int = 3, nprobe: Optional[int] = None,
+               filter: Optional[Dict[str, Any]] = None, query_text: Optional[str] = None,
+               mode: str = SEARCH_MODE_VECTOR, snapshot: Optional[StoreSnapshot] = None,
+               expand: int = 0, mmr_lambda: Optional[float] = None,
+               top_documents: int = TOP_DOCUMENTS) -> List[Dict[str, Any]]:
+        """Search for documents similar to the query embedding (see search_batch)."""
+        query_texts = None if query_text is None else [query_text]
+        return self.search_batch([query_embedding], top_k=top_k, nprobe=nprobe, filter=filter,
+                                 query_texts=query_texts, mode=mode, snapshot=snapshot, expand=expand,
+                                 mmr_lambda=mmr_lambda, top_documents=top_documents)[0]
+    
+    def rank_documents(self, query_embedding: List[float], top_documents: int = TOP_DOCUMENTS,
+                       filter: Optional[Dict[str, Any]] = None,
+                       snapshot: Optional[StoreSnapshot] = None) -> List[Dict[str, Any]]:
+        """
+        Rank whole documents by how close their chunk centroids are to a query.
+        
+        Args:
+            query_embedding: The query embedding
+            top_documents: The number of documents to return
+            filter: An optional metadata filter (see filter_rows); only sections
+                with a matching chunk are considered
+            snapshot: The snapshot to search (see snapshot())
+            
+        Returns:
+            List[Dict[str, Any]]: The best documents, best first, each with its
+            'doc_id', 'title', 'source' and 'score' (the cosine similarity of its
+            closest section centroid)
+            
+        Raises:
+            ValueError: If the filter or top_documents is invalid
+        """
+        if not isinstance(top_documents, int) or isinstance(top_documents, bool) or top_documents < 1:
+            raise ValueError("top_documents must be a positive integer")
+        if snapshot is None:
+            snapshot = self._snapshot
+        allowed = self.filter_rows(filter, snapshot) if filter else None
+        if snapshot.size == 0 or (allowed is not None and len(allowed) == 0):
             return []
+        query = normalize_vector(query_embedding)
+        if len(query) != snapshot.array.shape[1]:
+            raise ValueError(f"Query has dimension {len(query)}, expected {snapshot.array.shape[1]}")
+        
+        centroids = snapshot.centroids
+        sections = centroids.sections_of(allowed) if allowed is not None else None
+        numbers, scores = centroids.rank(query[None, :], top_documents, sections)[0]
+        ranked = []
+        for number, score in zip(numbers.tolist(), scores.tolist()):
+            doc_id = centroids.document_ids[number]
+            rows = snapshot.live_rows(snapshot.doc_rows.get(doc_id, []))
+            first = snapshot.documents.fields(rows[0]) if len(rows) else {}
+            ranked.append({
+                'doc_id': doc_id,
+                'title': first.get('title', 'Unknown'),
+                'source': first.get('source', 'Unknown'),
+                'score': score
+            })
+        return ranked
+    
+    def _score_hierarchical(self, snapshot: StoreSnapshot, queries: np.ndarray, allowed: Optional[np.ndarray],
+                            top_k: int, top_documents: int) -> Tuple[List[Tuple[np.ndarray, np.ndarray]],
+                                                                     List[Dict[str, float]]]:
+        """
+        Rank documents by their centroids, then score only the chunks of the best ones exactly.
+        
+        Returns:
+            Tuple[List[Tuple[np.ndarray, np.ndarray]], List[Dict[str, float]]]: The top
+            rows and their similarities per query, and the score of each ranked document
+            (by document ID) per query
+        """
+        centroids = snapshot.centroids
+        sections = centroids.sections_of(allowed) if allowed is not None else None
+        hits = []
+        document_scores = []
+        for query, (numbers, scores) in zip(queries, centroids.rank(queries, top_documents, sections)):
+            doc_ids = [centroids.document_ids[number] for number in numbers.tolist()]
+            document_scores.append(dict(zip(doc_ids, scores.tolist())))
+            rows = [snapshot.live_rows(snapshot.doc_rows.get(doc_id, [])) for doc_id in doc_ids]
+            rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+            if allowed is not None:
+                rows = rows[np.isin(rows, allowed)]
+            similarities = snapshot.vectors(rows) @ query
+            best = top_k_indices(similarities, top_k)
+            hits.append((rows[best], similarities[best]))
+        return hits, document_scores
+    
+    def _fuse(self, query: np.ndarray, snapshot: StoreSnapshot, vector_hits: Tuple[np.ndarray, np.ndarray],
+              lexical_hits: Tuple[np.ndarray, np.ndarray], top_k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Combine a vector and a BM25 ranking with reciprocal rank fusion.
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: The top rows, their fusion scores
+            and their exact cosine similarities
+        """
+        fusion = {}
+        for ranking in (vector_hits[0], lexical_hits[0]):
+            for rank, row in enumerate(ranking.tolist()):
+                fusion[row] = fusion.get(row, 0.0) + 1.0 / (RRF_K + rank + 1)
+        rows = np.array(list(fusion), dtype=np.int64)
+        fusion_scores = np.array(list(fusion.values()), dtype=np.float32)
+        best = top_k_indices(fusion_scores, top_k)
+        rows = rows[best]
+        return rows, fusion_scores[best], snapshot.vectors(rows) @ query
+    
+    def _expand(self, snapshot: StoreSnapshot, rows: np.ndarray, results: List[Dict[str, Any]],
+                expand: int) -> List[Dict[str, Any]]:
+        """
+        Widen ranked hits into windows of neighbouring chunks from the same document.
+        
+        Every hit is widened to the `expand` live chunks before and after it, in
+        chunk order. Windows of the same document that overlap or touch are merged,
+        so no chunk is returned twice, and a merged window takes the place and the
+        scores of its best hit.
+        
+        Args:
+            snapshot: The snapshot the hits came from
+            rows: The rows of the hits, best first
+            results: The result dictionaries of the hits, in the same order
+            expand: The number of neighbouring chunks to add on each side of a hit
+            
+        Returns:
+            List[Dict[str, Any]]: One result per window, ordered by its best hit. Its
+            'content' is the text of the window's chunks in order, 'window' lists their
+            chunk IDs and 'window_start' is the position of the first one in the document
+        """
+        orders = {}  # Document (or lone chunk) -> its live rows in chunk order
+        spans = {}  # Document (or lone chunk) -> [start, end, rank] of each hit's window
+        for rank, row in enumerate(rows.tolist()):
+            key = snapshot.documents.document_id(row)
+            if key not in orders:
+                orders[key] = snapshot.live_rows(snapshot.doc_rows.get(key, [])) if key is not None else None
+            order = orders[key]
+            position = np.flatnonzero(order == row) if order is not None else []
+            if len(position) == 0:
+                # The chunk is not indexed under a document; it forms a window on its own
+                key = ('row', row)
+                orders[key] = np.array([row], dtype=np.int64)
+                spans[key] = [[0, 0, rank]]
+                continue
+            position = int(position[0])
+            spans.setdefault(key, []).append([max(0, position - expand), min(len(order) - 1, position + expand), rank])
+        
+        windows = []
+        for key, document_spans in spans.items():
+            document_spans.sort()
+            merged = [document_spans[0]]
+            for start, end, rank in document_spans[1:]:
+                last = merged[-1]
+                if start <= last[1] + 1:
+                    last[1] = max(last[1], end)
+                    last[2] = min(last[2], rank)
+                else:
+                    merged.append([start, end, rank])
+            windows.extend((rank, start, orders[key][start:end + 1]) for start, end, rank in merged)
+        windows.sort(key=lambda window: window[0])
+        
+        expanded = []
+        for rank, start, window_rows in windows:
+            window_rows = window_rows.tolist()
+            result = results[rank]
+            result['content'] = '\n'.join(snapshot.text.get(row) for row in window_rows)
+            result['window'] = [snapshot.documents.ids[row] for row in window_rows]
+            result['window_start'] = start
+            expanded.append(result)
+        return expanded
+    
+    def search_batch(self, query_matrix: List[List[float]], top_k: int = 3, nprobe: Optional[int] = None,
+                     filter: Optional[Dict[str, Any]] = None, query_texts: Optional[List[str]] = None,
+                     mode: str = SEARCH_MODE_VECTOR, snapshot: Optional[StoreSnapshot] = None,
+                     expand: int = 0, mmr_lambda: Optional[float] = None,
+                     top_documents: int = TOP_DOCUMENTS) -> List[List[Dict[str, Any]]]:
+        """
+        Search for documents similar to each of several query embeddings.
+        
+        The search runs against one snapshot of the store (the current one unless
+        `snapshot` is given) without taking the store's lock, so it is never blocked
+        by ingestion and never sees rows being added, deleted or compacted.
+        
+        With a flat index, all queries are scored with a single matrix product and
+        the top_k rows per query are selected with argpartition. With a trained IVF
+        index, each query only scores the rows in its `nprobe` closest lists.
+        Deleted rows are never returned.
+        
+        A narrow `filter` is resolved to its matching rows first and only those rows
+        are scored (exactly); a broad one is applied as a mask like deleted rows.
         
-        # Convert embeddings to numpy array for efficient computation
-        embeddings_array = np.array(self.embeddings)
-        query_array = np.array(query_embedding)
+        With mode='lexical' rows are ranked by the BM25 score of `query_texts`, and
+        with mode='hybrid' the vector and BM25 rankings are fused with reciprocal
+        rank fusion. Results of these modes carry a 'bm25_score' (and, for hybrid,
+        a 'fusion_score') next to the cosine 'similarity', and are not cut off by the
+        similarity threshold.
         
-        # Calculate cosine similarity
-        dot_product = np.dot(embeddings_array, query_array)
-        norm_embeddings = np.linalg.norm(embeddings_array, axis=1)
-        norm_query = np.linalg.norm(query_array)
+        With mode='hierarchical' the documents are ranked first by their closest
+        section centroid (see services/document_centroids.py), and only the chunks
+        of the best `top_documents` documents are scored, exactly. Results carry
+        the 'document_score' of their document next to the 'similarity'.
         
-        # Avoid division by zero
-        similarities = dot_product / (norm_embeddings * norm_query + 1e-10)
+        With mmr_lambda set, MMR_POOL_FACTOR * top_k candidates are retrieved and
+        top_k of them are chosen by maximal marginal relevance (see services/mmr.py),
+        so near-duplicate chunks (e.g. from overlapping chunk boundaries) do not
+        crowd out other results. Relevance is the cosine similarity in vector mode
+        and the BM25 or fusion score, scaled to the best candidate, otherwise.
         
-        # Lower the threshold to 0.3 to catch more potential matches
-        # Get indices of top_k most similar documents with similarity > 0.3
-        indices = np.where(similarities > 0.3)[0]
-        if len(indices) == 0:
-            # If no results above threshold, just return top matches
-            indices = np.argsort(-similarities)[:top_k]
+        With expand=N every hit comes back as a window: the hit and the N chunks
+        before and after it in its document, with overlapping windows merged (see
+        _expand).
+        
+        Args:
+            query_matrix: A list of query embeddings (or a 2-D array)
+            top_k: The number of results to return per query
+            nprobe: The number of IVF lists to probe (defaults to the store's nprobe)
+            filter: An optional metadata filter (see filter_rows)
+            query_texts: The query strings, required by the lexical and hybrid modes
+            mode: One of SEARCH_MODES
+            snapshot: The snapshot to search (see snapshot())
+            expand: The number of neighbouring chunks to return on each side of a hit (at most MAX_EXPAND)
+            mmr_lambda: Enables MMR re-ranking with this relevance/diversity trade-off (0 to 1)
+            top_documents: The number of documents whose chunks hierarchical search scores
+            
+        Returns:
+            List[List[Dict[str, Any]]]: The search results for each query, in order
+            
+        Raises:
+            ValueError: If the filter, mode, expand, mmr_lambda or top_documents is invalid
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        if not isinstance(top_documents, int) or isinstance(top_documents, bool) or top_documents < 1:
+            raise ValueError("top_documents must be a positive integer")
+        if not isinstance(expand, int) or isinstance(expand, bool) or not 0 <= expand <= MAX_EXPAND:
+            raise ValueError(f"expand must be an integer from 0 to {MAX_EXPAND}")
+        if mmr_lambda is not None:
+            mmr_lambda = validate_mmr_lambda(mmr_lambda)
+        lexical = mode in (SEARCH_MODE_LEXICAL, SEARCH_MODE_HYBRID)
+        if lexical and (query_texts is None or len(query_texts) != len(query_matrix)):
+            raise ValueError(f"Search mode '{mode}' needs one query text per query embedding")
+        if len(query_matrix) == 0:
+            return []
+        
+        if snapshot is None:
+            snapshot = self._snapshot
+        array = snapshot.array
+        size = snapshot.size
+        deleted = snapshot.deleted[:size] if snapshot.deleted_count else None
+        ivf = snapshot.ivf
+        quantized = snapshot.quantized
+        sketch = snapshot.sketch
+        allowed = self.filter_rows(filter, snapshot) if filter else None
+        
+        if size == 0 or (allowed is not None and len(allowed) == 0):
+            return [[] for _ in range(len(query_matrix))]
+        
+        queries = np.stack([normalize_vector(query) for query in query_matrix])
+        if queries.shape[1] != array.shape[1]:
+            raise ValueError(f"Queries have dimension {queries.shape[1]}, expected {array.shape[1]}")
+        
+        subset = allowed is not None and len(allowed) <= FILTER_SUBSET_FRACTION * size
+        if allowed is not None and mode != SEARCH_MODE_HIERARCHICAL and (not subset or mode != SEARCH_MODE_VECTOR):
+            # Everything outside the filter is masked out, together with the deleted rows
+            # (BM25 scoring always works on a mask)
+            deleted = np.ones(size, dtype=bool)
+            deleted[allowed] = False
+        
+        # MMR picks the results from a larger pool of candidates
+        pool = top_k if mmr_lambda is None else MMR_POOL_FACTOR * top_k
+        candidates = max(pool, HYBRID_CANDIDATES) if mode == SEARCH_MODE_HYBRID else pool
+        
+        lexical_hits = []
+        if lexical:
+            lexical_hits = [snapshot.lexical.search(text, candidates, size, deleted) for text in query_texts]
+        
+        hits = []
+        document_scores = None
+        if mode == SEARCH_MODE_LEXICAL:
+            pass  # Ranked by BM25 alone
+        elif mode == SEARCH_MODE_HIERARCHICAL:
+            hits, document_scores = self._score_hierarchical(snapshot, queries, allowed, candidates, top_documents)
+        elif subset:
+            hits = self._score_subset(queries, snapshot, allowed, candidates)
+        elif ivf is not None:
+            for query in queries:
+                hits.append(self._score_query(query, snapshot, deleted, ivf, candidates, nprobe))
+        elif sketch is not None:
+            hits = self._score_sketch(queries, snapshot, sketch, deleted, candidates)
+        elif quantized is not None:
+            hits = self._score_quantized(queries, snapshot, quantized, deleted, candidates)
+        elif self._partitioned is not None and snapshot.tiers is None:
+            hits = self._partitioned.top_k(queries, array, deleted, candidates)
         else:
-            # Sort by similarity (descending)
-            indices = indices[np.argsort(-similarities[indices])]
-            indices = indices[:top_k]  # Take top_k
+            # Rows are stored normalized, so cosine similarity is a single matrix product
+            similarities = snapshot.scores(queries)
+            if deleted is not None:
+                similarities[:, deleted] = -np.inf
+            for row_similarities, indices in zip(similarities, top_k_indices_batch(similarities, candidates)):
+                indices = indices[np.isfinite(row_similarities[indices])]
+                hits.append((indices, row_similarities[indices]))
+        
+        all_results = []
+        if not lexical:
+            for i, (indices, scores) in enumerate(hits):
+                # Lower the threshold to 0.3 to catch more potential matches
+                # Keep only the top matches with similarity > 0.3, unless none of them are
+                above_threshold = scores > 0.3
+                if above_threshold.any():
+                    indices, scores = indices[above_threshold], scores[above_threshold]
+                if mmr_lambda is not None:
+                    selected = mmr_select(snapshot.vectors(indices), scores, top_k, mmr_lambda)
+                    indices, scores = indices[selected], scores[selected]
+                
+                # Return documents with similarity scores
+                results = []
+                for idx, score in zip(indices.tolist(), scores):
+                    doc = snapshot.chunk(idx)
+                    doc['similarity'] = float(score)
+                    if document_scores is not None:
+                        doc['document_score'] = document_scores[i][get_chunk_document_id(doc)]
+                    results.append(doc)
+                if expand:
+                    results = self._expand(snapshot, indices, results, expand)
+                all_results.append(results)
+            return all_results
         
-        # Return documents with similarity scores
-        results = []
-        for idx in indices:
-            doc = self.documents[idx].copy()
-            doc['similarity'] = float(similarities[idx])
-            results.append(doc)
+        for i, query in enumerate(queries):
+            bm25_scores = dict(zip(lexical_hits[i][0].tolist(), lexical_hits[i][1].tolist()))
+            if mode == SEARCH_MODE_HYBRID:
+                indices, fusion_scores, similarities = self._fuse(query, snapshot, hits[i], lexical_hits[i], pool)
+            else:
+                indices = lexical_hits[i][0]
+                fusion_scores, similarities = None, snapshot.vectors(indices) @ query
+            if mmr_lambda is not None and len(indices) > 0:
+                relevance = fusion_scores if fusion_scores is not None else lexical_hits[i][1]
+                selected = mmr_select(snapshot.vectors(indices), relevance / relevance.max(), top_k, mmr_lambda)
+                indices, similarities = indices[selected], similarities[selected]
+                if fusion_scores is not None:
+                    fusion_scores = fusion_scores[selected]
+            
+            results = []
+            for j, idx in enumerate(indices.tolist()):
+                doc = snapshot.chunk(idx)
+                doc['similarity'] = float(similarities[j])
+                doc['bm25_score'] = bm25_scores.get(idx, 0.0)
+                if fusion_scores is not None:
+                    doc['fusion_score'] = float(fusion_scores[j])
+                results.append(doc)
+            if expand:
+                results = self._expand(snapshot, indices, results, expand)
+            all_results.append(results)
         
-        return results
+        return all_results
 
-# Initialize vector store
-vector_store = SimpleVectorStore()
+# Initialize vector stores (set VECTOR_INDEX_TYPE=ivf or sketch for large knowledge bases,
+# VECTOR_QUANTIZATION=int8 or float16 to keep only quantized vectors in memory,
+# VECTOR_RAM_BUDGET, e.g. 256M, to cap the full-precision vectors held in memory, and
+# VECTOR_SEARCH_WORKERS to score shards of the rows on several cores)
+def create_vector_store() -> SimpleVectorStore:
+    """Create an empty vector store configured from the environment."""
+    return SimpleVectorStore(
+        index_type=os.getenv('VECTOR_INDEX_TYPE', INDEX_TYPE_FLAT),
+        nprobe=int(os.getenv('VECTOR_INDEX_NPROBE', DEFAULT_NPROBE)),
+        quantization=os.getenv('VECTOR_QUANTIZATION') or None,
+        ram_budget=parse_byte_size(os.getenv('VECTOR_RAM_BUDGET')),
+        search_workers=int(os.getenv('VECTOR_SEARCH_WORKERS', 1)),
+        search_shards=int(os.getenv('VECTOR_SEARCH_SHARDS', 0)) or None
+    )
 
-# Load existing documents from the knowledge base directory
-def load_existing_documents():
-    """Load existing documents from the knowledge base directory."""
-    if not os.path.exists(KNOWLEDGE_BASE_DIR):
-        return
-    
-    # Iterate through document directories
-    for doc_dir_name in os.listdir(KNOWLEDGE_BASE_DIR):
-        doc_dir = os.path.join(KNOWLEDGE_BASE_DIR, doc_dir_name)
-        if not os.path.isdir(doc_dir):
+def is_collection_dir(path: str) -> bool:
+    """Check whether a directory inside the knowledge base directory is a collection (not a document)."""
+    return os.path.isfile(os.path.join(path, COLLECTION_MARKER))
+
+def get_index_change_chunks(changes: IndexChanges,
+                            skip_start: Optional[int] = None) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+    """
+    Build the chunk dictionaries and embeddings of the documents appended to an index
+    (see index_storage.read_index_changes), except the one whose rows start at `skip_start`.
+    """
+    documents = []
+    rows = []
+    start = 0
+    for entry in changes.documents:
+        if entry['start'] == skip_start:
+            start += entry['count']
             continue
+        rows.extend(range(start, start + entry['count']))
+        for chunk_index, content in changes.chunks[start:start + entry['count']]:
+            documents.append({
+                'id': f"{entry['doc_id']}-{chunk_index}",
+                'doc_id': entry['doc_id'],
+                'title': entry.get('title', 'Untitled'),
+                'source': entry.get('source', 'Unknown'),
+                'date_added': entry.get('date_added'),
+                'chunk_index': chunk_index,
+                'content': content
+            })
+        start += entry['count']
+    return documents, changes.vectors[rows]
+
+class KnowledgeBaseCollection:
+    """
+    A named knowledge base: its document directories, its on-disk index (see
+    services/index_storage.py) and the vector store searches run against.
+    
+    Collections are independent, so a search only scores the chunks of its own
+    collection, and each one attaches to, merges and reports on its own index.
+    """
+    
+    def __init__(self, name: str, directory: str, embedding_backend: EmbeddingBackend):
+        self.name = name
+        self.directory = directory
+        # Embeds the collection's chunks and the queries searching them
+        self.embedding_backend = embedding_backend
+        self.vector_store = create_vector_store()
+        # Version (and manifest) of the on-disk index this process has attached to, and when it last checked for a newer one
+        self._index_state = {'version': None, 'manifest': None, 'checked_at': 0.0, 'reloading': False, 'merging': False}
+        self._index_state_lock = threading.Lock()
+        # Serializes loading index versions into the vector store, so an older version never replaces a newer one
+        self._attach_lock = threading.Lock()
+    
+    @property
+    def index_version(self) -> Optional[int]:
+        """The version of the on-disk index the vector store holds, or None before one is attached."""
+        return self._index_state['version']
+    
+    def _attach_index(self, index: MappedIndex) -> bool:
+        """Load a mapped index into the vector store unless the same or a newer version is already attached."""
+        with self._attach_lock:
+            if self._index_state['version'] is not None and index.version <= self._index_state['version']:
+                return False
+            self.vector_store.load_index(index)
+            self._index_state['version'] = index.version
+            self._index_state['manifest'] = index.manifest
+        return True
+    
+    def _catch_up(self, published_start: Optional[int] = None, published_documents: List[Dict[str, Any]] = (),
+                  published_embeddings: Optional[np.ndarray] = None) -> bool:
+        """
+        Bring the vector store up to the latest index version.
         
-        # Check for metadata file
-        metadata_path = os.path.join(doc_dir, 'metadata.json')
-        if not os.path.exists(metadata_path):
-            continue
+        Only the documents appended and deleted since the attached version are read
+        (see index_storage.read_index_changes) and applied to the store as one
+        snapshot, so its rows and indexes are kept rather than rebuilt. The whole
+        index is only loaded again when its segments were merged since then.
         
-        # Load metadata
-        with open(metadata_path, 'r') as f:
-            metadata = json.load(f)
+        Args:
+            published_start: The first index row of a document this process has just appended
+            published_documents: The chunk dictionaries of that document, which are applied
+                as they are instead of being read back from the index (unless the document
+                was deleted or published again by another worker in the meantime)
+            published_embeddings: Their normalized embeddings
         
-        # Load document chunks
-        for chunk_file in os.listdir(doc_dir):
-            if not chunk_file.endswith('.json') or chunk_file == 'metadata.json':
-                continue
+        Returns:
+            bool: Whether the store moved to a newer version
+        """
+        with self._attach_lock:
+            manifest = self._index_state['manifest']
+            changes = read_index_changes(self.directory, manifest) if manifest is not None else None
+            if changes is not None:
+                if changes.version <= self._index_state['version']:
+                    return False
+                documents, embeddings = get_index_change_chunks(changes, published_start)
+                # The published record is only still live if read_index_changes() kept it
+                if published_documents and any(entry['start'] == published_start for entry in changes.documents):
+                    documents = documents + list(published_documents)
+                    embeddings = np.concatenate([embeddings, published_embeddings])
+                self.vector_store.apply_changes(documents, embeddings, changes.deleted)
+                self._index_state['version'] = changes.version
+                self._index_state['manifest'] = changes.manifest
+                return True
+        # The segments were rewritten since the attached version (or none is attached yet)
+        index = read_index(self.directory)
+        return index is not None and self._attach_index(index)
+    
+    def load_existing_documents(self):
+        """
+        Load existing documents from the collection's directory.
+        
+        Documents are read from the binary index (see services/index_storage.py), which
+        is memory-mapped rather than parsed, so every worker process shares one copy of
+        the vectors through the OS page cache. Only a knowledge base without a segment
+        index yet is migrated from the legacy per-chunk JSON files first; documents
+        added since then only exist in the segment logs, so an index that cannot be
+        read raises an error instead of being rebuilt without them.
+        """
+        if not os.path.exists(self.directory):
+            return
+        
+        index = open_index(self.directory)
+        if index is None:
+            return
+        
+        self._attach_index(index)
+        print(f"Loaded {len(index)} chunks from {len(index.documents)} documents into collection "
+              f"'{self.name}' (index version {index.version}, embeddings from {self.embedding_backend.id})")
+    
+    def _reload_index(self):
+        """Catch up with the latest index version (runs in a background thread)."""
+        try:
+            if self._catch_up():
+                print(f"Collection '{self.name}' caught up with index version {self.index_version}")
+        except Exception as e:
+            print(f"Error reloading the index of collection '{self.name}': {str(e)}")
+        finally:
+            self._index_state['reloading'] = False
+    
+    def refresh_index(self):
+        """
+        Catch up with the shared index if another process has published a new version.
+        
+        Cheap enough to call before every request: the manifest is read at most once
+        every INDEX_CHECK_INTERVAL seconds, and the changes are read in a background
+        thread while searches keep using the current snapshot.
+        """
+        now = time.monotonic()
+        with self._index_state_lock:
+            if self._index_state['reloading'] or now - self._index_state['checked_at'] < INDEX_CHECK_INTERVAL:
+                return
+            self._index_state['checked_at'] = now
+        
+        version = read_index_version(self.directory)
+        with self._index_state_lock:
+            if version is None or version == self._index_state['version'] or self._index_state['reloading']:
+                return
+            self._index_state['reloading'] = True
+        threading.Thread(target=self._reload_index, daemon=True).start()
+    
+    def _merge_index(self):
+        """Merge the index segments and attach to the result (runs in a background thread)."""
+        try:
+            index = merge_segments(self.directory)
+            if index is not None:
+                self._attach_index(index)
+        except Exception as e:
+            print(f"Error merging the index of collection '{self.name}': {str(e)}")
+        finally:
+            self._index_state['merging'] = False
+    
+    def _index_changed(self, published_start: Optional[int] = None, published_documents: List[Dict[str, Any]] = (),
+                       published_embeddings: Optional[np.ndarray] = None):
+        """Catch up with the index version just written by this process, and merge its segments if needed."""
+        self._catch_up(published_start, published_documents, published_embeddings)
+        with self._index_state_lock:
+            if self._index_state['merging'] or not needs_merge(self.directory):
+                return
+            self._index_state['merging'] = True
+        threading.Thread(target=self._merge_index, daemon=True).start()
+    
+    def publish_document(self, documents: List[Dict[str, Any]], embeddings: List[List[float]]):
+        """
+        Add a fully processed document to the collection as a new index version.
+        
+        All chunks of the document are appended to the current index segment at once
+        (see services/index_storage.py), then added to this process's vector store
+        together with whatever other workers published in between (see _catch_up),
+        as one snapshot; a document that was published before is replaced as a whole.
+        Other workers apply the document on their next refresh_index().
+        
+        Args:
+            documents: The chunk dictionaries of one document, in chunk order
+            embeddings: One embedding per chunk
             
-            chunk_path = os.path.join(doc_dir, chunk_file)
-            with open(chunk_path, 'r') as f:
-                chunk_data = json.load(f)
-                
-                # Add to vector store
-                if 'embedding' in chunk_data and 'content' in chunk_data:
-                    document = {
-                        'id': f"{doc_dir_name}_{chunk_file.split('.')[0]}",
-                        'title': metadata.get('title', 'Untitled'),
-                        'source': metadata.get('source', 'Unknown'),
-                        'content': chunk_data['content'],
-                        'date_added': metadata.get('date_added', datetime.now().isoformat())
-                    }
-                    vector_store.add(document, chunk_data['embedding'])
-
-# Load existing documents on startup
-load_existing_documents()
+        Raises:
+            ValueError: If the embeddings do not match the dimension or embedding backend of the index
+        """
+        if not documents:
+            return
+        first = documents[0]
+        entry = {
+            'doc_id': first['doc_id'],
+            'title': first.get('title', 'Untitled'),
+            'source': first.get('source', 'Unknown'),
+            'date_added': first.get('date_added'),
+            'count': len(documents)
+        }
+        chunks = [[document.get('chunk_index', i), document.get('content', '')] for i, document in enumerate(documents)]
+        vectors = np.stack([normalize_vector(embedding) for embedding in embeddings])
+        _, first_row = append_documents(self.directory, [entry], chunks, vectors,
+                                        embedding_backend=self.embedding_backend.id)
+        self._index_changed(first_row, documents, vectors)
+    
+    def delete_document(self, doc_id: str) -> int:
+        """
+        Delete a document from the collection as a new index version.
+        
+        The deletion is recorded in the on-disk index (its rows are dropped by the next
+        merge) and applied to this process's vector store together with whatever other
+        workers published in between, as one snapshot.
+        
+        Args:
+            doc_id: The document ID
+            
+        Returns:
+            int: The number of chunks deleted
+        """
+        snapshot = self.vector_store.snapshot()
+        count = len(snapshot.live_rows(snapshot.doc_rows.get(doc_id, [])))
+        if delete_documents(self.directory, [doc_id], {doc_id: count}) is not None:
+            self._index_changed()
+        return count
+
+# Embedding backends used by this process, by specification and ID, shared by the collections using them
+_embedding_backends: Dict[str, EmbeddingBackend] = {}
+_embedding_backends_lock = threading.Lock()
+
+def get_embedding_backend(spec: Optional[str] = None) -> EmbeddingBackend:
+    """
+    Get the embedding backend for a specification, creating it the first time it is used.
+    
+    Remote backends are configured from the environment: EMBEDDING_DIM (for models
+    that do not report it), EMBEDDING_BATCH_WINDOW_MS, EMBEDDING_REQUEST_BATCH_SIZE,
+    EMBEDDING_MAX_CONCURRENCY, EMBEDDING_MAX_RETRIES and EMBEDDING_HTTP_MODEL.
+    
+    Args:
+        spec: The backend specification (EMBEDDING_BACKEND if None)
+        
+    Returns:
+        EmbeddingBackend: The backend
+        
+    Raises:
+        ValueError: If the specification is not recognized
+    """
+    spec = spec or EMBEDDING_BACKEND
+    backend = _embedding_backends.get(spec)
+    if backend is not None:
+        return backend
+    with _embedding_backends_lock:
+        backend = _embedding_backends.get(spec)
+        if backend is None:
+            backend = create_embedding_backend(
+                spec,
+                dim=int(os.getenv('EMBEDDING_DIM', 0)) or None,
+                batch_window=float(os.getenv('EMBEDDING_BATCH_WINDOW_MS', 5)) / 1000,
+                max_batch_size=int(os.getenv('EMBEDDING_REQUEST_BATCH_SIZE', 256)),
+                max_concurrency=int(os.getenv('EMBEDDING_MAX_CONCURRENCY', 4)),
+                max_retries=int(os.getenv('EMBEDDING_MAX_RETRIES', 4)),
+                model=os.getenv('EMBEDDING_HTTP_MODEL') or None
+            )
+            backend = _embedding_backends.setdefault(backend.id, backend)
+            _embedding_backends[spec] = backend
+        return backend
+
+def get_collection_backend_spec(directory: str) -> str:
+    """
+    Get the embedding backend of an existing collection directory.
+    
+    The backend recorded in the collection's index manifest comes first, then the one
+    in its collection marker. Documents indexed before backends were recorded hold
+    the local hash embeddings; a collection without documents uses EMBEDDING_BACKEND.
+    """
+    metadata = read_index_metadata(directory)
+    if metadata is not None and metadata['embedding_backend']:
+        return metadata['embedding_backend']
+    try:
+        with open(os.path.join(directory, COLLECTION_MARKER), 'r') as f:
+            spec = json.load(f).get('embedding_backend')
+        if spec:
+            return spec
+    except (OSError, ValueError):
+        pass
+    if (metadata is not None and metadata['dim']) or (metadata is None and list_document_dirs(directory)):
+        return HASH_BACKEND_ID
+    return EMBEDDING_BACKEND
+
+# Collections loaded by this process, by name
+_collections: Dict[str, KnowledgeBaseCollection] = {}
+_collections_lock = threading.Lock()
+
+def get_collection_dir(name: str) -> str:
+    """The directory of a collection: KNOWLEDGE_BASE_DIR itself for the default collection."""
+    return KNOWLEDGE_BASE_DIR if name == DEFAULT_COLLECTION else os.path.join(KNOWLEDGE_BASE_DIR, name)
+
+def get_collection(name: Optional[str] = None, create: bool = False,
+                   embedding_backend: Optional[str] = None) -> KnowledgeBaseCollection:
+    """
+    Get a collection, loading its index the first time it is used in this process.
+    
+    Args:
+        name: The collection name (the default collection if None or empty)
+        create: Create the collection if it does not exist yet
+        embedding_backend: The embedding backend specification of a collection this call
+            creates (EMBEDDING_BACKEND if None); existing collections keep their own
+        
+    Returns:
+        KnowledgeBaseCollection: The collection
+        
+    Raises:
+        ValueError: If the name or the embedding backend is invalid
+        LookupError: If the collection does not exist and create is False
+    """
+    name = name or DEFAULT_COLLECTION
+    if not isinstance(name, str) or not COLLECTION_NAME_PATTERN.match(name):
+        raise ValueError(f"Invalid collection name: {name!r}")
+    collection = _collections.get(name)
+    if collection is not None:
+        return collection
+    
+    with _collections_lock:
+        collection = _collections.get(name)
+        if collection is not None:
+            return collection
+        directory = get_collection_dir(name)
+        if name != DEFAULT_COLLECTION:
+            if os.path.isdir(directory) and not is_collection_dir(directory):
+                raise ValueError(f"Invalid collection name: {name!r} is a document")
+            if not is_collection_dir(directory):
+                if not create:
+                    raise LookupError(f"Collection not found: {name}")
+                backend = get_embedding_backend(embedding_backend)
+                os.makedirs(directory, exist_ok=True)
+                with open(os.path.join(directory, COLLECTION_MARKER), 'w') as f:
+                    json.dump({'name': name, 'date_created': datetime.now().isoformat(),
+                               'embedding_backend': backend.id}, f, indent=2)
+        backend = get_embedding_backend(get_collection_backend_spec(directory))
+        collection = KnowledgeBaseCollection(name, directory, backend)
+        collection.load_existing_documents()
+        _collections[name] = collection
+        return collection
+
+def list_collections() -> List[str]:
+    """List the names of all collections in the knowledge base directory, the default collection first."""
+    names = [DEFAULT_COLLECTION]
+    if os.path.isdir(KNOWLEDGE_BASE_DIR):
+        for name in sorted(os.listdir(KNOWLEDGE_BASE_DIR)):
+            if name != DEFAULT_COLLECTION and is_collection_dir(os.path.join(KNOWLEDGE_BASE_DIR, name)):
+                names.append(name)
+    return names
+
+def load_existing_documents():
+    """Load the default collection (see KnowledgeBaseCollection.load_existing_documents)."""
+    get_collection(DEFAULT_COLLECTION)
+
+def refresh_index(collection: Optional[str] = None):
+    """
+    Catch collections up with their shared indexes if other processes have published new versions.
+    
+    Args:
+        collection: The collection to refresh (every collection loaded by this process if None)
+    """
+    if collection is not None:
+        get_collection(collection).refresh_index()
+        return
+    for loaded in list(_collections.values()):
+        loaded.refresh_index()
+
+def publish_document(documents: List[Dict[str, Any]], embeddings: List[List[float]], collection: Optional[str] = None):
+    """Add a document to a collection (see KnowledgeBaseCollection.publish_document)."""
+    get_collection(collection).publish_document(documents, embeddings)
+
+def delete_document(doc_id: str, collection: Optional[str] = None) -> int:
+    """Delete a document from a collection (see KnowledgeBaseCollection.delete_document)."""
+    return get_collection(collection).delete_document(doc_id)
+
+# Initialize the default collection when the module is imported; `vector_store` is its store
+vector_store = get_collection(DEFAULT_COLLECTION).vector_store
 
 # Function to search the knowledge base
-def search_knowledge_base(query: str, top_k: int = 3) -> List[Dict[str, Any]]:
+def search_knowledge_base(query: str, top_k: int = 3, filter: Optional[Dict[str, Any]] = None,
+                          mode: str = SEARCH_MODE_VECTOR, snapshot: Optional[StoreSnapshot] = None,
+                          expand: int = 0, mmr_lambda: Optional[float] = None,
+                          top_documents: int = TOP_DOCUMENTS, collection: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     Search the knowledge base for documents similar to the query.
     
     Args:
         query: The query string
         top_k: The number of results to return
+        filter: An optional metadata filter (see SimpleVectorStore.filter_rows)
+        mode: 'vector', 'lexical' (BM25), 'hybrid' (both, fused by rank) or 'hierarchical'
+            (vector search within the documents whose centroids are closest to the query)
+        snapshot: The vector store snapshot to search (defaults to the current one)
+        expand: The number of neighbouring chunks to include on each side of a hit
+        mmr_lambda: Re-rank the results for diversity with this relevance/diversity trade-off (0 to 1)
+        top_documents: The number of documents whose chunks a hierarchical search scores
+        collection: The collection to search (the default collection if None)
         
     Returns:
         List[Dict[str, Any]]: The search results
+        
+    Raises:
+        ValueError: If the search or the collection name is invalid
+        LookupError: If the collection does not exist
     """
     print(f"Searching knowledge base for: {query}")
+    knowledge_base = get_collection(collection)
+    store = knowledge_base.vector_store
     
     # Get the number of documents in the vector store
-    print(f"Number of documents in vector store: {len(vector_store.documents)}")
+    print(f"Number of documents in vector store: {len(store)}")
     
     # Get embedding for the query
-    query_embedding = get_embedding(query)
+    query_embedding = get_query_embedding(query, knowledge_base.embedding_backend)
     
     # Search for similar documents
-    results = vector_store.search(query_embedding, top_k=top_k)
+    results = store.search(query_embedding, top_k=top_k, filter=filter, query_text=query, mode=mode,
+                           snapshot=snapshot, expand=expand, mmr_lambda=mmr_lambda, top_documents=top_documents)
     
     # Format results for return
     formatted_results = []
@@ -155,115 +1694,147 @@ def search_knowledge_base(query: str, top_k: int = 3) -> List[Dict[str, Any]]:
         print(f"Result {i+1}: {title} (similarity: {similarity:.4f})")
         
         # Add to formatted results
-        formatted_results.append({
+        formatted_result = {
             'title': title,
             'content': content,
             'source': source,
             'similarity': similarity,
             'id': doc.get('id', f'unknown-{i}')
-        })
+        }
+        if 'window' in doc:
+            formatted_result['window'] = doc['window']
+        if 'document_score' in doc:
+            formatted_result['document_score'] = doc['document_score']
+        formatted_results.append(formatted_result)
     
     return formatted_results
 
-# Simple embedding function (for demonstration)
-def simple_embedding(text: str) -> List[float]:
+# Embeddings already computed by any worker process (see services/embedding_cache.py)
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_SIZE) if EMBEDDING_CACHE_SIZE > 0 else None
+# Embeddings of recent queries, in this process
+query_embedding_cache = (QueryEmbeddingCache(QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_TTL)
+                         if QUERY_EMBEDDING_CACHE_SIZE > 0 else None)
+
+def compute_embeddings(texts: List[str], backend: EmbeddingBackend) -> np.ndarray:
     """
-    Convert text to a simple embedding vector.
+    Embed several texts with an embedding backend, bypassing the cache.
     
-    This is an improved version that tries to capture more semantic meaning
-    by using word-level hashing and TF-IDF like weighting.
+    Args:
+        texts: The texts to embed
+        backend: The embedding backend
+        
+    Returns:
+        np.ndarray: A (len(texts), dim) float32 array of embeddings
     """
-    import hashlib
-    import math
-    import re
-    
-    # Normalize text: lowercase and remove punctuation
-    text = text.lower()
-    text = re.sub(r'[^\w\s]', ' ', text)
+    return backend.embed(texts)
+
+def get_embeddings(texts: List[str], backend: Optional[EmbeddingBackend] = None) -> np.ndarray:
+    """
+    Get embeddings for several texts, embedding the ones not in the cache with one call.
     
-    # Split into words and remove stop words
-    words = text.split()
-    stop_words = {'a', 'an', 'the', 'and', 'or', 'but', 'is', 'are', 'was', 'were', 
-                 'in', 'on', 'at', 'to', 'for', 'with', 'by', 'about', 'of'}
-    words = [word for word in words if word not in stop_words]
+    A remote backend batches the uncached texts into as few requests as it can,
+    and the local hash backend embeds them with its vectorized batch path. New
+    embeddings are added to the cache, under the backend's ID.
     
-    # Create a 128-dimensional vector
-    embedding = [0.0] * 128
+    Args:
+        texts: The texts to get embeddings for
+        backend: The embedding backend (the default collection's if None)
+        
+    Returns:
+        np.ndarray: A (len(texts), dim) float32 array of embeddings
+        
+    Raises:
+        Exception: If embedding fails before the backend's dimension is known
+    """
+    backend = backend or get_collection().embedding_backend
+    try:
+        if embedding_cache is None:
+            return compute_embeddings(texts, backend)
+        cached = embedding_cache.get_many(backend.id, texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            computed = compute_embeddings(missing_texts, backend)
+            embedding_cache.put_many(backend.id, missing_texts, computed)
+            for i, vector in zip(missing, computed):
+                cached[i] = vector
+        if not cached:
+            return np.zeros((0, backend.dim or 0), dtype=np.float32)
+        return np.stack(cached).astype(np.float32, copy=False)
+    except Exception as e:
+        print(f"Error getting embeddings from {backend.id}: {str(e)}")
+        if backend.dim is None:
+            raise
+        # Return zero vectors as fallback
+        return np.zeros((len(texts), backend.dim), dtype=np.float32)
+
+# Function to get embeddings for text - this is what document_loader.py is trying to import
+def get_embedding(text: str, backend: Optional[EmbeddingBackend] = None) -> List[float]:
+    """
+    Get embedding for text with an embedding backend (the default collection's if None).
     
-    # If no words, return zero vector
-    if not words:
-        return embedding
+    The embedding comes from the embedding cache if the text was embedded before.
     
-    # Count word occurrences for TF-IDF like weighting
-    word_counts = {}
-    for word in words:
-        if word in word_counts:
-            word_counts[word] += 1
-        else:
-            word_counts[word] = 1
-    
-    # For each word, compute a hash and add to embedding
-    for word, count in word_counts.items():
-        # Hash the word
-        hash_obj = hashlib.md5(word.encode('utf-8'))
-        hash_bytes = hash_obj.digest()
-        
-        # Convert hash to indices and values
-        for i in range(min(16, len(hash_bytes))):
-            # Use each byte to determine an index in the embedding
-            idx = hash_bytes[i] % 128
-            
-            # Weight by log(count+1) to simulate TF-IDF
-            weight = math.log(count + 1)
-            
-            # Add to embedding at the determined index
-            embedding[idx] += weight
+    Args:
+        text: The text to get embedding for
+        backend: The embedding backend
+        
+    Returns:
+        List[float]: The embedding vector
+    """
+    return get_embeddings([text], backend)[0].tolist()
+
+def get_query_embeddings(queries: List[str], backend: Optional[EmbeddingBackend] = None) -> np.ndarray:
+    """
+    Get embeddings for search queries, using the in-process query embedding cache.
     
-    # Normalize the embedding
-    norm = math.sqrt(sum(x*x for x in embedding))
-    if norm > 0:
-        embedding = [x/norm for x in embedding]
+    Queries missing from the cache are embedded with one get_embeddings call.
+    Zero vectors (queries without words, or the fallback after an error) are not cached.
     
-    return embedding
+    Args:
+        queries: The query texts
+        backend: The embedding backend (the default collection's if None)
+        
+    Returns:
+        np.ndarray: A (len(queries), dim) float32 array of embeddings
+    """
+    backend = backend or get_collection().embedding_backend
+    if query_embedding_cache is None:
+        return get_embeddings(queries, backend)
+    cached = [query_embedding_cache.get(backend.id, query) for query in queries]
+    missing = [i for i, vector in enumerate(cached) if vector is None]
+    if missing:
+        computed = get_embeddings([queries[i] for i in missing], backend)
+        for i, vector in zip(missing, computed):
+            if vector.any():
+                query_embedding_cache.put(backend.id, queries[i], vector)
+            cached[i] = vector
+    if not cached:
+        return np.zeros((0, backend.dim or 0), dtype=np.float32)
+    return np.stack(cached)
 
-# Function to get embeddings for text - this is what document_loader.py is trying to import
-def get_embedding(text: str) -> List[float]:
+def get_query_embedding(query: str, backend: Optional[EmbeddingBackend] = None) -> List[float]:
     """
-    Get embedding for text using OpenAI's embedding model.
-    
-    In production, this would use a proper embedding model.
-    For simplicity, we're using the simple_embedding function.
+    Get the embedding of a search query, using the in-process query embedding cache.
     
     Args:
-        text: The text to get embedding for
+        query: The query text
+        backend: The embedding backend (the default collection's if None)
         
     Returns:
         List[float]: The embedding vector
     """
-    try:
-        # For production, you would use OpenAI's embedding model
-        # response = client.embeddings.create(
-        #     input=text,
-        #     model="text-embedding-ada-002"
-        # )
-        # return response.data[0].embedding
-        
-        # For simplicity, we'll use our simple embedding function
-        return simple_embedding(text)
-    except Exception as e:
-        print(f"Error getting embedding: {str(e)}")
-        # Return a zero vector as fallback
-        return [0.0] * 128
+    return get_query_embeddings([query], backend)[0].tolist()
 
-def get_rag_context(query: str) -> Tuple[str, bool, List[Dict[str, Any]]]:
+def get_rag_context(query: str, collection: Optional[str] = None) -> Tuple[str, bool, List[Dict[str, Any]]]:
     """
-    Get RAG context for a query.
+    Get RAG context for a query from a collection (the default collection if None).
     
     Returns:
         Tuple[str, bool, List[Dict[str, Any]]]: The context, a boolean indicating if context was found, and the source documents
     """
     # Search the knowledge base
-    results = search_knowledge_base(query)
+    results = search_knowledge_base(query, collection=collection)
     
     if not results:
         return "", False, []
@@ -315,5 +1886,3 @@ def format_citations(sources: List[Dict[str, Any]]) -> str:
     
     return citations
 
-# Initialize the knowledge base when the module is imported
-load_existing_documents() 
\ No newline at end of file
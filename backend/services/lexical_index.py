@@ -0,0 +1,247 @@
+import re
+import copy
+import math
+import numpy as np
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from services.embedding_matrix import top_k_indices
+
+# BM25 term-frequency saturation and document-length normalization parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Words that are too common to be useful search terms (same list as simple_embedding)
+STOP_WORDS = {'a', 'an', 'the', 'and', 'or', 'but', 'is', 'are', 'was', 'were',
+              'in', 'on', 'at', 'to', 'for', 'with', 'by', 'about', 'of'}
+
+_PUNCTUATION = re.compile(r'[^\w\s]')
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase search terms, dropping punctuation and stop words.
+
+    Args:
+        text: The text to tokenize
+
+    Returns:
+        List[str]: The terms, in order
+    """
+    words = _PUNCTUATION.sub(' ', text.lower()).split()
+    return [word for word in words if word not in STOP_WORDS]
+
+
+class TermPostings:
+    """
+    The rows containing one term and the term's frequency in each, in row order.
+
+    Postings are append-only: a new entry is written before the size is bumped,
+    and a full buffer is replaced by a grown copy, so readers can call arrays()
+    without a lock while rows are being appended.
+    """
+
+    def __init__(self, rows: Optional[np.ndarray] = None, frequencies: Optional[np.ndarray] = None):
+        if rows is None:
+            self._arrays = (np.zeros(4, dtype=np.int64), np.zeros(4, dtype=np.float32))
+        else:
+            self._arrays = (np.array(rows, dtype=np.int64), np.array(frequencies, dtype=np.float32))
+        self._size = 0 if rows is None else len(rows)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """The rows and their term frequencies, as two arrays of the same length."""
+        size = self._size
+        rows, frequencies = self._arrays
+        return rows[:size], frequencies[:size]
+
+    def append(self, row: int, frequency: int) -> None:
+        rows, frequencies = self._arrays
+        if self._size == len(rows):
+            capacity = max(4, 2 * len(rows))
+            grown_rows = np.zeros(capacity, dtype=np.int64)
+            grown_rows[:self._size] = rows[:self._size]
+            grown_frequencies = np.zeros(capacity, dtype=np.float32)
+            grown_frequencies[:self._size] = frequencies[:self._size]
+            rows, frequencies = grown_rows, grown_frequencies
+            self._arrays = (rows, frequencies)
+        rows[self._size] = row
+        frequencies[self._size] = frequency
+        self._size += 1
+
+
+class BM25Index:
+    """
+    An incremental inverted index over chunk text, scored with Okapi BM25.
+
+    Rows are numbered like the rows of the vector store, so lexical and vector
+    results can be combined directly. Removing a row only updates the corpus
+    statistics (document frequencies, lengths); its postings stay until the store
+    is compacted and calls remapped(), and callers mask removed rows out of results.
+
+    Adding rows only appends to postings and writes past the rows already indexed,
+    and the document frequencies are replaced rather than updated in place, so a
+    frozen() view keeps scoring its own rows consistently while the index grows.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, TermPostings] = {}
+        self._document_frequency: Dict[str, int] = {}  # Live rows containing each term
+        self._lengths = np.zeros(64, dtype=np.float32)  # Number of terms in each row
+        self._size = 0  # Rows added (including removed ones)
+        self.num_documents = 0  # Live rows
+        self.total_length = 0  # Terms in all live rows
+
+    def __len__(self) -> int:
+        return self.num_documents
+
+    def add(self, row: int, text: str) -> None:
+        """
+        Index the text of a new row. Rows must be added in increasing order.
+
+        Args:
+            row: The row number
+            text: The text of the row
+        """
+        self.add_rows(row, [text])
+
+    def add_rows(self, first_row: int, texts: List[str]) -> None:
+        """Index the texts of consecutive new rows, starting at `first_row`."""
+        document_frequency = dict(self._document_frequency)
+        for offset, text in enumerate(texts):
+            self._add_row(first_row + offset, text, document_frequency)
+        self._document_frequency = document_frequency
+
+    def _add_row(self, row: int, text: str, document_frequency: Dict[str, int]) -> None:
+        terms = tokenize(text)
+        if row >= len(self._lengths):
+            capacity = len(self._lengths)
+            while capacity <= row:
+                capacity *= 2
+            lengths = np.zeros(capacity, dtype=np.float32)
+            lengths[:len(self._lengths)] = self._lengths
+            self._lengths = lengths
+        self._lengths[row] = len(terms)
+        self._size = max(self._size, row + 1)
+        self.num_documents += 1
+        self.total_length += len(terms)
+
+        for term, frequency in Counter(terms).items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = TermPostings()
+            postings.append(row, frequency)
+            document_frequency[term] = document_frequency.get(term, 0) + 1
+
+    def remove_rows(self, texts: List[str]) -> None:
+        """
+        Remove rows from the corpus statistics.
+
+        Args:
+            texts: The texts the rows were added with
+        """
+        document_frequency = dict(self._document_frequency)
+        for text in texts:
+            terms = tokenize(text)
+            self.num_documents -= 1
+            self.total_length -= len(terms)
+            for term in set(terms):
+                count = document_frequency.get(term, 0) - 1
+                if count > 0:
+                    document_frequency[term] = count
+                else:
+                    document_frequency.pop(term, None)
+        self._document_frequency = document_frequency
+
+    def frozen(self) -> 'BM25Index':
+        """
+        A read-only view of the rows indexed so far, sharing the postings with this index.
+
+        Returns:
+            BM25Index: The view; it must not be modified
+        """
+        return copy.copy(self)
+
+    def remapped(self, old_to_new: np.ndarray) -> 'BM25Index':
+        """
+        Build a renumbered copy of the index after the store has been compacted.
+
+        Args:
+            old_to_new: The new row number of every old row, or -1 if it was removed
+
+        Returns:
+            BM25Index: The renumbered index; this one is left unchanged
+        """
+        index = BM25Index(self.k1, self.b)
+        for term, term_postings in self._postings.items():
+            old_rows, frequencies = term_postings.arrays()
+            rows = old_to_new[old_rows]
+            keep = rows >= 0
+            if keep.any():
+                index._postings[term] = TermPostings(rows[keep], frequencies[keep])
+
+        live = np.flatnonzero(old_to_new[:self._size] >= 0)
+        index._lengths = np.zeros(max(64, len(live)), dtype=np.float32)
+        index._lengths[old_to_new[live]] = self._lengths[live]
+        index._size = len(live)
+        index._document_frequency = self._document_frequency
+        index.num_documents = self.num_documents
+        index.total_length = self.total_length
+        return index
+
+    def scores(self, query: str, size: int) -> np.ndarray:
+        """
+        Compute the BM25 score of every row for a query.
+
+        Args:
+            query: The query text
+            size: The number of rows to score
+
+        Returns:
+            np.ndarray: A float32 array of scores, one per row (0 for rows without query terms)
+        """
+        scores = np.zeros(size, dtype=np.float32)
+        if self.num_documents <= 0:
+            return scores
+        average_length = max(self.total_length / self.num_documents, 1e-6)
+        lengths = self._lengths
+
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            document_frequency = self._document_frequency.get(term, 0)
+            if postings is None or document_frequency == 0:
+                continue
+            rows, frequencies = postings.arrays()
+            in_range = rows < size
+            rows, frequencies = rows[in_range], frequencies[in_range]
+            idf = math.log(1 + (self.num_documents - document_frequency + 0.5) / (document_frequency + 0.5))
+            norms = self.k1 * (1 - self.b + self.b * lengths[rows] / average_length)
+            # Each row appears once per term, so fancy-indexed += is safe
+            scores[rows] += idf * frequencies * (self.k1 + 1) / (frequencies + norms)
+        return scores
+
+    def search(self, query: str, top_k: int, size: int,
+               excluded: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the rows with the highest BM25 scores for a query.
+
+        Args:
+            query: The query text
+            top_k: The number of rows to return
+            size: The number of rows to consider
+            excluded: An optional boolean mask of rows to skip (e.g. deleted rows)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The top rows and their scores; only rows
+            containing at least one query term are returned
+        """
+        scores = self.scores(query, size)
+        if excluded is not None:
+            scores[excluded[:size]] = 0
+        matches = np.flatnonzero(scores > 0)
+        best = top_k_indices(scores[matches], top_k)
+        return matches[best], scores[matches[best]]
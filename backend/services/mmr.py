@@ -0,0 +1,58 @@
+import numpy as np
+
+# Default trade-off between relevance (1.0) and diversity (0.0)
+DEFAULT_MMR_LAMBDA = 0.7
+
+# MMR chooses the top_k results from this many times top_k candidates
+MMR_POOL_FACTOR = 4
+
+
+def validate_mmr_lambda(mmr_lambda: float) -> float:
+    """
+    Check an MMR trade-off parameter.
+
+    Raises:
+        ValueError: If it is not a number from 0 to 1
+    """
+    if isinstance(mmr_lambda, bool) or not isinstance(mmr_lambda, (int, float)) or not 0.0 <= mmr_lambda <= 1.0:
+        raise ValueError("mmr_lambda must be a number from 0 to 1")
+    return float(mmr_lambda)
+
+
+def mmr_select(vectors: np.ndarray, relevance: np.ndarray, top_k: int, mmr_lambda: float = DEFAULT_MMR_LAMBDA) -> np.ndarray:
+    """
+    Greedily select a relevant but diverse subset of candidates (maximal marginal relevance).
+
+    Each step picks the candidate with the highest
+    mmr_lambda * relevance - (1 - mmr_lambda) * (highest similarity to a selected candidate).
+    All candidate-candidate cosine similarities are computed up front with one
+    matrix product; each step is then a vectorized update over the candidates.
+
+    Args:
+        vectors: A (n, dim) array of normalized candidate vectors
+        relevance: The relevance of each candidate to the query
+        top_k: The number of candidates to select
+        mmr_lambda: 1.0 ranks by relevance only, 0.0 by diversity only
+
+    Returns:
+        np.ndarray: The positions of the selected candidates, in selection order
+    """
+    n = len(vectors)
+    k = min(top_k, n)
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+
+    relevance = np.asarray(relevance, dtype=np.float32)
+    similarity = vectors @ vectors.T
+    selected = np.zeros(k, dtype=np.int64)
+    available = np.ones(n, dtype=bool)
+    redundancy = np.zeros(n, dtype=np.float32)  # Highest similarity to any selected candidate
+
+    for step in range(k):
+        scores = mmr_lambda * relevance - (1.0 - mmr_lambda) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected[step] = best
+        available[best] = False
+        redundancy = similarity[best] if step == 0 else np.maximum(redundancy, similarity[best])
+    return selected
@@ -0,0 +1,85 @@
+import heapq
+import itertools
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from services.embedding_matrix import score_rows, top_k_indices_batch
+
+# Shards are never made smaller than this many rows; below it the thread hand-off costs
+# more than the scoring it parallelizes
+MIN_SHARD_ROWS = 16384
+
+
+class PartitionedSearch:
+    """
+    Brute-force top-k search over row shards of an embedding matrix, in parallel.
+
+    The rows are split into `shards` contiguous ranges (views, nothing is copied).
+    Each shard is scored and reduced to its own top k on a thread pool shared by
+    every search of the store; NumPy releases the GIL inside the matrix product and
+    the partition, so shards of concurrent requests run on separate cores. The
+    per-shard lists are already sorted, so they are merged with a heap.
+
+    Pin the BLAS library to one thread (e.g. OPENBLAS_NUM_THREADS=1) when using
+    several workers, so the two kinds of threads do not compete for the cores.
+    """
+
+    def __init__(self, workers: int, shards: Optional[int] = None, min_shard_rows: int = MIN_SHARD_ROWS):
+        if workers < 1:
+            raise ValueError(f"Invalid number of search workers: {workers}")
+        if shards is not None and shards < 1:
+            raise ValueError(f"Invalid number of search shards: {shards}")
+        self.workers = workers
+        self.shards = shards or workers
+        self.min_shard_rows = min_shard_rows
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='vector-search')
+
+    def shard_bounds(self, size: int) -> List[Tuple[int, int]]:
+        """Split `size` rows into at most `shards` contiguous (start, end) ranges."""
+        shards = max(1, min(self.shards, size // self.min_shard_rows))
+        edges = np.linspace(0, size, shards + 1).astype(np.int64).tolist()
+        return list(zip(edges[:-1], edges[1:]))
+
+    @staticmethod
+    def _score_shard(queries: np.ndarray, array: np.ndarray, deleted: Optional[np.ndarray], start: int, end: int,
+                     top_k: int) -> List[List[Tuple[float, int]]]:
+        """The top_k (similarity, row) pairs of one shard for every query, best first."""
+        similarities = score_rows(queries, array, start, end)
+        if deleted is not None:
+            similarities[:, deleted[start:end]] = -np.inf
+        shard_hits = []
+        for row_similarities, indices in zip(similarities, top_k_indices_batch(similarities, top_k)):
+            indices = indices[np.isfinite(row_similarities[indices])]
+            shard_hits.append(list(zip(row_similarities[indices].tolist(), (indices + start).tolist())))
+        return shard_hits
+
+    def top_k(self, queries: np.ndarray, array: np.ndarray, deleted: Optional[np.ndarray],
+              top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Score normalized queries against every row and keep the best top_k per query.
+
+        Args:
+            queries: A (num_queries, dim) array of normalized queries
+            array: The (size, dim) normalized rows
+            deleted: Optional (size,) mask of rows to skip
+            top_k: The number of rows to return per query
+
+        Returns:
+            List[Tuple[np.ndarray, np.ndarray]]: The top rows and their similarities, per query
+        """
+        bounds = self.shard_bounds(len(array))
+        if len(bounds) == 1:
+            shards = [self._score_shard(queries, array, deleted, 0, len(array), top_k)]
+        else:
+            futures = [self._executor.submit(self._score_shard, queries, array, deleted, start, end, top_k)
+                       for start, end in bounds]
+            shards = [future.result() for future in futures]
+
+        hits = []
+        for query_shards in zip(*shards):
+            merged = list(itertools.islice(heapq.merge(*query_shards, key=lambda hit: -hit[0]), top_k))
+            rows = np.array([row for _, row in merged], dtype=np.int64)
+            similarities = np.array([similarity for similarity, _ in merged], dtype=np.float32)
+            hits.append((rows, similarities))
+        return hits
@@ -0,0 +1,152 @@
+import copy
+import numpy as np
+from typing import Optional
+
+# Supported quantized storage modes
+QUANTIZATION_INT8 = 'int8'
+QUANTIZATION_FLOAT16 = 'float16'
+
+# Rows are de-quantized and scored in blocks of this size to bound temporary memory
+SCORE_BLOCK_SIZE = 1024
+
+# When new rows exceed the current int8 range of a dimension, the scale grows with this much headroom
+SCALE_HEADROOM = 1.25
+
+# The int8 range of every dimension initially covers at least +/- this many multiples of
+# 1/sqrt(dim), so stores filled one row at a time do not re-scale on every insert
+INITIAL_RANGE = 4.0
+
+
+class QuantizedMatrix:
+    """
+    A compact, approximate copy of an embedding matrix used for first-pass scoring.
+
+    In 'int8' mode every dimension has its own scale, so a value x in dimension d is
+    stored as round(x / scale[d]) in [-127, 127] (1 byte per dimension). In 'float16'
+    mode values are simply stored at half precision (2 bytes per dimension).
+    Scores from this matrix are approximate; callers re-rank the best candidates
+    against the full-precision vectors.
+
+    Rows already stored are never modified in place (a scale change re-quantizes
+    into a new buffer), so a frozen() view stays valid while rows are appended.
+    """
+
+    def __init__(self, mode: str = QUANTIZATION_INT8, dim: Optional[int] = None):
+        if mode not in (QUANTIZATION_INT8, QUANTIZATION_FLOAT16):
+            raise ValueError(f"Unknown quantization mode: {mode}")
+        self.mode = mode
+        self._dtype = np.int8 if mode == QUANTIZATION_INT8 else np.float16
+        self._dim = dim
+        self._size = 0
+        self._buffer = None
+        self.scales = None  # Per-dimension scales (int8 mode only)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def array(self) -> np.ndarray:
+        """A (size, dim) view of the quantized rows."""
+        if self._buffer is None:
+            return np.zeros((0, self._dim or 0), dtype=self._dtype)
+        return self._buffer[:self._size]
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes used by the stored rows (excluding spare capacity)."""
+        return self._size * (self._dim or 0) * np.dtype(self._dtype).itemsize
+
+    def _ensure_capacity(self, required: int) -> None:
+        """Grow the buffer (by doubling) until it can hold `required` rows."""
+        capacity = 0 if self._buffer is None else self._buffer.shape[0]
+        if required <= capacity:
+            return
+        capacity = max(64, capacity)
+        while capacity < required:
+            capacity *= 2
+        new_buffer = np.zeros((capacity, self._dim), dtype=self._dtype)
+        if self._buffer is not None:
+            new_buffer[:self._size] = self._buffer[:self._size]
+        self._buffer = new_buffer
+
+    def _update_scales(self, vectors: np.ndarray) -> None:
+        """Widen the int8 scale of any dimension the new vectors do not fit in."""
+        required = np.abs(vectors).max(axis=0) / 127.0
+        if self.scales is None:
+            floor = INITIAL_RANGE / np.sqrt(vectors.shape[1]) / 127.0
+            self.scales = np.maximum(required * SCALE_HEADROOM, floor).astype(np.float32)
+            return
+
+        grow = required > self.scales
+        if not grow.any():
+            return
+        new_scales = self.scales.copy()
+        new_scales[grow] = required[grow] * SCALE_HEADROOM
+        if self._size > 0:
+            # Re-quantize the affected dimensions of the existing rows into a copy, so
+            # frozen views keep their rows and scales
+            columns = np.flatnonzero(grow)
+            buffer = self._buffer.copy()
+            existing = buffer[:self._size, columns].astype(np.float32) * self.scales[columns]
+            buffer[:self._size, columns] = np.round(existing / new_scales[columns]).astype(np.int8)
+            self._buffer = buffer
+        self.scales = new_scales
+
+    def extend(self, vectors: np.ndarray) -> None:
+        """
+        Quantize and append normalized float32 rows.
+
+        Args:
+            vectors: A (n, dim) array of normalized vectors
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return
+        if self._dim is None:
+            self._dim = vectors.shape[1]
+
+        self._ensure_capacity(self._size + len(vectors))
+        if self.mode == QUANTIZATION_INT8:
+            self._update_scales(vectors)
+            quantized = np.clip(np.round(vectors / self.scales), -127, 127).astype(np.int8)
+        else:
+            quantized = vectors.astype(np.float16)
+        self._buffer[self._size:self._size + len(vectors)] = quantized
+        self._size += len(vectors)
+
+    def frozen(self) -> 'QuantizedMatrix':
+        """A read-only view of the rows stored so far, sharing the buffer with this matrix."""
+        return copy.copy(self)
+
+    def take(self, rows: np.ndarray) -> 'QuantizedMatrix':
+        """Build a new quantized matrix from a subset of rows (used by compaction)."""
+        matrix = QuantizedMatrix(self.mode, self._dim)
+        matrix.scales = None if self.scales is None else self.scales.copy()
+        if len(rows) > 0:
+            matrix._ensure_capacity(len(rows))
+            matrix._buffer[:len(rows)] = self.array[rows]
+            matrix._size = len(rows)
+        return matrix
+
+    def scores_batch(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Approximate cosine similarities of normalized queries against every row.
+
+        For int8 the per-dimension scales are folded into the queries, so each block
+        of rows only needs a cast to float32 before the matrix product.
+
+        Args:
+            queries: A (num_queries, dim) array of normalized queries
+
+        Returns:
+            np.ndarray: A (num_queries, size) float32 array of approximate similarities
+        """
+        buffer, size, scales = self._buffer, self._size, self.scales
+        queries = np.asarray(queries, dtype=np.float32)
+        if self.mode == QUANTIZATION_INT8 and scales is not None:
+            queries = queries * scales
+        scores = np.empty((len(queries), size), dtype=np.float32)
+        for start in range(0, size, SCORE_BLOCK_SIZE):
+            block = buffer[start:min(start + SCORE_BLOCK_SIZE, size)].astype(np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        return scores
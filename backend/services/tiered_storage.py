@@ -0,0 +1,209 @@
+import threading
+import numpy as np
+from typing import Any, Dict, Optional
+
+# Rows per segment: the unit that is promoted to memory or evicted from it
+SEGMENT_ROWS = 4096
+
+# Cold segments are read from their memory-mapped rows and scored in blocks of this many rows
+STREAM_BLOCK_ROWS = 1024
+
+# Segment access counts are halved after this many accesses, so old popularity fades
+FREQUENCY_HALF_LIFE = 10000
+
+
+def parse_byte_size(value: Optional[str]) -> Optional[int]:
+    """
+    Parse a size such as '512M', '2G' or '1048576' to a number of bytes.
+
+    Raises:
+        ValueError: If the value is not a size
+    """
+    if value is None or str(value).strip() == '':
+        return None
+    text = str(value).strip().upper().rstrip('B')
+    multipliers = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    multiplier = multipliers.get(text[-1:], 1)
+    if text[-1:] in multipliers:
+        text = text[:-1]
+    try:
+        size = int(float(text) * multiplier)
+    except ValueError:
+        raise ValueError(f"Invalid size: {value!r}")
+    if size < 0:
+        raise ValueError(f"Invalid size: {value!r}")
+    return size
+
+
+class TieredRows:
+    """
+    A RAM-budgeted hot tier in front of memory-mapped embedding rows.
+
+    Rows are grouped into segments of SEGMENT_ROWS consecutive rows. Up to
+    `ram_budget` bytes of segments are copied into process memory (the hot tier);
+    every other segment is cold and read from the memory-mapped rows (the OS page
+    cache, or the disk) when it is needed. Full scans score cold segments in
+    streaming blocks, so only a block at a time is held in memory.
+
+    Every read counts an access to the segments it touches. After each read the
+    most frequently accessed cold segment is promoted if it fits in the budget,
+    evicting hot segments that are accessed less often than it; ties never evict,
+    so segments that are all scanned equally do not churn. Counts are halved every
+    FREQUENCY_HALF_LIFE accesses.
+
+    Only segments whose rows are all written are promoted, and stored rows never
+    change, so hot copies stay valid while rows are appended. A compaction or
+    reindex renumbers the rows, so the store starts a new tier with renewed().
+    """
+
+    def __init__(self, ram_budget: int, segment_rows: int = SEGMENT_ROWS):
+        self.ram_budget = ram_budget
+        self.segment_rows = segment_rows
+        self._hot: Dict[int, np.ndarray] = {}  # Segment -> its rows in process memory
+        self._frequency = np.zeros(64, dtype=np.float64)  # Decayed access count of every segment
+        self._accesses = 0
+        self._lock = threading.Lock()  # Guards promotion, eviction and the counters
+        self.hot_bytes = 0
+        self.hot_rows_read = 0
+        self.cold_rows_read = 0
+        self.promotions = 0
+        self.evictions = 0
+
+    def renewed(self) -> 'TieredRows':
+        """An empty tier with the same budget, for a renumbered set of rows; the counters carry over."""
+        tiers = TieredRows(self.ram_budget, self.segment_rows)
+        with self._lock:
+            tiers.hot_rows_read = self.hot_rows_read
+            tiers.cold_rows_read = self.cold_rows_read
+            tiers.promotions = self.promotions
+            tiers.evictions = self.evictions
+        return tiers
+
+    def _record(self, array: np.ndarray, segments: np.ndarray, hot_rows: int, cold_rows: int) -> None:
+        """Count an access to some segments, then promote the most popular cold segment if it is worth it."""
+        with self._lock:
+            self.hot_rows_read += hot_rows
+            self.cold_rows_read += cold_rows
+            if len(segments) == 0:
+                return
+            required = int(segments.max()) + 1
+            if required > len(self._frequency):
+                frequency = np.zeros(max(required, 2 * len(self._frequency)), dtype=np.float64)
+                frequency[:len(self._frequency)] = self._frequency
+                self._frequency = frequency
+            self._frequency[segments] += 1
+            self._accesses += len(segments)
+            if self._accesses >= FREQUENCY_HALF_LIFE:
+                self._frequency *= 0.5
+                self._accesses = 0
+
+            # Only segments whose rows are all written can be copied
+            full = len(array) // self.segment_rows
+            cold = np.array([segment for segment in segments.tolist() if segment < full and segment not in self._hot],
+                            dtype=np.int64)
+            if len(cold) == 0:
+                return
+            candidate = int(cold[np.argmax(self._frequency[cold])])
+            self._promote(array, candidate)
+
+    def _promote(self, array: np.ndarray, segment: int) -> None:
+        """Copy a segment into the hot tier, evicting less popular segments to make room. Caller holds the lock."""
+        start = segment * self.segment_rows
+        size = self.segment_rows * array.shape[1] * array.dtype.itemsize
+        if size > self.ram_budget:
+            return
+        frequency = self._frequency[segment]
+        victims = sorted(self._hot, key=lambda hot: self._frequency[hot])
+        freed = 0
+        evict = []
+        for victim in victims:
+            if self.hot_bytes - freed + size <= self.ram_budget:
+                break
+            if self._frequency[victim] >= frequency:
+                return
+            evict.append(victim)
+            freed += self._hot[victim].nbytes
+        if self.hot_bytes - freed + size > self.ram_budget:
+            return
+        for victim in evict:
+            del self._hot[victim]
+            self.evictions += 1
+        self.hot_bytes -= freed
+        self._hot[segment] = np.array(array[start:start + self.segment_rows])
+        self.hot_bytes += size
+        self.promotions += 1
+
+    def take(self, array: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """
+        Read some rows, from the hot tier where possible.
+
+        Args:
+            array: The (size, dim) memory-mapped rows
+            rows: The rows to read
+
+        Returns:
+            np.ndarray: A (len(rows), dim) array of the rows, in the given order
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        vectors = np.empty((len(rows), array.shape[1]), dtype=np.float32)
+        segments = rows // self.segment_rows
+        hot = self._hot
+        is_hot = np.zeros(len(rows), dtype=bool)
+        for segment in np.unique(segments).tolist():
+            block = hot.get(segment)
+            if block is None:
+                continue
+            positions = np.flatnonzero(segments == segment)
+            vectors[positions] = block[rows[positions] - segment * self.segment_rows]
+            is_hot[positions] = True
+        cold = np.flatnonzero(~is_hot)
+        if len(cold) > 0:
+            vectors[cold] = array[rows[cold]]
+        self._record(array, np.unique(segments), len(rows) - len(cold), len(cold))
+        return vectors
+
+    def scores(self, queries: np.ndarray, array: np.ndarray) -> np.ndarray:
+        """
+        Score normalized queries against every row, segment by segment.
+
+        Args:
+            queries: A (num_queries, dim) array of normalized queries
+            array: The (size, dim) memory-mapped rows
+
+        Returns:
+            np.ndarray: A (num_queries, size) float32 array of similarities
+        """
+        size = len(array)
+        scores = np.empty((len(queries), size), dtype=np.float32)
+        hot = self._hot
+        hot_rows = 0
+        num_segments = -(-size // self.segment_rows)
+        for segment in range(num_segments):
+            start = segment * self.segment_rows
+            end = min(start + self.segment_rows, size)
+            block = hot.get(segment)
+            if block is not None:
+                scores[:, start:end] = queries @ block[:end - start].T
+                hot_rows += end - start
+                continue
+            for block_start in range(start, end, STREAM_BLOCK_ROWS):
+                block_end = min(block_start + STREAM_BLOCK_ROWS, end)
+                scores[:, block_start:block_end] = queries @ np.asarray(array[block_start:block_end]).T
+        self._record(array, np.arange(num_segments, dtype=np.int64), hot_rows, size - hot_rows)
+        return scores
+
+    def stats(self) -> Dict[str, Any]:
+        """Report the size of the hot tier and the fraction of row reads it served."""
+        with self._lock:
+            reads = self.hot_rows_read + self.cold_rows_read
+            return {
+                'ram_budget': self.ram_budget,
+                'hot_bytes': self.hot_bytes,
+                'hot_segments': len(self._hot),
+                'segment_rows': self.segment_rows,
+                'hot_rows_read': self.hot_rows_read,
+                'cold_rows_read': self.cold_rows_read,
+                'hot_hit_rate': self.hot_rows_read / reads if reads else 0.0,
+                'promotions': self.promotions,
+                'evictions': self.evictions
+            }
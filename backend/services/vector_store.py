@@ -5,12 +5,16 @@ from typing import List, Dict, Any, Optional
 import re
 
 # Import constants
-from .knowledge_base import KNOWLEDGE_BASE_DIR
+from .knowledge_base import KNOWLEDGE_BASE_DIR, get_chunk_index
+from .embedding_matrix import EmbeddingMatrix, top_k_indices
 
 class VectorStore:
     def __init__(self):
         self.documents = []
-        self.embeddings = []
+        # Contiguous float32 matrix of L2-normalized embeddings, one row per document
+        self.embeddings = EmbeddingMatrix()
+        self._id_to_index = {}  # Document ID -> position in self.documents
+        self._chunk_indexes = []  # Position of each chunk in its source document
     
     def add_document(self, document: Dict[str, Any], embedding: List[float]) -> None:
         """
@@ -20,8 +24,11 @@ class VectorStore:
             document: The document to add
             embedding: The document embedding
         """
-        self.documents.append(document)
         self.embeddings.append(embedding)
+        self.documents.append(document)
+        self._chunk_indexes.append(get_chunk_index(document))
+        if 'id' in document:
+            self._id_to_index[document['id']] = len(self.documents) - 1
     
     def search(self, query_embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
         """
@@ -34,25 +41,16 @@ class VectorStore:
         Returns:
             List[Dict[str, Any]]: The search results
         """
-        if not self.embeddings or not self.documents:
+        if len(self.embeddings) == 0 or not self.documents:
             print("Warning: No documents or embeddings in vector store")
             return []
         
         try:
-            # Convert embeddings to numpy array for faster computation
-            embeddings_array = np.array(self.embeddings)
-            query_array = np.array(query_embedding)
-            
-            # Compute cosine similarity
-            dot_product = np.dot(embeddings_array, query_array)
-            norm_embeddings = np.linalg.norm(embeddings_array, axis=1)
-            norm_query = np.linalg.norm(query_array)
-            
-            # Avoid division by zero
-            similarities = dot_product / (norm_embeddings * norm_query + 1e-10)
+            # Rows are stored normalized, so cosine similarity is a single matrix-vector product
+            similarities = self.embeddings.scores(query_embedding)
             
             # Get top k indices
-            top_indices = np.argsort(similarities)[::-1][:top_k * 2]  # Get more candidates initially
+            top_indices = top_k_indices(similarities, top_k * 2)  # Get more candidates initially
             
             # Return top k documents with their similarity scores
             results = []
@@ -61,8 +59,9 @@ class VectorStore:
                     doc = self.documents[idx].copy()  # Make a copy to avoid modifying original
                     similarity = float(similarities[idx])
                     
-                    # Add similarity score to document
+                    # Add similarity score and position in the source document
                     doc['similarity'] = similarity
+                    doc['chunk_index'] = self._chunk_indexes[idx]
                     
                     # Print debug info
                     print(f"Search result: {doc.get('title', 'Unknown')} (id: {doc.get('id', 'Unknown')}, similarity: {similarity:.4f})")
@@ -104,13 +103,8 @@ class VectorStore:
                     # Reorder results to prioritize documents with more chunks
                     reordered_results = []
                     for title in sorted_titles:
-                        # Sort chunks by their position in the document if possible
-                        chunks = docs_by_title[title]
-                        try:
-                            chunks = sorted(chunks, key=lambda x: int(x.get('id', '0').split('-')[-1]) if x.get('id', '0').split('-')[-1].isdigit() else 0)
-                        except:
-                            pass  # If sorting fails, use the original order
-                        
+                        # Sort chunks by their position in the document
+                        chunks = sorted(docs_by_title[title], key=lambda x: x['chunk_index'])
                         reordered_results.extend(chunks)
                     
                     # Trim to original top_k size if needed
@@ -120,12 +114,8 @@ class VectorStore:
                     for title in docs_by_title:
                         chunks = docs_by_title[title]
                         if len(chunks) > 1:
-                            # Try to sort chunks by ID to get consecutive sections
-                            try:
-                                chunks = sorted(chunks, key=lambda x: int(x.get('id', '0').split('-')[-1]) if x.get('id', '0').split('-')[-1].isdigit() else 0)
-                                docs_by_title[title] = chunks
-                            except:
-                                pass  # If sorting fails, use the original order
+                            # Sort chunks by their position to get consecutive sections
+                            docs_by_title[title] = sorted(chunks, key=lambda x: x['chunk_index'])
                     
                     # Flatten the dictionary back to a list
                     results = []
@@ -154,9 +144,9 @@ class VectorStore:
         """
         try:
             # Check if the document exists in memory
-            for doc in self.documents:
-                if doc.get('id') == document_id:
-                    return doc
+            index = self._id_to_index.get(document_id)
+            if index is not None:
+                return self.documents[index]
             
             # If not found in memory, try to load from disk
             doc_parts = document_id.split('-')
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The knowledge base module creates an OpenAI client on import; tests never call it
+os.environ.setdefault('OPENAI_API_KEY', 'test')
@@ -0,0 +1,204 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from embedding_stub_server import start_stub_server
+from services import embedding_backends
+from services.embedding_backends import (EmbeddingRequestError, HashEmbeddingBackend, HTTPEmbeddingBackend,
+                                         OpenAIEmbeddingBackend, create_embedding_backend, get_word_buckets,
+                                         simple_embedding, simple_embeddings, HASH_BACKEND_ID,
+                                         SIMPLE_EMBEDDING_DIM)
+
+TEXTS = [f"Document {i} talks about protein, sleep and {i % 7} glasses of water" for i in range(50)]
+
+
+@pytest.fixture
+def stub():
+    server, url = start_stub_server()
+    yield server, url
+    server.shutdown()
+    server.server_close()
+
+
+def http_backend(url, **options):
+    options.setdefault('batch_window', 0.001)
+    options.setdefault('backoff_base', 0.001)
+    return HTTPEmbeddingBackend(url, **options)
+
+
+def test_simple_embeddings_match_simple_embedding():
+    texts = TEXTS[:5] + ['', 'the and of', 'Ünïcödé wörds, repeated repeated repeated!', 'x' * 5000]
+    batch = simple_embeddings(texts)
+    assert batch.shape == (len(texts), SIMPLE_EMBEDDING_DIM)
+    assert batch.dtype == np.float32
+    for text, row in zip(texts, batch):
+        np.testing.assert_array_equal(row, np.array(simple_embedding(text), dtype=np.float32))
+    assert not batch[texts.index('')].any()
+    assert not batch[texts.index('the and of')].any()
+    assert simple_embeddings([]).shape == (0, SIMPLE_EMBEDDING_DIM)
+
+
+def test_word_buckets_are_valid_dimensions():
+    buckets = get_word_buckets('protein')
+    assert len(buckets) > 0
+    assert all(bucket < SIMPLE_EMBEDDING_DIM for bucket in buckets)
+
+
+@pytest.mark.parametrize('spec', ['hash', HASH_BACKEND_ID, ' hash '])
+def test_create_hash_backend(spec):
+    backend = create_embedding_backend(spec)
+    assert isinstance(backend, HashEmbeddingBackend)
+    assert backend.id == HASH_BACKEND_ID
+    np.testing.assert_array_equal(backend.embed(TEXTS[:3]), simple_embeddings(TEXTS[:3]))
+
+
+def test_create_openai_backend():
+    backend = create_embedding_backend('openai', max_retries=2)
+    assert isinstance(backend, OpenAIEmbeddingBackend)
+    assert (backend.id, backend.dim, backend.max_retries) == ('openai:text-embedding-ada-002', 1536, 2)
+    backend = create_embedding_backend('openai:text-embedding-3-small', model='ignored')
+    assert (backend.id, backend.model, backend.dim) == ('openai:text-embedding-3-small', 'text-embedding-3-small', 1536)
+
+
+def test_create_http_backend():
+    backend = create_embedding_backend('http://127.0.0.1:8089/v1/embeddings', max_batch_size=8, model='stub')
+    assert isinstance(backend, HTTPEmbeddingBackend)
+    assert (backend.id, backend.max_batch_size, backend.model, backend.dim) == (
+        'http://127.0.0.1:8089/v1/embeddings', 8, 'stub', None)
+
+
+@pytest.mark.parametrize('spec', ['', 'bogus', 'ftp://host/embeddings', 'openai-ish'])
+def test_create_rejects_unknown_backends(spec):
+    with pytest.raises(ValueError):
+        create_embedding_backend(spec)
+
+
+def test_backend_chosen_from_environment(stub, monkeypatch):
+    from services import knowledge_base
+    _, url = stub
+    monkeypatch.setattr(knowledge_base, '_embedding_backends', {})
+    monkeypatch.setattr(knowledge_base, 'EMBEDDING_BACKEND', url)
+    monkeypatch.setenv('EMBEDDING_REQUEST_BATCH_SIZE', '16')
+    monkeypatch.setenv('EMBEDDING_MAX_CONCURRENCY', '2')
+    monkeypatch.setenv('EMBEDDING_MAX_RETRIES', '1')
+    monkeypatch.setenv('EMBEDDING_BATCH_WINDOW_MS', '1')
+    monkeypatch.setenv('EMBEDDING_HTTP_MODEL', 'stub-model')
+
+    backend = knowledge_base.get_embedding_backend()
+    assert isinstance(backend, HTTPEmbeddingBackend)
+    assert (backend.id, backend.max_batch_size, backend.max_concurrency, backend.max_retries, backend.model) == (
+        url, 16, 2, 1, 'stub-model')
+    assert backend.batch_window == pytest.approx(0.001)
+    # The same backend serves its specification and its ID
+    assert knowledge_base.get_embedding_backend(url) is backend
+    assert knowledge_base.get_embedding_backend('hash').id == HASH_BACKEND_ID
+
+
+def test_remote_backend_matches_hash_embeddings_in_order(stub):
+    server, url = stub
+    backend = http_backend(url, max_batch_size=7)
+    vectors = backend.embed(TEXTS)
+
+    np.testing.assert_array_equal(vectors, simple_embeddings(TEXTS))
+    assert backend.dim == SIMPLE_EMBEDDING_DIM
+    assert sum(server.batch_sizes) == len(TEXTS)
+    assert max(server.batch_sizes) == 7
+    stats = backend.stats()
+    assert (stats['batches'], stats['texts'], stats['retries'], stats['errors']) == (len(server.batch_sizes), 50, 0, 0)
+    assert stats['latency_ms']['max'] >= stats['latency_ms']['p50'] > 0
+
+
+def test_concurrent_calls_are_micro_batched(stub):
+    server, url = stub
+    server.latency = 0.05
+    backend = http_backend(url, max_concurrency=1, batch_window=0.02)
+    results = {}
+
+    def embed(i):
+        results[i] = backend.embed([TEXTS[i]])
+
+    threads = [threading.Thread(target=embed, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(server.batch_sizes) == 20
+    assert len(server.batch_sizes) < 10
+    for i in range(20):
+        np.testing.assert_array_equal(results[i], simple_embeddings([TEXTS[i]]))
+    assert backend.stats()['mean_batch_size'] > 2
+
+
+@pytest.mark.parametrize('status', [429, 500, 502, 503, 504])
+def test_retries_retryable_statuses(stub, status):
+    server, url = stub
+    server.failures.extend([status, status])
+    backend = http_backend(url, max_retries=2)
+
+    np.testing.assert_array_equal(backend.embed(TEXTS[:4]), simple_embeddings(TEXTS[:4]))
+    stats = backend.stats()
+    assert (stats['requests'], stats['retries'], stats['batches'], stats['errors']) == (3, 2, 1, 0)
+
+
+def test_gives_up_after_max_retries(stub):
+    server, url = stub
+    server.failures.extend([503] * 3)
+    backend = http_backend(url, max_retries=2)
+
+    with pytest.raises(EmbeddingRequestError) as error:
+        backend.embed(TEXTS[:2])
+    assert error.value.retryable
+    assert backend.stats()['errors'] == 1
+    # The next call is not affected by the failed one
+    np.testing.assert_array_equal(backend.embed(TEXTS[:2]), simple_embeddings(TEXTS[:2]))
+
+
+def test_does_not_retry_client_errors(stub):
+    server, url = stub
+    server.failures.append(400)
+    backend = http_backend(url, max_retries=3)
+
+    with pytest.raises(EmbeddingRequestError) as error:
+        backend.embed(TEXTS[:2])
+    assert not error.value.retryable
+    assert backend.stats()['requests'] == 1
+
+
+def test_backoff_is_exponential(stub, monkeypatch):
+    server, url = stub
+    server.failures.extend([500, 500, 500])
+    delays = []
+    monkeypatch.setattr(embedding_backends.random, 'uniform', lambda low, high: high)
+    monkeypatch.setattr(embedding_backends.time, 'sleep', delays.append)
+    backend = http_backend(url, max_retries=3, backoff_base=0.5)
+
+    backend.embed(TEXTS[:1])
+    assert delays == [0.5, 1.0, 2.0]
+
+
+def test_honors_retry_after(stub):
+    server, url = stub
+    server.failures.append(429)
+    server.retry_after = '0.2'
+    backend = http_backend(url, max_retries=1)
+
+    started = time.monotonic()
+    backend.embed(TEXTS[:1])
+    assert time.monotonic() - started >= 0.2
+
+
+def test_rejects_wrong_dimension(stub):
+    _, url = stub
+    backend = http_backend(url, dim=64, max_retries=0)
+    with pytest.raises(EmbeddingRequestError):
+        backend.embed(TEXTS[:1])
+
+
+def test_empty_input_makes_no_request(stub):
+    server, url = stub
+    backend = http_backend(url, dim=SIMPLE_EMBEDDING_DIM)
+    assert backend.embed([]).shape == (0, SIMPLE_EMBEDDING_DIM)
+    assert server.batch_sizes == []
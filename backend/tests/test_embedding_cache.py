@@ -0,0 +1,154 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from services import embedding_cache
+from services.embedding_cache import EmbeddingCache, QueryEmbeddingCache, normalize_text, text_key
+
+
+def vectors(count, dim=8, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+def count_entries(cache):
+    with sqlite3.connect(cache.path) as connection:
+        return connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return EmbeddingCache(str(tmp_path / 'cache.sqlite3'), max_entries=100)
+
+
+def test_text_key_normalizes_whitespace():
+    assert normalize_text('  a \n b\t c ') == 'a b c'
+    assert text_key('a  b') == text_key(' a b\n')
+    assert text_key('a b') != text_key('ab')
+
+
+def test_put_get_round_trip(cache):
+    texts = ['first text', 'second text', 'third text']
+    stored = vectors(3)
+    cache.put_many('backend-a', texts, stored)
+
+    found = cache.get_many('backend-a', ['second text', 'missing', 'first  text'])
+    assert found[1] is None
+    np.testing.assert_array_equal(found[0], stored[1])
+    np.testing.assert_array_equal(found[2], stored[0])
+    assert found[0].dtype == np.float32
+    assert cache.stats()['hits'] == 2
+    assert cache.stats()['misses'] == 1
+
+
+def test_backends_do_not_share_keys(cache):
+    cache.put_many('backend-a', ['same text'], vectors(1, seed=1))
+    cache.put_many('backend-b', ['same text'], vectors(1, seed=2))
+
+    a = cache.get_many('backend-a', ['same text'])[0]
+    b = cache.get_many('backend-b', ['same text'])[0]
+    np.testing.assert_array_equal(a, vectors(1, seed=1)[0])
+    np.testing.assert_array_equal(b, vectors(1, seed=2)[0])
+    assert cache.get_many('backend-c', ['same text']) == [None]
+
+
+def test_evicts_least_recently_used_down_to_target(cache):
+    texts = [f"text {i}" for i in range(cache.max_entries)]
+    for text, vector in zip(texts, vectors(len(texts))):
+        cache.put_many('backend', [text], vector[None, :])
+    assert count_entries(cache) == cache.max_entries
+    assert cache.stats()['evictions'] == 0
+
+    # A lookup makes the oldest entry the most recently used one
+    assert cache.get_many('backend', [texts[0]])[0] is not None
+    cache.put_many('backend', ['one more'], vectors(1))
+
+    target = int(cache.max_entries * embedding_cache.EVICTION_TARGET)
+    excess = cache.max_entries + 1 - target
+    assert count_entries(cache) == target
+    assert cache.stats()['evictions'] == excess
+    assert all(vector is None for vector in cache.get_many('backend', texts[1:1 + excess]))
+    assert all(vector is not None for vector in cache.get_many('backend', [texts[0], texts[1 + excess], 'one more']))
+
+
+def test_counts_entries_only_when_the_cache_may_be_full(cache, monkeypatch):
+    statements = []
+    monkeypatch.setattr(embedding_cache, 'SIZE_CHECK_INTERVAL', 1000)
+    cache.put_many('backend', ['first'], vectors(1))  # The first insert counts the entries
+    connection = cache._connection()
+    connection.set_trace_callback(statements.append)
+
+    for i in range(cache.max_entries - 1):
+        cache.put_many('backend', [f"text {i}"], vectors(1, seed=i))
+    assert not any('COUNT' in statement for statement in statements)
+    assert count_entries(cache) == cache.max_entries
+
+    cache.put_many('backend', ['one more'], vectors(1))
+    assert any('COUNT' in statement for statement in statements)
+    assert count_entries(cache) == int(cache.max_entries * embedding_cache.EVICTION_TARGET)
+
+
+def test_database_errors_are_misses(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=10)  # A directory cannot be opened as a database
+    assert cache.get_many('backend', ['text']) == [None]
+    cache.put_many('backend', ['text'], vectors(1))
+    assert cache.stats()['entries'] is None
+
+
+def test_rejects_invalid_size(tmp_path):
+    with pytest.raises(ValueError):
+        EmbeddingCache(str(tmp_path / 'cache.sqlite3'), max_entries=0)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(embedding_cache.time, 'monotonic', clock.monotonic)
+    return clock
+
+
+def test_query_cache_entries_expire_after_ttl(clock):
+    cache = QueryEmbeddingCache(max_entries=10, ttl=60)
+    cache.put('backend', 'what is  protein?', vectors(1)[0])
+
+    clock.now += 59
+    np.testing.assert_array_equal(cache.get('backend', 'what is protein?'), vectors(1)[0])
+    clock.now += 2
+    assert cache.get('backend', 'what is protein?') is None
+    stats = cache.stats()
+    assert (stats['entries'], stats['hits'], stats['misses'], stats['expirations']) == (0, 1, 1, 1)
+
+
+def test_query_cache_without_ttl_never_expires(clock):
+    cache = QueryEmbeddingCache(max_entries=10, ttl=0)
+    cache.put('backend', 'query', vectors(1)[0])
+    clock.now += 10 ** 9
+    assert cache.get('backend', 'query') is not None
+    assert cache.get('other-backend', 'query') is None
+
+
+def test_query_cache_evicts_least_recently_used(clock):
+    cache = QueryEmbeddingCache(max_entries=2)
+    for query in ('a', 'b'):
+        cache.put('backend', query, vectors(1)[0])
+    cache.get('backend', 'a')
+    cache.put('backend', 'c', vectors(1)[0])
+
+    assert cache.get('backend', 'b') is None
+    assert cache.get('backend', 'a') is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_query_cache_vectors_are_read_only():
+    cache = QueryEmbeddingCache(max_entries=2)
+    cache.put('backend', 'query', vectors(1)[0])
+    with pytest.raises(ValueError):
+        cache.get('backend', 'query')[0] = 1.0
@@ -0,0 +1,240 @@
+import numpy as np
+import pytest
+
+from services import index_storage, knowledge_base
+from services.embedding_backends import HashEmbeddingBackend, simple_embeddings
+from services.index_storage import append_documents, delete_documents, merge_segments, read_index, read_index_changes
+from services.knowledge_base import KnowledgeBaseCollection, SimpleVectorStore
+
+
+def text_chunks(doc_id, count):
+    return [f"{doc_id} chunk {i} about protein, sleep and hydration" for i in range(count)]
+
+
+def append(kb_dir, doc_id, count):
+    texts = text_chunks(doc_id, count)
+    entry = {'doc_id': doc_id, 'title': f"{doc_id}.txt", 'source': 'test', 'count': count}
+    return append_documents(str(kb_dir), [entry], [[i, text] for i, text in enumerate(texts)], simple_embeddings(texts))
+
+
+def publish(collection, doc_id, count):
+    texts = text_chunks(doc_id, count)
+    documents = [{'id': f"{doc_id}-{i}", 'doc_id': doc_id, 'title': f"{doc_id}.txt", 'source': 'test',
+                  'date_added': '2024-01-01T00:00:00', 'chunk_index': i, 'content': text}
+                 for i, text in enumerate(texts)]
+    collection.publish_document(documents, simple_embeddings(texts))
+
+
+def live_documents(collection):
+    return sorted({chunk['doc_id'] for chunk in collection.vector_store.iter_documents(max_chars=0)})
+
+
+@pytest.fixture
+def workers(tmp_path, monkeypatch):
+    """Two collections on the same directory, standing in for two worker processes."""
+    # Only merge when a test asks for it
+    monkeypatch.setattr(index_storage, 'MERGE_DELETED_FRACTION', 1.0)
+    return (KnowledgeBaseCollection('test', str(tmp_path), HashEmbeddingBackend()),
+            KnowledgeBaseCollection('test', str(tmp_path), HashEmbeddingBackend()))
+
+
+def test_changes_hold_only_new_documents(tmp_path):
+    append(tmp_path, 'a', 3)
+    append(tmp_path, 'b', 2)
+    index = read_index(str(tmp_path))
+
+    append(tmp_path, 'c', 2)
+    append(tmp_path, 'a', 4)
+    delete_documents(str(tmp_path), ['b'])
+    changes = read_index_changes(str(tmp_path), index.manifest)
+
+    latest = read_index(str(tmp_path))
+    assert changes.version == latest.version
+    assert [(doc['doc_id'], doc['start'], doc['count']) for doc in changes.documents] == [('c', 5, 2), ('a', 7, 4)]
+    assert changes.chunks == latest.chunks[5:11]
+    np.testing.assert_array_equal(changes.vectors, latest.vectors[5:11])
+    assert changes.deleted == ['b']
+
+    unchanged = read_index_changes(str(tmp_path), changes.manifest)
+    assert (unchanged.version, unchanged.documents, unchanged.deleted, len(unchanged.vectors)) == (
+        latest.version, [], [], 0)
+
+
+def test_changes_drop_documents_deleted_after_appending(tmp_path):
+    append(tmp_path, 'a', 2)
+    index = read_index(str(tmp_path))
+
+    append(tmp_path, 'b', 2)
+    delete_documents(str(tmp_path), ['b'])
+    changes = read_index_changes(str(tmp_path), index.manifest)
+    assert (changes.documents, changes.deleted) == ([], ['b'])
+
+    append(tmp_path, 'b', 1)
+    changes = read_index_changes(str(tmp_path), changes.manifest)
+    assert [doc['doc_id'] for doc in changes.documents] == ['b']
+    assert changes.deleted == []
+
+
+def test_changes_span_new_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr(index_storage, 'SEGMENT_MAX_ROWS', 4)
+    append(tmp_path, 'a', 3)
+    index = read_index(str(tmp_path))
+
+    append(tmp_path, 'b', 3)
+    append(tmp_path, 'c', 1)
+    changes = read_index_changes(str(tmp_path), index.manifest)
+    latest = read_index(str(tmp_path))
+    assert len(latest.manifest['segments']) == 2
+    assert [doc['doc_id'] for doc in changes.documents] == ['b', 'c']
+    np.testing.assert_array_equal(changes.vectors, latest.vectors[3:])
+
+
+def test_changes_need_a_full_read_after_a_merge(tmp_path):
+    append(tmp_path, 'a', 2)
+    index = read_index(str(tmp_path))
+    append(tmp_path, 'b', 2)
+    merge_segments(str(tmp_path))
+    assert read_index_changes(str(tmp_path), index.manifest) is None
+
+
+def test_delete_with_known_row_counts_does_not_read_the_index(tmp_path, monkeypatch):
+    append(tmp_path, 'a', 3)
+    monkeypatch.setattr(index_storage, 'read_index', None)
+    delete_documents(str(tmp_path), ['a', 'missing'], {'a': 3})
+    manifest = index_storage._read_manifest(str(tmp_path))
+    assert (list(manifest['deleted']), manifest['dead_rows']) == (['a'], 3)
+
+
+def test_worker_catches_up_without_reloading(workers, monkeypatch):
+    first, second = workers
+    publish(first, 'a', 3)
+    second.load_existing_documents()
+    assert live_documents(second) == ['a']
+
+    def reload(index):
+        raise AssertionError("the whole index was reloaded")
+
+    monkeypatch.setattr(second.vector_store, 'load_index', reload)
+    publish(first, 'b', 2)
+    publish(first, 'a', 1)
+    assert first.delete_document('b') == 2
+    second._reload_index()
+
+    assert second.index_version == first.index_version
+    assert live_documents(second) == ['a']
+    assert [chunk['id'] for chunk in second.vector_store.get_document_chunks('a')] == ['a-0']
+    assert len(second.vector_store) == len(first.vector_store) == 1
+
+
+def test_worker_reloads_after_a_merge(workers, monkeypatch):
+    first, second = workers
+    publish(first, 'a', 2)
+    publish(first, 'b', 2)
+    second.load_existing_documents()
+    loads = []
+    load_index = second.vector_store.load_index
+    monkeypatch.setattr(second.vector_store, 'load_index', lambda index: (loads.append(index.version), load_index(index)))
+
+    merge_segments(first.directory)
+    publish(first, 'c', 1)
+    second._reload_index()
+    assert len(loads) == 1
+    assert live_documents(second) == ['a', 'b', 'c']
+
+    publish(first, 'd', 1)
+    second._reload_index()
+    assert len(loads) == 1
+    assert live_documents(second) == ['a', 'b', 'c', 'd']
+
+
+def test_publish_applies_other_workers_documents_in_the_same_snapshot(workers, monkeypatch):
+    first, second = workers
+    publish(first, 'a', 2)
+    second.load_existing_documents()
+    publish(second, 'b', 2)
+
+    applied = []
+    apply_changes = first.vector_store.apply_changes
+    monkeypatch.setattr(first.vector_store, 'apply_changes', lambda documents, embeddings, deleted_doc_ids: (
+        applied.append([document['id'] for document in documents]), apply_changes(documents, embeddings, deleted_doc_ids)))
+    snapshot_version = first.vector_store.snapshot().version
+    publish(first, 'c', 3)
+
+    assert applied == [['b-0', 'b-1', 'c-0', 'c-1', 'c-2']]
+    assert first.vector_store.snapshot().version == snapshot_version + 1
+    assert first.index_version == second.index_version + 1
+    assert live_documents(first) == ['a', 'b', 'c']
+
+
+def test_document_deleted_before_its_publisher_catches_up_stays_deleted(workers, monkeypatch):
+    first, second = workers
+    publish(first, 'seed', 1)
+    second.load_existing_documents()
+    append_documents = knowledge_base.append_documents
+
+    def append_then_delete(*args, **kwargs):
+        appended = append_documents(*args, **kwargs)
+        # Another worker deletes the document before the publisher applies it
+        second.delete_document('x')
+        return appended
+
+    monkeypatch.setattr(knowledge_base, 'append_documents', append_then_delete)
+    publish(first, 'x', 2)
+
+    assert [doc['doc_id'] for doc in read_index(first.directory).documents] == ['seed']
+    assert live_documents(first) == live_documents(second) == ['seed']
+    assert first.index_version == second.index_version
+
+
+def test_unreadable_segment_index_is_not_rebuilt_from_json(tmp_path):
+    document_dir = tmp_path / 'legacy'
+    document_dir.mkdir()
+    (document_dir / 'metadata.json').write_text('{"title": "legacy.txt"}')
+    (document_dir / '0.json').write_text('{"content": "legacy chunk", "embedding": [1.0, 0.0]}')
+    assert len(index_storage.open_index(str(tmp_path))) == 1
+
+    append_documents(str(tmp_path), [{'doc_id': 'new', 'count': 1}], [[0, 'new chunk']], np.array([[0.0, 1.0]]))
+    (tmp_path / index_storage.INDEX_DIR_NAME / 'manifest.json').write_text('{')
+    with pytest.raises(RuntimeError):
+        index_storage.open_index(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        index_storage.migrate_directory_layout(str(tmp_path))
+
+
+def test_full_reload_keeps_the_trained_ivf_quantizer(tmp_path):
+    vectors = np.random.default_rng(0).normal(size=(600, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    documents = [{'doc_id': f"d{i}", 'count': 20} for i in range(30)]
+    chunks = [[i % 20, f"chunk {i}"] for i in range(600)]
+    append_documents(str(tmp_path), documents[:20], chunks[:400], vectors[:400])
+    store = SimpleVectorStore(index_type='ivf')
+    store.load_index(read_index(str(tmp_path)))
+    store.train_ivf()
+    trained = store._ivf
+
+    append_documents(str(tmp_path), documents[20:], chunks[400:], vectors[400:])
+    store.load_index(read_index(str(tmp_path)))
+
+    assert store._ivf is not trained and not store._ivf_training
+    assert store._ivf.centroids is trained.centroids
+    assert (store._ivf.size, store._ivf.trained_size) == (600, 400)
+    assert store.search_batch(vectors[500:501], top_k=1)[0][0]['id'] == 'd25-0'
+
+
+def test_mapped_segments_stay_shared_after_catching_up(workers, monkeypatch):
+    monkeypatch.setattr(index_storage, 'SEGMENT_MAX_ROWS', 4)
+    first, second = workers
+    publish(first, 'a', 3)
+    publish(first, 'b', 3)
+    assert [type(block) for block in read_index(first.directory).vectors.blocks] == [np.memmap, np.memmap]
+    second.load_existing_documents()
+    query = simple_embeddings(["a chunk 1 about protein, sleep and hydration"])
+    before = [hit['id'] for hit in second.vector_store.search_batch(query, top_k=3)[0]]
+
+    publish(second, 'c', 2)
+    vectors = second.vector_store.embeddings.array
+    assert [type(block) for block in vectors.blocks[:2]] == [np.memmap, np.memmap]
+    assert second.vector_store.embeddings.base_rows == 6
+    np.testing.assert_allclose(vectors[:], read_index(second.directory).vectors[:], atol=1e-6)
+    after = [hit['id'] for hit in second.vector_store.search_batch(query, top_k=5)[0]]
+    assert [hit for hit in after if not hit.startswith('c-')][:3] == before
@@ -0,0 +1,192 @@
+import numpy as np
+import pytest
+
+from services.knowledge_base import SimpleVectorStore
+
+DOCUMENTS = 24
+CHUNKS = 25
+DIM = 32
+
+
+def corpus_vectors(seed=0):
+    """Normalized rows scattered around one centre per document."""
+    rng = np.random.default_rng(seed)
+    centres = np.repeat(rng.normal(size=(DOCUMENTS, DIM)), CHUNKS, axis=0)
+    vectors = (centres + rng.normal(size=(DOCUMENTS * CHUNKS, DIM))).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def corpus_chunks():
+    return [{'id': f"d{doc}-{chunk}", 'doc_id': f"d{doc}", 'title': f"d{doc}.txt",
+             'source': 'test' if doc % 3 == 0 else 'other', 'date_added': '2024-01-01T00:00:00',
+             'chunk_index': chunk, 'content': f"d{doc} chunk {chunk} term{doc * CHUNKS + chunk}"}
+            for doc in range(DOCUMENTS) for chunk in range(CHUNKS)]
+
+
+def queries_near(vectors, rows, seed=1):
+    queries = vectors[rows] + 0.05 * np.random.default_rng(seed).normal(size=(len(rows), DIM)).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def expected_ids(vectors, queries, top_k, live=None):
+    """The IDs a flat search returns: the top_k live rows, cut to those above 0.3 similarity if any are."""
+    ids = [chunk['id'] for chunk in corpus_chunks()]
+    similarities = queries @ vectors.T
+    if live is not None:
+        similarities[:, ~live] = -np.inf
+    results = []
+    for row_similarities in similarities:
+        order = np.argsort(-row_similarities, kind='stable')[:top_k]
+        if (row_similarities[order] > 0.3).any():
+            order = order[row_similarities[order] > 0.3]
+        results.append([ids[row] for row in order.tolist()])
+    return results
+
+
+def result_ids(results):
+    return [[hit['id'] for hit in hits] for hits in results]
+
+
+def make_store(kind, tmp_path, **kwargs):
+    """A store of one index type holding the test corpus, and the search arguments that make it exact."""
+    options = {
+        'flat': {},
+        'ivf': {'index_type': 'ivf'},
+        'int8': {'quantization': 'int8', 'storage_dir': str(tmp_path)},
+        'float16': {'quantization': 'float16', 'storage_dir': str(tmp_path)},
+        'sketch': {'index_type': 'sketch', 'sketch_candidates': 300},
+        'partitioned': {'search_workers': 3},
+        'tiered': {'ram_budget': 1 << 16, 'storage_dir': str(tmp_path)},
+    }[kind]
+    store = SimpleVectorStore(**options, **kwargs)
+    if kind == 'partitioned':
+        store._partitioned.min_shard_rows = 64
+    store.add_batch(corpus_chunks(), corpus_vectors())
+    search = {}
+    if kind == 'ivf':
+        store.train_ivf()
+        search['nprobe'] = store._ivf.num_lists
+    return store, search
+
+
+@pytest.mark.parametrize('kind', ['ivf', 'int8', 'float16', 'sketch', 'partitioned', 'tiered'])
+def test_index_types_match_flat_search(kind, tmp_path):
+    store, search = make_store(kind, tmp_path)
+    if kind == 'partitioned':
+        assert len(store._partitioned.shard_bounds(len(store))) == 3
+    vectors = corpus_vectors()
+    queries = queries_near(vectors, [7, 130, 333, 512, 599])
+
+    assert result_ids(store.search_batch(queries, top_k=5, **search)) == expected_ids(vectors, queries, 5)
+
+
+@pytest.mark.parametrize('kind', ['flat', 'ivf', 'int8', 'sketch'])
+def test_deleted_rows_never_come_back(kind, tmp_path):
+    store, search = make_store(kind, tmp_path, compaction_threshold=1.0)
+    vectors = corpus_vectors()
+    deleted = [f"d{doc}" for doc in range(0, DOCUMENTS, 3)]
+    for doc_id in deleted:
+        assert store.delete_document(doc_id) == CHUNKS
+    assert store.delete(['d1-0', 'd1-0', 'missing']) == 1
+    live = np.array([chunk['doc_id'] not in deleted and chunk['id'] != 'd1-0' for chunk in corpus_chunks()])
+    # Queries close to deleted rows, so the deleted rows would rank first
+    queries = queries_near(vectors, [0, 25, 80, 310, 577])
+    expected = expected_ids(vectors, queries, 5, live)
+
+    assert result_ids(store.search_batch(queries, top_k=5, **search)) == expected
+    assert len(store) == live.sum() and store.snapshot().deleted_count == len(live) - live.sum()
+
+    store.compact()
+    if kind == 'ivf':
+        search['nprobe'] = store._ivf.num_lists
+    assert store.snapshot().deleted_count == 0 and store.snapshot().size == live.sum()
+    assert result_ids(store.search_batch(queries, top_k=5, **search)) == expected
+    assert store.get('d0-0') is None and store.get_document_chunks('d3') == []
+    assert [chunk['id'] for chunk in store.get_document_chunks('d1')] == [f"d1-{chunk}" for chunk in range(1, CHUNKS)]
+
+
+def test_snapshot_keeps_its_version_after_changes(tmp_path):
+    store, _ = make_store('flat', tmp_path)
+    vectors = corpus_vectors()
+    old = store.snapshot()
+    queries = vectors[[0, 30]]  # d0-0 and d1-5
+
+    replacement = [{'id': 'd1-0', 'doc_id': 'd1', 'title': 'd1.txt', 'source': 'test', 'chunk_index': 0,
+                    'content': 'd1 rewritten'}]
+    store.apply_changes(replacement, vectors[[30]], deleted_doc_ids=['d0'])
+    store.compact()
+
+    assert [hits[0]['id'] for hits in store.search_batch(queries, top_k=1, snapshot=old)] == ['d0-0', 'd1-5']
+    assert old.size == len(old) == DOCUMENTS * CHUNKS
+    current = store.search_batch(queries, top_k=3)
+    assert not {hit['doc_id'] for hits in current for hit in hits} & {'d0'}
+    assert 'd1-5' not in result_ids(current)[1]
+    assert [chunk['id'] for chunk in store.get_document_chunks('d1')] == ['d1-0']
+    assert store.search_batch(queries, top_k=1)[1][0]['content'] == 'd1 rewritten'
+    assert len(store) == (DOCUMENTS - 2) * CHUNKS + 1
+
+
+def test_lexical_and_hybrid_search(tmp_path):
+    store, _ = make_store('flat', tmp_path)
+    vectors = corpus_vectors()
+
+    lexical = store.search_batch(vectors[[0]], top_k=3, query_texts=['term42'], mode='lexical')[0]
+    assert lexical[0]['id'] == 'd1-17' and lexical[0]['bm25_score'] > 0
+
+    hybrid = store.search_batch(vectors[[0]], top_k=3, query_texts=['term42'], mode='hybrid')[0]
+    assert {'d0-0', 'd1-17'} <= {hit['id'] for hit in hybrid}
+    assert all('fusion_score' in hit for hit in hybrid)
+
+    store.delete_document('d1')
+    lexical = store.search_batch(vectors[[0]], top_k=3, query_texts=['term42'], mode='lexical')[0]
+    assert 'd1-17' not in [hit['id'] for hit in lexical]
+
+
+@pytest.mark.parametrize('search_filter', [{'doc_id': ['d3', 'd4']}, {'source': 'OTHER'}])
+def test_filtered_search_matches_flat_search_over_the_matching_rows(search_filter, tmp_path):
+    store, _ = make_store('flat', tmp_path)
+    vectors = corpus_vectors()
+    queries = queries_near(vectors, [0, 80, 110])
+    field, values = next(iter(search_filter.items()))
+    values = [values.lower()] if isinstance(values, str) else values
+    matching = np.array([chunk[field].lower() in values for chunk in corpus_chunks()])
+
+    results = store.search_batch(queries, top_k=5, filter=search_filter)
+    assert result_ids(results) == expected_ids(vectors, queries, 5, matching)
+
+    with pytest.raises(ValueError):
+        store.search_batch(queries, filter={'colour': 'red'})
+
+
+def test_expand_returns_windows_of_neighbouring_chunks(tmp_path):
+    store, _ = make_store('flat', tmp_path)
+    vectors = corpus_vectors()
+    store.delete(['d2-9'])
+
+    window = store.search_batch(vectors[[60]], top_k=1, expand=2)[0][0]
+    assert window['window'] == ['d2-7', 'd2-8', 'd2-10', 'd2-11', 'd2-12']
+    assert window['id'] == 'd2-10' and window['window_start'] == 7
+    assert window['content'].index('d2 chunk 7') < window['content'].index('d2 chunk 12')
+
+
+def test_mmr_skips_near_duplicates(tmp_path):
+    store, _ = make_store('flat', tmp_path)
+    vectors = corpus_vectors()
+    store.add({'id': 'copy-0', 'doc_id': 'copy', 'content': 'a copy of d5-3'}, vectors[128])
+
+    plain = result_ids(store.search_batch(vectors[[128]], top_k=2))[0]
+    assert sorted(plain) == ['copy-0', 'd5-3']
+    diverse = result_ids(store.search_batch(vectors[[128]], top_k=2, mmr_lambda=0.3))[0]
+    assert len(diverse) == 2 and len({'copy-0', 'd5-3'} & set(diverse)) == 1
+
+
+def test_hierarchical_search_scores_only_the_best_documents(tmp_path):
+    store, _ = make_store('flat', tmp_path)
+    vectors = corpus_vectors()
+    queries = queries_near(vectors, [154])  # d6-4
+
+    results = store.search_batch(queries, top_k=5, mode='hierarchical', top_documents=1)[0]
+    assert results[0]['id'] == 'd6-4'
+    assert {hit['doc_id'] for hit in results} == {'d6'}
+    assert all(hit['document_score'] == results[0]['document_score'] for hit in results)
+    assert store.rank_documents(queries[0], top_documents=1)[0]['doc_id'] == 'd6'
@@ -0,0 +1,33 @@
+import { NextRequest, NextResponse } from 'next/server';
+import axios from 'axios';
+
+export async function POST(request: NextRequest) {
+  try {
+    const body = await request.json();
+    const queries = body.queries;
+
+    if (!Array.isArray(queries) || queries.length === 0) {
+      return NextResponse.json({ error: 'A non-empty list of queries is required' }, { status: 400 });
+    }
+
+    console.log(`Searching documents with ${queries.length} queries`);
+
+    // Forward the body as-is, so every backend option (top_k, filter, mode, collection,
+    // expand, mmr_lambda) reaches the backend
+    const response = await axios.post(
+      `${process.env.NEXT_PUBLIC_API_URL}/api/documents/search/batch`,
+      body
+    );
+
+    return NextResponse.json(response.data);
+  } catch (error: any) {
+    console.error('Error searching documents in batch:', error);
+    return NextResponse.json(
+      {
+        results: [],
+        error: error.response?.data?.error || error.message || 'Failed to search documents'
+      },
+      { status: error.response?.status || 500 }
+    );
+  }
+}